@@ -0,0 +1,32 @@
+# server/admin_auth.py
+"""
+관리 API 인증 — X-Admin-Token 헤더가 ADMIN_TOKEN 과 같을 때만 (/admin/usage, /admin/routing)
+
+  - ADMIN_TOKEN 이 비어 있으면 관리 API 는 404 (있는지도 드러내지 않는다)
+  - 요청 프로파일러(/admin/profiles)는 자기 토큰 PROFILE_ADMIN_TOKEN 으로 같은 검사를 쓴다
+    (그 토큰을 설정하면 프로파일러 미들웨어까지 켜지므로 다른 관리 API 와 묶지 않는다)
+  .env: ADMIN_TOKEN=
+"""
+from __future__ import annotations
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def token_matches(given: bytes, expected: str) -> bool:
+    """bytes 끼리 비교 — str 이면 ASCII 가 아닌 헤더에서 TypeError"""
+    return bool(expected) and hmac.compare_digest(given, expected.encode())
+
+
+def require_admin(request: Request, token: Optional[str] = None) -> None:
+    """token 을 안 주면 ADMIN_TOKEN"""
+    expected = ADMIN_TOKEN if token is None else token
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token_matches(request.headers.get("x-admin-token", "").encode("latin-1"), expected):
+        raise HTTPException(status_code=403, detail="Admin token required")
@@ -0,0 +1,227 @@
+# server/admission.py
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from fastapi import Request
+
+# ---------------------------------------------------------
+# 비싼 라우트(/upload, /tts) 입장 제어
+#   1) 클라이언트(IP)별 토큰 버킷 — 초과 시 즉시 429 (다음 토큰까지 남은 시간 = Retry-After)
+#   2) 전역 동시 실행 슬롯 — 업스트림 쿼터에 맞춰 크기 설정
+#   3) 슬롯이 없으면 클라이언트별 라운드로빈 대기열 (전체/클라이언트별 깊이 제한)
+#      → 한 클라이언트가 대기열을 채워도 다른 클라이언트 요청이 번갈아 입장
+#   키는 client_key (IP) — X-User-Id 는 클라이언트가 마음대로 바꿀 수 있어 매번 새 버킷/대기열을 얻게 된다
+#   4) 대기열이 가득 차거나 max_wait 를 넘기면 429 + 추정 대기시간
+#      → 토큰은 입장이 확정될 때(바로 입장 또는 대기열 등록)만 쓰고, 대기 타임아웃이면 되돌린다
+# 단일 이벤트 루프(워커 프로세스) 안에서만 동작한다.
+# ---------------------------------------------------------
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def client_key(request: Request) -> str:
+    """입장 제어 키 — 연결의 IP (헤더로 바꿀 수 없다)"""
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def user_key(request: Request) -> str:
+    """
+    기록/사용량을 나누는 라벨 — X-User-Id 헤더, 없으면 IP.
+    인증이 아니다: 헤더는 클라이언트가 정하므로 같은 값을 보내면 누구나 같은 라벨이 된다
+    """
+    uid = request.headers.get("x-user-id")
+    if uid:
+        return f"u:{uid[:64]}"
+    return client_key(request)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, burst: float):
+        self.rate = rate_per_sec
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_take(self) -> float:
+        """토큰을 하나 쓰면 0, 부족하면 다음 토큰까지 남은 초"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """try_take 로 쓴 토큰을 되돌림 — 입장하지 못한 요청"""
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+    def idle_full(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        rate_per_min: float,
+        burst: int,
+        max_queue: int = 64,
+        max_queue_per_user: int = 2,
+        max_wait_sec: float = 30.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate_per_sec = rate_per_min / 60.0
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait_sec = max_wait_sec
+
+        self.in_flight = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()  # RR 순서
+        self._queued = 0
+        self._service_ewma = 2.0   # 슬롯 점유 시간 추정 (초)
+        self.rejected = 0
+
+    # ----- 상태 -----
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "rejected": self.rejected,
+            "service_ewma_sec": round(self._service_ewma, 3),
+        }
+
+    def _estimate_wait(self, position: int) -> float:
+        return max(1.0, (position + 1) / self.max_concurrency * self._service_ewma)
+
+    def _reject(self, reason: str, retry_after: float) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(f"{self.name}: {reason}", retry_after)
+
+    # ----- 토큰 버킷 -----
+    def _take_token(self, user: str) -> None:
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            if len(self._buckets) > 10_000:
+                # 꽉 찬(=한동안 안 쓴) 버킷 정리
+                for k in [k for k, b in self._buckets.items() if b.idle_full()]:
+                    del self._buckets[k]
+            bucket = self._buckets[user] = TokenBucket(self.rate_per_sec, self.burst)
+        wait = bucket.try_take()
+        if wait > 0:
+            raise self._reject("per-client rate limit", wait)
+
+    def charge(self, user: str) -> None:
+        """슬롯 없이 토큰만 — 입장은 나중에 slot(charge=False) 로 (한 작업에 토큰 1개)"""
+        self._take_token(user)
+
+    # ----- 슬롯 -----
+    async def acquire(self, user: str, charge: bool = True) -> None:
+        # 대기열 검사 → 토큰 순서 (대기열 때문에 거절된 요청이 토큰까지 쓰면 Retry-After 가 실제보다 짧아진다)
+        # await 전까지는 이벤트 루프를 넘기지 않으므로 검사와 입장 사이에 상태가 바뀌지 않는다
+        free = self.in_flight < self.max_concurrency and self._queued == 0
+        q = self._queues.get(user)
+        if not free:
+            if self._queued >= self.max_queue:
+                raise self._reject("queue full", self._estimate_wait(self._queued))
+            if q is not None and len(q) >= self.max_queue_per_user:
+                raise self._reject("too many queued requests for this client", self._estimate_wait(self._queued))
+        if charge:
+            self._take_token(user)
+        if free:
+            self.in_flight += 1
+            return
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        if q is None:
+            q = self._queues[user] = deque()
+        q.append(fut)
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait_sec)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # 타임아웃 직전에 슬롯을 넘겨받았으면 되돌려준다
+                self.release_slot()
+            else:
+                fut.cancel()
+                self._drop(user, fut)
+            if charge and user in self._buckets:
+                self._buckets[user].refund()   # 입장 못 했다 — 다시 올 때 토큰을 또 잃지 않게
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("queue wait timeout", self._estimate_wait(self._queued))
+
+    def _drop(self, user: str, fut: asyncio.Future) -> None:
+        q = self._queues.get(user)
+        if q is None:
+            return
+        try:
+            q.remove(fut)
+            self._queued -= 1
+        except ValueError:
+            pass
+        if not q:
+            del self._queues[user]
+
+    def release_slot(self) -> None:
+        # 대기자가 있으면 슬롯을 반납하지 않고 라운드로빈으로 다음 사용자에게 넘긴다
+        while self._queues:
+            user, q = next(iter(self._queues.items()))
+            fut = q.popleft()
+            self._queued -= 1
+            if q:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, user: str, charge: bool = True) -> AsyncIterator[None]:
+        await self.acquire(user, charge)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._observe(time.monotonic() - started)
+            self.release_slot()
+
+    def _observe(self, seconds: float) -> None:
+        self._service_ewma = 0.8 * self._service_ewma + 0.2 * seconds
+
+    def ticket(self) -> "SlotTicket":
+        return SlotTicket(self)
+
+
+class SlotTicket:
+    """스트리밍 응답처럼 핸들러 반환 뒤에 끝나는 작업용 — release() 는 여러 번 불러도 1회만 반납"""
+
+    def __init__(self, controller: AdmissionController):
+        self._controller: Optional[AdmissionController] = controller
+        self._started = time.monotonic()
+
+    def release(self) -> None:
+        c, self._controller = self._controller, None
+        if c is not None:
+            c._observe(time.monotonic() - self._started)
+            c.release_slot()
@@ -0,0 +1,486 @@
+# server/ai_backend.py
+from __future__ import annotations
+
+import functools
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+import wave
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import usage_meter
+from ai_resilience import CallPolicy, ResilientCaller, UpstreamBadResponse
+from analysis_schema import ANALYSIS_TEXT_FORMAT, validate_field
+from json_stream import IncrementalJSONParser
+
+# ---------------------------------------------------------
+# AI 백엔드 인터페이스 (전사 / 분석 / 음성합성)
+#   - OpenAIBackend: 실제 OpenAI 호출
+#   - StubBackend : 네트워크 없이 결정적(deterministic) 결과 + 지연/에러 주입 (부하테스트용)
+# 두 구현 모두 같은 ResilientCaller 정책을 거치므로 재시도/서킷 동작도 같이 재현된다.
+# 선택: AI_BACKEND=openai|stub (main.py)
+# ---------------------------------------------------------
+
+Validator = Callable[[str, Any], Any]
+
+
+def extract_output_text(resp) -> str:
+    """
+    OpenAI Responses API 응답에서 텍스트를 최대한 안전하게 뽑아냅니다.
+    SDK 버전에 따라 구조가 달라질 수 있어 여러 경로를 시도합니다.
+    """
+    # 1) 최신 SDK 속성
+    out = getattr(resp, "output_text", None)
+    if isinstance(out, str) and out.strip():
+        return out
+
+    # 2) 객체 속성 탐색 (output -> content -> output_text)
+    try:
+        output = getattr(resp, "output", None)
+        if output and isinstance(output, list):
+            for item in output:
+                content = item.get("content") if isinstance(item, dict) else getattr(item, "content", None)
+                if content and isinstance(content, list):
+                    for c in content:
+                        # 통상 {"type": "output_text", "text": "..."}
+                        if (isinstance(c, dict) and c.get("type") in ("output_text", "text") and c.get("text")):
+                            return c["text"]
+                        # 혹시 객체 속성 형태일 때
+                        if hasattr(c, "type") and getattr(c, "type") in ("output_text", "text"):
+                            t = getattr(c, "text", None)
+                            if t:
+                                return t
+    except Exception:
+        pass
+
+    # 3) 마지막 수단: 문자열화
+    return str(resp)
+
+
+class SpeechStream:
+    """이미 연결된 음성 스트림 — 본문은 iter_bytes() 로, 끝나면 close()"""
+
+    def __init__(self, chunks: Iterable[bytes], close: Optional[Callable[[], None]] = None):
+        self._chunks = chunks
+        self._close = close
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        try:
+            yield from self._chunks
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._close is not None:
+            close, self._close = self._close, None
+            close()
+
+
+class AIBackend:
+    """
+    공개 메서드(transcribe/analyze/speech)는 정책(데드라인/재시도/서킷)을 적용하고,
+    구현체는 _transcribe/_analyze_stream/_open_speech 만 채운다.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        *,
+        stt_deadline_sec: float = 60.0,
+        analyze_deadline_sec: float = 45.0,
+        tts_deadline_sec: float = 20.0,
+        stt_hedge_percentile: Optional[float] = 0.95,
+    ):
+        # 호출 종류별 정책 — 서킷 브레이커/재시도 예산은 종류별로 독립
+        self.stt_caller = ResilientCaller(CallPolicy(
+            name="stt",
+            deadline_sec=stt_deadline_sec,
+            attempt_timeout_sec=stt_deadline_sec / 2,
+            hedge_percentile=stt_hedge_percentile,
+        ))
+        self.analyze_caller = ResilientCaller(CallPolicy(
+            name="analyze",
+            deadline_sec=analyze_deadline_sec,
+            attempt_timeout_sec=analyze_deadline_sec / 2,
+        ))
+        self.tts_caller = ResilientCaller(CallPolicy(
+            name="tts",
+            deadline_sec=tts_deadline_sec,
+            attempt_timeout_sec=tts_deadline_sec / 2,
+        ))
+
+    # ----- 공개 API (블로킹 — 라우트에서는 run_in_threadpool 로 호출) -----
+    def transcribe(self, path: str, *, model: str) -> str:
+        text = self.stt_caller.call(lambda timeout: self._metered("stt", model, self._transcribe, path, model, timeout))
+        if not text:
+            raise RuntimeError("Empty transcription.")
+        return text
+
+    def analyze(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        *,
+        model: str,
+        text_format: Dict[str, Any] = ANALYSIS_TEXT_FORMAT,
+        validator: Optional[Validator] = validate_field,
+        max_output_tokens: Optional[int] = None,
+        schema_retries: int = 1,
+    ) -> dict:
+        """
+        structured output 을 스트리밍 파싱 — 필드가 완성되는 즉시 한 번만 검증
+        (잘못된 필드가 나오면 스트림 끝을 기다리지 않고 그 시도를 버린다)
+        스키마의 required 필드가 하나라도 없어도 실패 (출력 토큰 상한에 잘린 응답)
+        검증 실패는 업스트림 장애가 아니므로 정책 재시도와 별개로 schema_retries 번만 다시 요청,
+        그래도 안 되면 UpstreamBadResponse (→ 502)
+        """
+        required = text_format.get("format", {}).get("schema", {}).get("required", ())
+
+        def _run(timeout: float) -> dict:
+            validated: Dict[str, Any] = {}
+
+            def _field(name: str, value: Any) -> None:
+                validated[name] = validator(name, value) if validator is not None else value
+
+            parser = IncrementalJSONParser(on_field=_field)
+            try:
+                for delta in self._analyze_stream(
+                    system_prompt, user_prompt, model, text_format, timeout, max_output_tokens=max_output_tokens
+                ):
+                    parser.feed(delta)
+                parser.finish(required)
+            except ValueError as e:   # pydantic ValidationError 포함
+                raise UpstreamBadResponse(f"invalid structured output: {e}") from e
+            return validated
+
+        def _call() -> dict:
+            return self.analyze_caller.call(lambda timeout: self._metered("analyze", model, _run, timeout))
+
+        for _ in range(schema_retries):
+            try:
+                return _call()
+            except UpstreamBadResponse:
+                pass   # 같은 프롬프트로 한 번 더 — 샘플링이 달라 대개 통과한다
+        return _call()
+
+    def speech(self, text: str, *, voice: str, response_format: str, model: str) -> SpeechStream:
+        """연결(첫 응답)까지는 정책 안에서, 본문은 호출자가 iter_bytes() 로 흘려보낸다"""
+        def _open(timeout: float) -> SpeechStream:
+            usage_meter.note(chars=len(text))   # 음성합성은 사용량을 돌려주지 않는다 — 입력 글자 수로
+            return self._open_speech(text, voice, response_format, model, timeout)
+
+        return self.tts_caller.call(
+            lambda timeout: self._metered("tts", model, _open, timeout),
+            discard=lambda s: s.close(),
+        )
+
+    def _metered(self, kind: str, model: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """시도 1건 = 사용량 1건 (재시도/헤지도 각각 업스트림 비용이므로 따로 센다)"""
+        with usage_meter.metered(kind, model, self.name):
+            return fn(*args)
+
+    # ----- 구현체가 채울 부분 -----
+    def _transcribe(self, path: str, model: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def _analyze_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        model: str,
+        text_format: Dict[str, Any],
+        timeout: float,
+        max_output_tokens: Optional[int] = None,
+    ) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _open_speech(self, text: str, voice: str, response_format: str, model: str, timeout: float) -> SpeechStream:
+        raise NotImplementedError
+
+
+def audio_seconds(path: str) -> Optional[float]:
+    """녹음 길이 (디코딩 없이 컨테이너/패킷 정보로) — 모르면 None"""
+    try:
+        import av
+
+        with av.open(path) as c:
+            if c.duration:
+                return round(c.duration / 1_000_000, 1)
+            stream = c.streams.audio[0]
+            ticks = sum(p.duration or 0 for p in c.demux(stream))
+            return round(float(ticks * stream.time_base), 1) if ticks else None
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------
+# OpenAI
+# ---------------------------------------------------------
+class OpenAIBackend(AIBackend):
+    name = "openai"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is not set in environment (.env).")
+        self._api_key = api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+        # pre-fork(serve.py) 로 마스터가 만든 클라이언트가 있더라도 워커는 커넥션 풀을 공유하지 않는다
+        os.register_at_fork(after_in_child=self._reset_client)
+
+    def _reset_client(self) -> None:
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # 첫 호출 시 생성 (워커 프로세스마다 자기 커넥션 풀을 갖도록)
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    # 재시도는 ai_resilience 에서만 (SDK 재시도와 곱해지지 않도록 0)
+                    self._client = OpenAI(api_key=self._api_key, max_retries=0)
+        return self._client
+
+    def _transcribe(self, path: str, model: str, timeout: float) -> str:
+        # 헤징 시 파일을 시도마다 새로 연다
+        with open(path, "rb") as f:
+            tr = self.client.audio.transcriptions.create(
+                model=model,
+                file=f,
+                response_format="json",  # 'json' 또는 'text' 지원
+                # language="ko",
+                timeout=timeout,
+            )
+        usage = usage_meter.usage_field(tr, "usage")
+        usage_meter.note(
+            input_tokens=usage_meter.usage_field(usage, "input_tokens"),
+            output_tokens=usage_meter.usage_field(usage, "output_tokens"),
+            audio_sec=usage_meter.usage_field(usage, "seconds") or audio_seconds(path),
+        )
+        # SDK에 따라 dict로 올 수 있어 안전 추출
+        return getattr(tr, "text", None) or (tr.get("text") if isinstance(tr, dict) else "")
+
+    def _analyze_stream(
+        self, system_prompt, user_prompt, model, text_format, timeout, max_output_tokens=None
+    ) -> Iterator[str]:
+        extra = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        stream = self.client.responses.create(
+            model=model,
+            input=[
+                {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
+                {"role": "user",   "content": [{"type": "input_text", "text": user_prompt}]},
+            ],
+            text=text_format,
+            stream=True,
+            timeout=timeout,
+            **extra,
+        )
+        got_delta = False
+        with stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    got_delta = True
+                    yield event.delta
+                elif event.type == "response.completed":
+                    usage = usage_meter.usage_field(event.response, "usage")
+                    usage_meter.note(
+                        input_tokens=usage_meter.usage_field(usage, "input_tokens"),
+                        cached_tokens=usage_meter.usage_field(usage, "input_tokens_details", "cached_tokens"),
+                        output_tokens=usage_meter.usage_field(usage, "output_tokens"),
+                    )
+                    if not got_delta:
+                        # 델타를 못 받은 경우 완성 응답에서 한 번 더
+                        yield extract_output_text(event.response)
+                elif event.type in ("response.failed", "error"):
+                    raise RuntimeError(f"stream error: {getattr(event, 'message', None) or event.type}")
+
+    def _open_speech(self, text, voice, response_format, model, timeout) -> SpeechStream:
+        # with 블록 안에서 반환하면 스트리밍 전에 응답이 닫히므로 직접 열고 닫는다
+        cm = self.client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            input=text,
+            response_format=response_format,
+            timeout=timeout,
+        )
+        resp = cm.__enter__()
+        return SpeechStream(resp.iter_bytes(), close=lambda: cm.__exit__(None, None, None))
+
+
+# ---------------------------------------------------------
+# Stub (부하테스트/벤치마크용)
+#   AI_STUB_LATENCY_MS   : 중앙값 지연. "300" 또는 "stt=800,analyze=1500,tts=250"
+#   AI_STUB_LATENCY_SIGMA: 로그정규 분포 sigma (꼬리 지연 재현, 0이면 고정)
+#   AI_STUB_ERROR_RATE   : 호출당 일시 장애(503 상당) 비율 0~1
+#   AI_STUB_SEED         : 지연/에러 난수 시드
+# 결과물(전사문/분석/오디오)은 입력 내용만으로 결정된다.
+# ---------------------------------------------------------
+class StubUpstreamError(ConnectionError):
+    """주입된 일시 장애 — ai_resilience 에서 재시도 대상으로 분류된다"""
+
+    status_code = 503
+
+
+_STUB_SENTENCES = [
+    "I usually go to the park near my house on weekends.",
+    "Um, the first time I went there was about three years ago.",
+    "It was really crowded, so I had to wait for a long time.",
+    "These days I like to listen to music while I take a walk.",
+    "Compared to the past, there are a lot more cafes in my neighborhood.",
+    "Uh, I think the most memorable experience was when I lost my phone.",
+    "My friends and I often talk about movies we watched recently.",
+    "So, that's why I really enjoy spending time outdoors.",
+]
+
+_STUB_HINTS = {
+    "wpm": (80.0, 160.0),
+    "filler_rate": (0.0, 8.0),
+    "spk_len_sec": (20.0, 120.0),
+    "grammar_issues": (0, 8),
+}
+
+
+def _parse_latency(spec: str) -> Dict[str, float]:
+    spec = spec.strip()
+    if not spec:
+        return {}
+    if "=" not in spec:
+        return {"*": float(spec)}
+    out = {}
+    for part in spec.split(","):
+        k, _, v = part.partition("=")
+        out[k.strip()] = float(v)
+    return out
+
+
+def _fake_from_schema(schema: Dict[str, Any], rng: random.Random, name: str = "") -> Any:
+    """JSON Schema 를 따라 결정적 더미 값 생성"""
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    t = schema.get("type")
+    if t == "object":
+        return {k: _fake_from_schema(v, rng, k) for k, v in schema.get("properties", {}).items()}
+    if t == "array":
+        items = [_fake_from_schema(schema.get("items", {}), rng, name) for _ in range(schema.get("minItems", 3))]
+        for i, item in enumerate(items):
+            if isinstance(item, dict) and "index" in item:
+                item["index"] = i + 1   # 묶음 분석: 입력 번호 그대로
+        return items
+    if t == "integer":
+        lo, hi = _STUB_HINTS.get(name, (0, 10))
+        return rng.randint(int(lo), int(hi))
+    if t == "number":
+        lo, hi = _STUB_HINTS.get(name, (0.0, 1.0))
+        return round(rng.uniform(lo, hi), 2)
+    if t == "boolean":
+        return rng.random() < 0.5
+    if name == "vocab_range":
+        return rng.choice(["low", "mid", "high"])
+    return f"stub {name or 'text'} #{rng.randint(0, 9999)}"
+
+
+class StubBackend(AIBackend):
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: Optional[Dict[str, float]] = None,
+        latency_sigma: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms or {}
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)   # 지연/에러 전용 (결과물과 분리)
+        self._rng_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "StubBackend":
+        return cls(
+            latency_ms=_parse_latency(os.getenv("AI_STUB_LATENCY_MS", "")),
+            latency_sigma=float(os.getenv("AI_STUB_LATENCY_SIGMA", "0")),
+            error_rate=float(os.getenv("AI_STUB_ERROR_RATE", "0")),
+            seed=int(os.getenv("AI_STUB_SEED", "0")),
+            **kwargs,
+        )
+
+    def _inject(self, op: str, timeout: float) -> None:
+        median = self.latency_ms.get(op, self.latency_ms.get("*", 0.0)) / 1000.0
+        with self._rng_lock:
+            fail = self._rng.random() < self.error_rate
+            factor = self._rng.lognormvariate(0.0, self.latency_sigma) if self.latency_sigma > 0 else 1.0
+        delay = median * factor
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub {op}: simulated timeout")
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise StubUpstreamError(f"stub {op}: injected upstream error")
+
+    @staticmethod
+    def _content_rng(*parts: Any) -> random.Random:
+        h = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(h[:8], "big"))
+
+    def _transcribe(self, path: str, model: str, timeout: float) -> str:
+        self._inject("stt", timeout)
+        with open(path, "rb") as f:
+            data = f.read()
+        usage_meter.note(audio_sec=round(len(data) / 16_000, 1))
+        rng = self._content_rng("stt", model, hashlib.sha256(data).hexdigest())
+        # 대략 16KB ≒ 1초 분량으로 보고 길이에 비례해 문장 수 결정
+        n = max(1, min(len(_STUB_SENTENCES) * 2, len(data) // (16_000 * 5) + 1))
+        return " ".join(rng.choice(_STUB_SENTENCES) for _ in range(n))
+
+    def _analyze_stream(
+        self, system_prompt, user_prompt, model, text_format, timeout, max_output_tokens=None
+    ) -> Iterator[str]:
+        self._inject("analyze", timeout)
+        rng = self._content_rng("analyze", model, system_prompt, user_prompt)
+        schema = text_format.get("format", {}).get("schema", {})
+        body = json.dumps(_fake_from_schema(schema, rng), ensure_ascii=False)
+        # 토큰 수는 글자 수 / 4 로 흉내 (스키마도 프롬프트에 들어간다)
+        usage_meter.note(
+            input_tokens=(len(system_prompt) + len(user_prompt) + len(json.dumps(schema))) // 4,
+            output_tokens=len(body) // 4,
+        )
+        # 실제 스트리밍처럼 조각내어 흘려보낸다
+        for i in range(0, len(body), 24):
+            yield body[i:i + 24]
+
+    def _open_speech(self, text, voice, response_format, model, timeout) -> SpeechStream:
+        self._inject("tts", timeout)
+        data = _stub_wav(text, voice)
+        return SpeechStream(data[i:i + 4096] for i in range(0, len(data), 4096))
+
+
+@functools.lru_cache(maxsize=256)
+def _stub_wav(text: str, voice: str, sample_rate: int = 8000) -> bytes:
+    """텍스트 길이에 비례한 결정적 사인파 WAV (글자당 약 60ms)"""
+    seconds = min(30.0, 0.3 + 0.06 * len(text))
+    freq = 180.0 + (int(hashlib.md5(voice.encode("utf-8")).hexdigest(), 16) % 200)
+    n = int(seconds * sample_rate)
+    frames = struct.pack(
+        f"<{n}h", *(int(6000 * math.sin(2 * math.pi * freq * i / sample_rate)) for i in range(n))
+    )
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(frames)
+    return buf.getvalue()
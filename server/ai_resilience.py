@@ -0,0 +1,319 @@
+# server/ai_resilience.py
+from __future__ import annotations
+
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Optional, TypeVar
+
+import openai
+
+T = TypeVar("T")
+
+# ---------------------------------------------------------
+# OpenAI 호출 공통 레이어
+#   - 호출 전체 데드라인 + 시도별 타임아웃
+#   - 재시도 가능한 에러만 지수 백오프(+full jitter) 재시도
+#   - 재시도 예산(retry budget): 재시도 비율을 요청 수에 비례하게 제한 → 재시도 폭주 방지
+#   - (선택) 헤징: 지연이 관측 백분위수를 넘으면 두 번째 요청을 병렬로 보냄
+#   - 서킷 브레이커: 업스트림이 망가졌으면 바로 실패(fail fast)
+# SDK 자체 재시도는 끄고(max_retries=0) 여기서만 재시도한다. (이중 재시도 방지)
+# ---------------------------------------------------------
+
+
+class UpstreamUnavailable(Exception):
+    """서킷이 열려 있거나 재시도 예산이 바닥나 호출을 보내지 않은 경우, 또는 재시도해도 일시 장애가 계속된 경우"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(Exception):
+    """호출 전체 데드라인 초과"""
+
+
+class UpstreamBadResponse(Exception):
+    """업스트림이 응답은 했지만 스키마/검증을 통과하지 못함 (잘못된 필드, 깨지거나 잘린 JSON)"""
+
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_CLIENT_STATUS = {400, 413, 415, 422}     # 보낸 내용(오디오/텍스트) 자체의 문제
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """일시적 장애(타임아웃/연결/레이트리밋/5xx)만 재시도 대상"""
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in _RETRYABLE_STATUS
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def is_client_error(exc: BaseException) -> bool:
+    """업스트림이 입력을 거절 — 재시도해도 같고, 호출자에게 400 으로 돌려줄 에러"""
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in _CLIENT_STATUS
+
+
+def retry_after_hint(exc: BaseException, default: float) -> float:
+    """업스트림 Retry-After 헤더(초) — 없으면 default"""
+    response = getattr(exc, "response", None)
+    try:
+        return max(1.0, float(response.headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    name: str
+    deadline_sec: float                      # 재시도 포함 전체 예산
+    attempt_timeout_sec: float               # 시도 1회 타임아웃 (남은 예산과 min)
+    max_attempts: int = 3
+    backoff_base_sec: float = 0.25
+    backoff_max_sec: float = 4.0
+    hedge_percentile: Optional[float] = None  # 예: 0.95 → p95 초과 시 헤지 요청
+    hedge_min_samples: int = 20               # 표본이 이보다 적으면 헤징 안 함
+
+    def backoff(self, attempt: int) -> float:
+        """full jitter: uniform(0, min(max, base * 2^attempt))"""
+        cap = min(self.backoff_max_sec, self.backoff_base_sec * (2 ** attempt))
+        return random.uniform(0, cap)
+
+
+class LatencyTracker:
+    """최근 성공 호출 지연(초)의 링버퍼 — 헤징 임계값 계산용"""
+
+    def __init__(self, size: int = 256):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            data = sorted(self._samples)
+        if not data:
+            return None
+        idx = min(len(data) - 1, max(0, int(round(p * (len(data) - 1)))))
+        return data[idx]
+
+
+class RetryBudget:
+    """
+    요청마다 ratio 만큼 적립, 재시도/헤지마다 1 차감.
+    업스트림이 부분 장애여도 추가 트래픽은 최대 ratio(예: 20%)로 묶인다.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 5.0, max_tokens: float = 50.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    closed → (연속 실패 failure_threshold회) → open
+    open → (reset_timeout 경과) → half_open: 프로브 1건만 통과
+    half_open → 성공이면 closed, 실패면 다시 open
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_sec: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_sec:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == self.OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout_sec:
+                    raise UpstreamUnavailable(
+                        f"{self.name}: circuit open", retry_after=self.reset_timeout_sec - waited
+                    )
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise UpstreamUnavailable(f"{self.name}: circuit half-open (probing)", retry_after=1.0)
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+# 시도는 모두 이 풀에서 실행 → SDK가 타임아웃을 못 지켜도 호출자는 데드라인에 반환
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ai-call")
+
+
+def _reset_executor() -> None:
+    # fork 된 워커는 부모의 풀 스레드를 물려받지 못한다 (serve.py) → 자기 풀을 새로 (스레드는 첫 submit 때 생성)
+    global _executor
+    _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ai-call")
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+class ResilientCaller:
+    """
+    fn(timeout_sec) 를 정책대로 실행.
+    fn 은 재진입 가능해야 한다 (파일은 fn 안에서 매번 새로 열 것).
+    discard: 버려진 결과(헤지 패자, 데드라인 이후 도착)를 정리하는 콜백 (예: 스트림 close)
+    """
+
+    def __init__(
+        self,
+        policy: CallPolicy,
+        breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[RetryBudget] = None,
+        tracker: Optional[LatencyTracker] = None,
+    ):
+        self.policy = policy
+        self.breaker = breaker or CircuitBreaker(policy.name)
+        self.budget = budget or RetryBudget()
+        self.tracker = tracker or LatencyTracker()
+
+    def call(self, fn: Callable[[float], T], discard: Optional[Callable[[T], None]] = None) -> T:
+        p = self.policy
+        deadline = time.monotonic() + p.deadline_sec
+        # 호출 스레드(헤지 포함)에도 요청 컨텍스트(사용량 집계 범위 등)를 넘긴다 — 시도마다 복사본
+        ctx = contextvars.copy_context()
+        fn_in_ctx: Callable[[float], T] = lambda timeout: ctx.copy().run(fn, timeout)
+        self.budget.deposit()
+        last_exc: Optional[BaseException] = None
+
+        for attempt in range(p.max_attempts):
+            if attempt > 0:
+                if not self.budget.try_withdraw():
+                    raise UpstreamUnavailable(f"{p.name}: retry budget exhausted ({last_exc})", retry_after=1.0)
+                sleep = p.backoff(attempt - 1)
+                if time.monotonic() + sleep >= deadline:
+                    break
+                time.sleep(sleep)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.breaker.before_call()
+            try:
+                return self._attempt(fn_in_ctx, min(p.attempt_timeout_sec, remaining), deadline, discard)
+            except UpstreamUnavailable:
+                raise
+            except BaseException as e:  # noqa: BLE001 — 분류 후 재던짐
+                last_exc = e
+                if not is_retryable(e):
+                    # 요청 자체 문제(400 등)는 업스트림 상태와 무관
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+
+        if last_exc is not None and not isinstance(last_exc, (TimeoutError, UpstreamTimeout)):
+            # 재시도 가능한 장애가 끝까지 풀리지 않았다 → 원본 SDK 예외가 아니라 '잠시 후 다시' 로
+            raise UpstreamUnavailable(
+                f"{p.name}: {last_exc}", retry_after=retry_after_hint(last_exc, p.backoff_max_sec)
+            ) from last_exc
+        raise UpstreamTimeout(f"{p.name}: deadline {p.deadline_sec:.0f}s exceeded")
+
+    # 한 번의 시도 (+ 조건부 헤지). 실패 시 예외, 성공 시 결과.
+    def _attempt(self, fn, timeout: float, deadline: float, discard) -> T:
+        start = time.monotonic()
+        futures = [_executor.submit(fn, timeout)]
+
+        hedge_after = self._hedge_delay()
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done and self.budget.try_withdraw():
+                futures.append(_executor.submit(fn, max(0.1, deadline - time.monotonic())))
+
+        pending = set(futures)
+        first_exc: Optional[BaseException] = None
+        while pending:
+            left = min(start + timeout, deadline) - time.monotonic()
+            if len(futures) > 1:
+                # 헤지 요청은 자기 타임아웃을 가지므로 전체 데드라인까지 기다린다
+                left = deadline - time.monotonic()
+            done, pending = wait(pending, timeout=max(0.0, left), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                exc = fut.exception()
+                if exc is None:
+                    self.tracker.observe(time.monotonic() - start)
+                    self.breaker.record_success()
+                    self._abandon(pending, discard)
+                    return fut.result()
+                first_exc = first_exc or exc
+
+        self._abandon(pending, discard)
+        if first_exc is not None:
+            raise first_exc
+        raise TimeoutError(f"{self.policy.name}: attempt timed out after {timeout:.1f}s")
+
+    def _hedge_delay(self) -> Optional[float]:
+        p = self.policy
+        if p.hedge_percentile is None or len(self.tracker) < p.hedge_min_samples:
+            return None
+        return self.tracker.percentile(p.hedge_percentile)
+
+    @staticmethod
+    def _abandon(futures, discard) -> None:
+        if discard is None:
+            return
+
+        def _cleanup(fut: Future) -> None:
+            if not fut.cancelled() and fut.exception() is None:
+                try:
+                    discard(fut.result())
+                except Exception:
+                    pass
+
+        for fut in futures:
+            fut.add_done_callback(_cleanup)
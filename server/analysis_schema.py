@@ -0,0 +1,146 @@
+# server/analysis_schema.py
+from __future__ import annotations
+
+import copy
+from typing import Any, Callable, Dict, List, Literal, Type
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+# ---------------------------------------------------------
+# 분석 결과 스키마 (LLM 출력 전용)
+#   - AnalysisResult(main.py) 에서 전사문(text)만 뺀 부분을 모델이 채운다
+#   - 이 모델에서 strict JSON Schema 를 만들어 Responses API 의
+#     structured output(text.format=json_schema) 으로 강제한다
+# ---------------------------------------------------------
+OPIC_LEVELS = ("NL", "NM", "NH", "IL", "IM1", "IM2", "IM3", "IH", "AL")
+
+
+class AnalysisMetrics(BaseModel):
+    wpm: float = Field(description="words per minute")
+    filler_rate: float = Field(description="filler words (um, uh, like...) per 100 words")
+    grammar_issues: int = Field(description="number of grammar errors")
+    vocab_range: str = Field(description="low | mid | high")
+    spk_len_sec: float = Field(description="estimated speaking length in seconds")
+
+
+class AnalysisOutput(BaseModel):
+    summary: str
+    level_guess: Literal[OPIC_LEVELS]  # type: ignore[valid-type]
+    metrics: AnalysisMetrics
+    tips: List[str]
+
+
+def strict_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    pydantic 스키마 → OpenAI strict 모드 호환 스키마
+      - $ref/$defs 인라인
+      - 모든 object 에 additionalProperties=false, 모든 속성 required
+      - strict 에서 허용되지 않는 default/title 제거
+    """
+    raw = model.model_json_schema()
+    defs = raw.pop("$defs", {})
+
+    def walk(node: Any) -> Any:
+        if isinstance(node, list):
+            return [walk(n) for n in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            name = node["$ref"].rsplit("/", 1)[-1]
+            return walk(copy.deepcopy(defs[name]))
+        out = {k: walk(v) for k, v in node.items() if k not in ("default", "title")}
+        if out.get("type") == "object" and "properties" in out:
+            out["additionalProperties"] = False
+            out["required"] = list(out["properties"].keys())
+        return out
+
+    return walk(raw)
+
+
+ANALYSIS_SCHEMA = strict_json_schema(AnalysisOutput)
+
+# responses.create(text=...) 에 그대로 넘긴다
+ANALYSIS_TEXT_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "opic_analysis",
+        "schema": ANALYSIS_SCHEMA,
+        "strict": True,
+    }
+}
+
+# 필드 단위 검증기 — 스트리밍 중 필드가 완성되는 대로 검증
+def field_validator(model: Type[BaseModel]) -> Callable[[str, Any], Any]:
+    adapters = {name: TypeAdapter(f.annotation) for name, f in model.model_fields.items()}
+
+    def validate(name: str, value: Any) -> Any:
+        """알 수 없는 필드는 그대로, 아는 필드는 타입 검증 (실패 시 ValidationError)"""
+        adapter = adapters.get(name)
+        if adapter is None:
+            return value
+        out = adapter.validate_python(value)
+        if isinstance(out, list):
+            return [o.model_dump() if isinstance(o, BaseModel) else o for o in out]
+        return out.model_dump() if isinstance(out, BaseModel) else out
+
+    return validate
+
+
+validate_field = field_validator(AnalysisOutput)
+
+
+# ---------------------------------------------------------
+# 모범 답안 스키마 (model_answers.py 배치 작업)
+# ---------------------------------------------------------
+class KeyExpression(BaseModel):
+    expression: str = Field(description="useful English phrase used in the answer")
+    meaning: str = Field(description="short Korean explanation of the phrase")
+
+
+class ModelAnswerOutput(BaseModel):
+    answer: str = Field(description="spoken-style model answer at the target level")
+    key_expressions: List[KeyExpression]
+
+
+MODEL_ANSWER_TEXT_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "opic_model_answer",
+        "schema": strict_json_schema(ModelAnswerOutput),
+        "strict": True,
+    }
+}
+
+validate_model_answer_field = field_validator(ModelAnswerOutput)
+
+
+# ---------------------------------------------------------
+# 묶음 분석 스키마 (여러 답변을 한 번의 호출로 — packed_analysis.py)
+#   항목마다 입력의 번호(index)를 되돌려 받아 답변별 결과로 다시 나눈다
+# ---------------------------------------------------------
+class PackedAnalysisItem(AnalysisOutput):
+    index: int = Field(description="item number from the input (1-based)")
+
+
+class PackedAnalysisOutput(BaseModel):
+    results: List[PackedAnalysisItem]
+
+
+PACKED_ANALYSIS_SCHEMA = strict_json_schema(PackedAnalysisOutput)
+
+
+def packed_analysis_text_format(n: int) -> Dict[str, Any]:
+    """항목 수를 스키마에 박아 넣어 빠뜨리거나 더 만들지 않게 한다"""
+    schema = copy.deepcopy(PACKED_ANALYSIS_SCHEMA)
+    schema["properties"]["results"].update(minItems=n, maxItems=n)
+    return {
+        "format": {
+            "type": "json_schema",
+            "name": "opic_packed_analysis",
+            "schema": schema,
+            "strict": True,
+        }
+    }
+
+
+validate_packed_field = field_validator(PackedAnalysisOutput)
@@ -0,0 +1,295 @@
+# server/analyze_routing.py
+"""
+분석 단계 모델 라우팅 (답변 길이 / 문항 유형 / 업스트림 상태 → 모델 + 출력 예산)
+
+  - 규칙은 위에서부터 첫 번째로 맞는 것 하나. 조건(모두 선택):
+      question_types  문항 유형 (생성 API 의 type: introduce|description|routine|comparison|experience|11~15)
+      min_words / max_words   전사문 단어 수
+  - 규칙마다 model, max_output_tokens, 그리고 건강 기준(max_p90_sec, max_error_rate)과 fallback 모델.
+    최근 HEALTH_WINDOW_SEC 동안 그 모델의 p90 지연이나 오류율이 기준을 넘으면 fallback 으로 보낸다.
+    창이 지나 표본이 비면 다시 원래 모델로 (별도 탐침 없이 자연 회복)
+  - 기본 규칙: 어려운 문항(12~15, comparison)과 긴 답변은 지금처럼 ANALYZE_MODEL,
+               짧은 답변/자기소개는 ANALYZE_FAST_MODEL (느려지거나 실패하면 ANALYZE_MODEL)
+  - 묶음 분석은 항목별로 고른 규칙 중 가장 앞선(어려운) 규칙, 출력 예산은 항목 예산의 합
+    묶음 호출의 지연은 출력이 몇 배라 단건과 비교할 수 없다 → 건강 상태를 (모델, 묶음 여부)로 따로 본다
+    (full15 한 번이 단건 '짧은 답변' 규칙의 p90 을 밀어 올려 fallback 으로 보내지 않게)
+  - 결정 1건 = analyze_routes 1행 (규칙, 모델, fallback 사유, 유형, 단어 수, 지연, 성공) → 규칙 튜닝용
+      GET /admin/routing?days=7   규칙/모델별 건수, 오류, 지연 p50/p90 + 현재 모델 건강 상태 (ADMIN_TOKEN)
+  .env: ANALYZE_FAST_MODEL=gpt-4.1-nano  ROUTING_DB_PATH=data/routing.sqlite3  ROUTING_HEALTH_WINDOW_SEC=300
+        ANALYZE_ROUTES='[{"name": "short", "max_words": 60, "model": "gpt-4.1-nano", "max_output_tokens": 600,
+                          "fallback": "gpt-4.1-mini", "max_p90_sec": 6}, {"name": "default", "model": "gpt-4.1-mini"}]'
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+
+from admin_auth import require_admin
+from history_store import SQLiteStore
+
+ANALYZE_MODEL = os.getenv("ANALYZE_MODEL", "gpt-4.1-mini")
+ANALYZE_FAST_MODEL = os.getenv("ANALYZE_FAST_MODEL", "gpt-4.1-nano")
+HEALTH_WINDOW_SEC = float(os.getenv("ROUTING_HEALTH_WINDOW_SEC", "300"))
+HEALTH_MIN_SAMPLES = 5       # 이보다 적으면 판단하지 않음 (건강한 것으로)
+
+DEFAULT_ROUTES: List[Dict[str, Any]] = [
+    # 롤플레이 문제 해결/경험, 어드밴스, 비교 — 채점 품질 우선 (기존 모델 그대로)
+    {"name": "hard", "question_types": ["12", "13", "14", "15", "comparison"],
+     "model": ANALYZE_MODEL, "max_output_tokens": 1500},
+    {"name": "long", "min_words": 220, "model": ANALYZE_MODEL, "max_output_tokens": 1500},
+    # 자기소개와 짧은 답변 — 작은 모델로 충분, 출력도 짧게
+    {"name": "short", "question_types": ["introduce"], "model": ANALYZE_FAST_MODEL, "max_output_tokens": 700,
+     "fallback": ANALYZE_MODEL, "max_p90_sec": 8.0, "max_error_rate": 0.3},
+    {"name": "short", "max_words": 80, "model": ANALYZE_FAST_MODEL, "max_output_tokens": 700,
+     "fallback": ANALYZE_MODEL, "max_p90_sec": 8.0, "max_error_rate": 0.3},
+    {"name": "default", "model": ANALYZE_MODEL, "max_output_tokens": 1200},
+]
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    model: str
+    max_output_tokens: Optional[int] = None
+    question_types: Optional[frozenset] = None
+    min_words: Optional[int] = None
+    max_words: Optional[int] = None
+    fallback: Optional[str] = None
+    max_p90_sec: Optional[float] = None
+    max_error_rate: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Rule":
+        qt = d.get("question_types")
+        return cls(
+            name=d["name"], model=d["model"], max_output_tokens=d.get("max_output_tokens"),
+            question_types=frozenset(str(t) for t in qt) if qt else None,
+            min_words=d.get("min_words"), max_words=d.get("max_words"), fallback=d.get("fallback"),
+            max_p90_sec=d.get("max_p90_sec"), max_error_rate=d.get("max_error_rate"),
+        )
+
+    def matches_all(self) -> bool:
+        return self.question_types is None and self.min_words is None and self.max_words is None
+
+    def matches(self, words: int, question_type: Optional[str]) -> bool:
+        if self.question_types is not None and question_type not in self.question_types:
+            return False
+        if self.min_words is not None and words < self.min_words:
+            return False
+        if self.max_words is not None and words > self.max_words:
+            return False
+        return True
+
+
+@dataclass
+class Route:
+    """라우팅 결정 1건 — AnalyzeRouter.timed() 가 지연/성공과 함께 기록한다"""
+    rule: str
+    model: str
+    max_output_tokens: Optional[int]
+    words: int
+    question_type: Optional[str]
+    fallback_reason: Optional[str] = None     # 원래 모델이 건강하지 않아 fallback 으로 보낸 이유
+    items: int = 1
+    priority: int = field(default=0, repr=False)
+
+
+class ModelHealth:
+    """모델별 최근 (시각, 지연, 성공) — 창(window) 안의 것만 본다"""
+
+    def __init__(self, window_sec: float = HEALTH_WINDOW_SEC, size: int = 256):
+        self.window_sec = window_sec
+        self._events: Deque[Tuple[float, float, bool]] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._events.append((time.monotonic(), latency, ok))
+
+    def snapshot(self) -> Dict[str, Any]:
+        cutoff = time.monotonic() - self.window_sec
+        with self._lock:
+            recent = [e for e in self._events if e[0] >= cutoff]
+        lat = sorted(e[1] for e in recent if e[2])
+        errors = sum(1 for e in recent if not e[2])
+        return {
+            "samples": len(recent),
+            "error_rate": round(errors / len(recent), 3) if recent else 0.0,
+            "p50_sec": round(lat[len(lat) // 2], 3) if lat else None,
+            "p90_sec": round(lat[min(len(lat) - 1, int(0.9 * len(lat)))], 3) if lat else None,
+        }
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyze_routes (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at      INTEGER NOT NULL,          -- epoch ms
+    rule            TEXT    NOT NULL,
+    model           TEXT    NOT NULL,
+    fallback_reason TEXT,
+    question_type   TEXT,
+    words           INTEGER NOT NULL,
+    items           INTEGER NOT NULL DEFAULT 1,   -- 묶음 분석이면 항목 수
+    max_output_tokens INTEGER,
+    latency_ms      REAL    NOT NULL,
+    ok              INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_analyze_routes_created ON analyze_routes (created_at);
+"""
+
+
+class RouteLog(SQLiteStore):
+    SCHEMA = SCHEMA
+
+    def add(self, r: Route, latency: float, ok: bool) -> None:
+        self.conn().execute(
+            "INSERT INTO analyze_routes (created_at, rule, model, fallback_reason, question_type, words, items, "
+            "max_output_tokens, latency_ms, ok) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (int(time.time() * 1000), r.rule, r.model, r.fallback_reason, r.question_type, r.words, r.items,
+             r.max_output_tokens, round(latency * 1000, 1), int(ok)),
+        )
+
+    def summary(self, since_ms: int) -> List[Dict[str, Any]]:
+        """규칙/모델별 건수, 오류, 지연 분위수 (분위수는 파이썬에서 — 분석 호출 수 규모라 충분히 작다)"""
+        groups: Dict[Tuple[str, str], List[Any]] = {}
+        for row in self.conn().execute(
+            "SELECT rule, model, latency_ms, ok, fallback_reason FROM analyze_routes WHERE created_at >= ?",
+            (since_ms,),
+        ):
+            groups.setdefault((row["rule"], row["model"]), []).append(row)
+        out = []
+        for (rule, model), rows in sorted(groups.items()):
+            lat = sorted(r["latency_ms"] for r in rows if r["ok"])
+            out.append({
+                "rule": rule,
+                "model": model,
+                "calls": len(rows),
+                "errors": sum(1 for r in rows if not r["ok"]),
+                "fallbacks": sum(1 for r in rows if r["fallback_reason"]),
+                "p50_ms": lat[len(lat) // 2] if lat else None,
+                "p90_ms": lat[min(len(lat) - 1, int(0.9 * len(lat)))] if lat else None,
+            })
+        return out
+
+
+
+class AnalyzeRouter:
+    def __init__(self, rules: Sequence[Dict[str, Any]], log: Optional[RouteLog] = None):
+        self.rules = [Rule.from_dict(d) for d in rules]
+        if not self.rules or not self.rules[-1].matches_all():
+            # 어떤 답변도 규칙 밖으로 새지 않게 — 마지막은 무조건 맞는 규칙
+            self.rules.append(Rule(name="default", model=ANALYZE_MODEL))
+        self.log = log
+        self._health: Dict[Tuple[str, bool], ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def health(self, model: str, packed: bool = False) -> ModelHealth:
+        with self._lock:
+            h = self._health.get((model, packed))
+            if h is None:
+                h = self._health[(model, packed)] = ModelHealth()
+            return h
+
+    def _unhealthy(self, rule: Rule, packed: bool = False) -> Optional[str]:
+        if rule.fallback is None:
+            return None
+        s = self.health(rule.model, packed).snapshot()
+        if s["samples"] < HEALTH_MIN_SAMPLES:
+            return None
+        if rule.max_error_rate is not None and s["error_rate"] > rule.max_error_rate:
+            return f"error_rate {s['error_rate']}"
+        if rule.max_p90_sec is not None and s["p90_sec"] is not None and s["p90_sec"] > rule.max_p90_sec:
+            return f"p90 {s['p90_sec']}s"
+        return None
+
+    def _match(self, words: int, question_type: Optional[str]) -> Tuple[int, Rule]:
+        for i, rule in enumerate(self.rules):
+            if rule.matches(words, question_type):
+                return i, rule
+        return len(self.rules) - 1, self.rules[-1]
+
+    def choose(self, text: str, question_type: Optional[str] = None) -> Route:
+        words = len(text.split())
+        i, rule = self._match(words, question_type)
+        reason = self._unhealthy(rule)
+        return Route(
+            rule=rule.name, model=rule.fallback if reason else rule.model,
+            max_output_tokens=rule.max_output_tokens, words=words, question_type=question_type,
+            fallback_reason=reason, priority=i,
+        )
+
+    def choose_pack(self, items: Sequence[Tuple[str, Optional[str]]]) -> Route:
+        """(전사문, 문항 유형) 여러 개 → 가장 어려운 항목의 규칙, 출력 예산은 합계. 건강 상태는 묶음 호출 것"""
+        matched = [(len(text.split()), qt, *self._match(len(text.split()), qt)) for text, qt in items]
+        words, question_type, i, rule = min(matched, key=lambda m: m[2])
+        reason = self._unhealthy(rule, packed=len(matched) > 1)
+        budgets = [m[3].max_output_tokens for m in matched]
+        return Route(
+            rule=rule.name, model=rule.fallback if reason else rule.model,
+            max_output_tokens=sum(budgets) if all(b is not None for b in budgets) else None,
+            words=sum(m[0] for m in matched),
+            question_type=question_type, fallback_reason=reason,
+            items=len(matched), priority=i,
+        )
+
+    @contextmanager
+    def timed(self, route: Route) -> Iterator[None]:
+        """호출을 감싸 지연/성공을 모델 건강 상태와 결정 기록에 남긴다 (블로킹 — 호출 스레드에서)"""
+        t0 = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            latency = time.monotonic() - t0
+            self.health(route.model, route.items > 1).observe(latency, ok)
+            if self.log is not None:
+                try:
+                    self.log.add(route, latency, ok)
+                except Exception as e:
+                    print("ROUTE DECISION NOT SAVED:", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = list(self._health)
+        return {f"{m} (packed)" if packed else m: self.health(m, packed).snapshot() for m, packed in keys}
+
+
+def _load_rules() -> List[Dict[str, Any]]:
+    spec = os.getenv("ANALYZE_ROUTES", "")
+    return json.loads(spec) if spec else DEFAULT_ROUTES
+
+
+analyze_router = AnalyzeRouter(
+    _load_rules(), RouteLog(os.getenv("ROUTING_DB_PATH", "data/routing.sqlite3"))
+)
+
+
+# ---------------------------------------------------------
+# 관리 API
+# ---------------------------------------------------------
+router = APIRouter(tags=["admin"])
+
+
+@router.get("/admin/routing")
+async def routing_summary(request: Request, days: int = Query(7, ge=1, le=90)):
+    require_admin(request)
+    since = int((time.time() - days * 86400) * 1000)
+    rows = await run_in_threadpool(analyze_router.log.summary, since) if analyze_router.log else []
+    return {
+        "rules": [
+            {k: (sorted(v) if isinstance(v, frozenset) else v) for k, v in r.__dict__.items() if v is not None}
+            for r in analyze_router.rules
+        ],
+        "routes": rows,
+        "health": analyze_router.stats(),
+    }
@@ -0,0 +1,189 @@
+# server/audio_features.py
+from __future__ import annotations
+
+import shutil
+import subprocess
+import wave
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# ---------------------------------------------------------
+# 파형 기반 유창성 분석 (NumPy 벡터화)
+#   프레임 에너지 → 유성/무성 분할 → 휴지(pause) 통계, 조음 속도, 최장 침묵
+#   - 20ms 비중첩 프레임을 reshape 로 만든다 (복사 없음) → 3분 답변 ≈ 수 ms
+#   - 임계값은 녹음마다 적응형: 소음 바닥(하위 10%)과 발화 레벨(상위 5%) 사이
+#   - 짧은 무성 구간(<120ms)은 메우고, 짧은 유성 잡음(<60ms)은 지운다
+#   - 첫 발화 이전 / 마지막 발화 이후의 무음은 휴지로 세지 않는다
+# 디코딩: WAV 는 표준 라이브러리, 그 외(webm/ogg/m4a...)는 PyAV → ffmpeg 순으로 시도
+# ---------------------------------------------------------
+
+SAMPLE_RATE = 16000
+FRAME_SEC = 0.02
+MIN_PAUSE_SEC = 0.25
+LONG_PAUSE_SEC = 1.0
+FILL_GAP_SEC = 0.12
+MIN_VOICED_SEC = 0.06
+SILENCE_DBFS = -50.0
+PAUSE_BINS = (0.25, 0.5, 1.0, 2.0)   # 히스토그램 경계 (초) — 마지막 구간은 2초 이상
+
+
+class AudioDecodeError(RuntimeError):
+    pass
+
+
+# ---------------------------------------------------------
+# 디코딩
+# ---------------------------------------------------------
+def load_audio(path: str, sample_rate: int = SAMPLE_RATE) -> Tuple[np.ndarray, int]:
+    """mono float32 [-1, 1] 샘플과 샘플레이트. WAV 는 원래 레이트 그대로 반환."""
+    try:
+        with wave.open(path, "rb") as w:
+            width, channels, sr = w.getsampwidth(), w.getnchannels(), w.getframerate()
+            raw = w.readframes(w.getnframes())
+        if width == 2:
+            x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+            if channels > 1:
+                x = x.reshape(-1, channels).mean(axis=1)
+            return x, sr
+    except (wave.Error, EOFError):
+        pass
+
+    try:
+        import av  # PyAV (faster-whisper 의존성으로 함께 설치됨)
+    except ImportError:
+        av = None
+    if av is not None:
+        try:
+            return _decode_pyav(av, path, sample_rate), sample_rate
+        except Exception as e:  # 손상된 컨테이너 등
+            if not shutil.which("ffmpeg"):
+                raise AudioDecodeError(f"cannot decode {path}: {e}") from e
+
+    if shutil.which("ffmpeg"):
+        proc = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+             "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"],
+            capture_output=True,
+        )
+        if proc.returncode != 0:
+            raise AudioDecodeError(f"ffmpeg failed: {proc.stderr.decode(errors='replace')[:200]}")
+        return np.frombuffer(proc.stdout, dtype="<i2").astype(np.float32) / 32768.0, sample_rate
+
+    raise AudioDecodeError("no decoder available for non-WAV audio (install PyAV or ffmpeg)")
+
+
+def _decode_pyav(av, path: str, sample_rate: int) -> np.ndarray:
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    parts = []
+    with av.open(path) as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                parts.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            parts.append(out.to_ndarray().reshape(-1))
+    if not parts:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(parts).astype(np.float32) / 32768.0
+
+
+# ---------------------------------------------------------
+# 분석
+# ---------------------------------------------------------
+def frame_energy_db(samples: np.ndarray, sr: int, frame_sec: float = FRAME_SEC) -> np.ndarray:
+    """비중첩 프레임 RMS(dB). 꼬리의 불완전 프레임은 버린다."""
+    n = int(sr * frame_sec)
+    usable = (len(samples) // n) * n
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:usable].reshape(-1, n)
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / n)
+    return 20.0 * np.log10(rms + 1e-8)
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """True 구간들의 (시작, 끝) 프레임 인덱스 (끝은 exclusive)"""
+    d = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def _rle(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """run-length 인코딩 → (시작 인덱스, 길이, 값)"""
+    starts = np.concatenate(([0], np.flatnonzero(mask[1:] != mask[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [mask.size])))
+    return starts, lengths, mask[starts]
+
+
+def voiced_mask(db: np.ndarray, frame_sec: float = FRAME_SEC) -> np.ndarray:
+    if db.size == 0:
+        return np.zeros(0, dtype=bool)
+    floor, peak = np.percentile(db, [10, 95])
+    if peak - floor < 6.0:
+        # 동적 범위가 거의 없음 → 전부 발화(연속음)거나 전부 무음
+        return np.full(db.size, peak > SILENCE_DBFS)
+    thr = max(floor + 6.0, floor + 0.35 * (peak - floor))
+    mask = db > thr
+
+    # 짧은 무성 구간 메우기 (단어 사이 미세한 틈) — 양 끝 구간은 제외
+    _, lengths, values = _rle(mask)
+    inner = np.ones(values.size, dtype=bool)
+    inner[[0, -1]] = False
+    values = values | (~values & inner & (lengths < int(round(FILL_GAP_SEC / frame_sec))))
+    mask = np.repeat(values, lengths)
+
+    # 짧은 유성 잡음 지우기 (클릭, 숨소리)
+    _, lengths, values = _rle(mask)
+    values = values & (lengths >= int(round(MIN_VOICED_SEC / frame_sec)))
+    return np.repeat(values, lengths)
+
+
+@dataclass
+class FluencyProfile:
+    audio_sec: float
+    voiced_sec: float
+    speaking_span_sec: float        # 첫 발화 ~ 마지막 발화
+    pause_durations: np.ndarray     # 발화 사이 휴지들 (초)
+
+    def metrics(self, word_count: Optional[int] = None) -> Dict[str, object]:
+        p = self.pause_durations
+        hist_edges = np.array(PAUSE_BINS + (np.inf,))
+        counts = np.histogram(p, bins=hist_edges)[0] if p.size else np.zeros(len(PAUSE_BINS), dtype=int)
+        labels = [f"{a:g}-{b:g}s" for a, b in zip(PAUSE_BINS[:-1], PAUSE_BINS[1:])] + [f"{PAUSE_BINS[-1]:g}s+"]
+        out: Dict[str, object] = {
+            "audio_sec": round(self.audio_sec, 2),
+            "voiced_sec": round(self.voiced_sec, 2),
+            "pause_count": int(p.size),
+            "long_pause_count": int((p >= LONG_PAUSE_SEC).sum()),
+            "pause_ratio": round(float(p.sum()) / self.speaking_span_sec, 3) if self.speaking_span_sec else 0.0,
+            "mean_pause_sec": round(float(p.mean()), 2) if p.size else 0.0,
+            "longest_silence_sec": round(float(p.max()), 2) if p.size else 0.0,
+            "pause_hist": {k: int(v) for k, v in zip(labels, counts)},
+        }
+        if word_count is not None:
+            # 조음 속도: 실제 발화 시간 기준 / 말하기 속도: 휴지 포함 구간 기준 (words per minute)
+            out["articulation_rate_wpm"] = round(word_count / self.voiced_sec * 60, 1) if self.voiced_sec else 0.0
+            out["speech_rate_wpm"] = (
+                round(word_count / self.speaking_span_sec * 60, 1) if self.speaking_span_sec else 0.0
+            )
+        return out
+
+
+def analyze_fluency(samples: np.ndarray, sr: int) -> FluencyProfile:
+    db = frame_energy_db(samples, sr)
+    mask = voiced_mask(db)
+    s, e = _runs(mask)
+    if s.size == 0:
+        return FluencyProfile(len(samples) / sr, 0.0, 0.0, np.zeros(0))
+    gaps = (s[1:] - e[:-1]) * FRAME_SEC
+    return FluencyProfile(
+        audio_sec=len(samples) / sr,
+        voiced_sec=float(mask.sum()) * FRAME_SEC,
+        speaking_span_sec=float(e[-1] - s[0]) * FRAME_SEC,
+        pause_durations=gaps[gaps >= MIN_PAUSE_SEC],
+    )
+
+
+def analyze_file(path: str) -> FluencyProfile:
+    samples, sr = load_audio(path)
+    return analyze_fluency(samples, sr)
@@ -0,0 +1,312 @@
+# server/benchmarks/bench_endpoints.py
+"""
+엔드투엔드 엔드포인트 벤치마크 (AI 백엔드는 stub 으로 고정)
+
+    cd server
+    python benchmarks/bench_endpoints.py -c 16 -n 400 --out bench/now.json
+    python benchmarks/bench_endpoints.py -c 16 -n 400 --compare bench/base.json --threshold 0.10
+
+  - 기본: uvicorn 워커를 서브프로세스로 띄워 측정 (워커 RSS 는 /proc/<pid>/status)
+  - --inprocess: httpx ASGITransport 로 앱을 같은 프로세스에서 구동 (RSS = 자기 자신)
+  - --url/--pid: 이미 떠 있는 서버를 측정
+결과는 JSON 으로 저장하고, --compare 로 이전 결과와 비교해 p95 / 처리량 회귀를 표시한다.
+회귀가 있으면 종료코드 1.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import time
+import wave
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("survey", "unexpected", "roleplay", "advanced", "full15")
+TOPIC_MODES = ("survey", "unexpected", "roleplay")
+
+
+# ---------------------------------------------------------
+# 요청 페이로드
+# ---------------------------------------------------------
+def make_wav(seconds: float = 3.0, sample_rate: int = 16000) -> bytes:
+    n = int(seconds * sample_rate)
+    frames = struct.pack(f"<{n}h", *(int(4000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(n)))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def build_scenarios(audio: bytes, users: int) -> Dict[str, Request]:
+    # 입장 제어(사용자별 토큰 버킷)에 막히지 않도록 요청을 가상 사용자들에게 분산
+    def uh(i: int) -> Dict[str, str]:
+        return {"X-User-Id": f"bench-{i % users}"}
+
+    scenarios: Dict[str, Request] = {}
+    for m in MODES:
+        scenarios[f"generate:{m}"] = lambda c, i, m=m: c.post("/problems/generate", json={"mode": m})
+        scenarios[f"preview:{m}"] = lambda c, i, m=m: c.get("/problems/preview", params={"mode": m})
+    for m in TOPIC_MODES:
+        scenarios[f"topics:{m}"] = lambda c, i, m=m: c.get("/problems/topics", params={"mode": m})
+    scenarios["upload"] = lambda c, i: c.post(
+        "/upload",
+        files={"audio": ("bench.wav", audio, "audio/wav")},
+        data={"prompt": "Tell me about your favorite park.", "target_len_sec": "60"},
+        headers=uh(i),
+    )
+    # 동일 문장 반복(캐시/코얼레싱 효과)과 서로 다른 문장을 섞는다
+    scenarios["tts"] = lambda c, i: c.get(
+        "/tts", params={"text": f"Question number {i % 20}. Tell me about it."}, headers=uh(i)
+    )
+    return scenarios
+
+
+# ---------------------------------------------------------
+# 측정
+# ---------------------------------------------------------
+def read_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return float("nan")
+    k = (len(sorted_vals) - 1) * p
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return sorted_vals[int(k)]
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, req: Request, n: int, concurrency: int, pid: Optional[int]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    rss_peak = 0
+    counter = iter(range(n))
+
+    async def worker() -> None:
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                resp = await req(client, i)
+                await resp.aread()
+                key = str(resp.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append(time.perf_counter() - t0)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    async def sampler() -> None:
+        nonlocal rss_peak
+        while True:
+            rss = read_rss_kb(pid) if pid else None
+            if rss:
+                rss_peak = max(rss_peak, rss)
+            await asyncio.sleep(0.05)
+
+    samp = asyncio.create_task(sampler())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    samp.cancel()
+
+    lat = sorted(latencies)
+    ok = sum(v for k, v in statuses.items() if k.startswith("2"))
+    return {
+        "requests": n,
+        "ok": ok,
+        "statuses": statuses,
+        "elapsed_sec": round(elapsed, 4),
+        "throughput_rps": round(n / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(lat, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(lat, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(lat, 0.99) * 1000, 3),
+        "max_ms": round(lat[-1] * 1000, 3) if lat else None,
+        "rss_end_kb": read_rss_kb(pid) if pid else None,
+        "rss_peak_kb": rss_peak or None,
+    }
+
+
+# ---------------------------------------------------------
+# 서버 구동
+# ---------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(env_extra: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ, AI_BACKEND="stub", **env_extra)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=SERVER_DIR,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if httpx.get(f"{url}/health", timeout=0.5).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("server did not become healthy in 30s")
+
+
+def make_inprocess_client(env_extra: Dict[str, str]) -> httpx.AsyncClient:
+    os.environ.update({"AI_BACKEND": "stub", **env_extra})
+    sys.path.insert(0, SERVER_DIR)
+    os.chdir(SERVER_DIR)
+    from main import app  # noqa: E402 — env 설정 후 import
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+# ---------------------------------------------------------
+# 비교
+# ---------------------------------------------------------
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """p95 가 threshold 이상 늘거나 처리량이 threshold 이상 줄면 회귀"""
+    regressions = []
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if base.get("p95_ms") and cur["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.2f} → {cur['p95_ms']:.2f} ms")
+        if base.get("throughput_rps") and cur["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['throughput_rps']:.1f} → {cur['throughput_rps']:.1f}")
+    return regressions
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    env_extra = {"AI_STUB_LATENCY_MS": args.stub_latency_ms, "AI_STUB_ERROR_RATE": str(args.stub_error_rate)}
+    proc = None
+    pid = args.pid
+    if args.inprocess:
+        client = make_inprocess_client(env_extra)
+        pid = os.getpid()
+    else:
+        url = args.url
+        if url is None:
+            proc, url = spawn_server(env_extra)
+            pid = proc.pid
+        client = httpx.AsyncClient(base_url=url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency * 2))
+
+    scenarios = build_scenarios(make_wav(args.audio_sec), args.users)
+    selected = [s for s in scenarios if not args.only or any(s.startswith(o) for o in args.only)]
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "requests": args.requests,
+            "mode": "inprocess" if args.inprocess else ("external" if args.url else "subprocess"),
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_error_rate": args.stub_error_rate,
+            "rss_start_kb": read_rss_kb(pid) if pid else None,
+        },
+        "scenarios": {},
+    }
+    try:
+        async with client:
+            for name in selected:
+                # 워밍업 (import/캐시 효과 제외)
+                for i in range(min(args.warmup, args.requests)):
+                    await (await scenarios[name](client, i)).aread()
+                r = await run_scenario(client, scenarios[name], args.requests, args.concurrency, pid)
+                results["scenarios"][name] = r
+                print(f"{name:22s} rps={r['throughput_rps']:>9} p50={r['p50_ms']:>9}ms "
+                      f"p95={r['p95_ms']:>9}ms p99={r['p99_ms']:>9}ms ok={r['ok']}/{r['requests']} "
+                      f"rss={r['rss_end_kb']}kB")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"saved → {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        if regressions:
+            return 1
+        print(f"no regressions (threshold {args.threshold:.0%})")
+    return 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="OPIc server endpoint benchmark (stub AI backend)")
+    ap.add_argument("-c", "--concurrency", type=int, default=8)
+    ap.add_argument("-n", "--requests", type=int, default=200, help="시나리오당 요청 수")
+    ap.add_argument("-u", "--users", type=int, default=1000, help="가상 사용자 수 (X-User-Id)")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--only", nargs="*", help="시나리오 접두어 필터 (예: generate upload)")
+    ap.add_argument("--url", help="이미 떠 있는 서버 (AI_BACKEND=stub 권장)")
+    ap.add_argument("--pid", type=int, help="--url 서버의 워커 PID (RSS 측정용)")
+    ap.add_argument("--inprocess", action="store_true")
+    ap.add_argument("--audio-sec", type=float, default=3.0)
+    ap.add_argument("--stub-latency-ms", default="stt=0,analyze=0,tts=0")
+    ap.add_argument("--stub-error-rate", type=float, default=0.0)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--out", help="결과 JSON 경로")
+    ap.add_argument("--compare", help="비교할 이전 결과 JSON")
+    ap.add_argument("--threshold", type=float, default=0.10)
+    sys.exit(asyncio.run(main_async(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
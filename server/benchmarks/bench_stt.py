@@ -0,0 +1,122 @@
+# server/benchmarks/bench_stt.py
+"""
+전사 경로 비교 벤치마크 — real-time factor (처리시간 / 오디오 길이)
+
+    cd server
+    python benchmarks/bench_stt.py rec1.webm rec2.wav -c 4 --out bench/stt.json
+    AI_BACKEND=stub python benchmarks/bench_stt.py rec1.webm --engines local
+
+  - remote: main.create_backend(AI_BACKEND) 의 transcribe (OpenAI 또는 stub)
+  - local : local_stt.LocalWhisperEngine (LOCAL_STT_* 환경변수)
+각 엔진마다 파일별 순차 실행(지연) + 동시 -c 개 실행(배칭/처리량)을 잰다.
+모델 로드 시간은 warmup 으로 분리해 기록한다.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+
+def audio_seconds(path: str) -> float:
+    try:
+        from faster_whisper.audio import decode_audio
+
+        return len(decode_audio(path, sampling_rate=16000)) / 16000
+    except ImportError:
+        import wave
+
+        with wave.open(path, "rb") as w:
+            return w.getnframes() / w.getframerate()
+
+
+def run_engine(name: str, fn: Callable[[str], str], files: List[str], durations: Dict[str, float],
+               concurrency: int, repeat: int) -> dict:
+    per_file = []
+    for path in files:
+        times = []
+        text = ""
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            text = fn(path)
+            times.append(time.perf_counter() - t0)
+        med = statistics.median(times)
+        per_file.append({
+            "file": os.path.basename(path),
+            "audio_sec": round(durations[path], 3),
+            "latency_sec": round(med, 4),
+            "rtf": round(med / durations[path], 4) if durations[path] else None,
+            "text": text[:120],
+        })
+
+    # 동시 실행 — 같은 파일 목록을 concurrency 배로 흘려 전체 처리량(RTF) 측정
+    jobs = [f for f in files for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(fn, jobs))
+    wall = time.perf_counter() - t0
+    total_audio = sum(durations[f] for f in jobs)
+
+    rtfs = [r["rtf"] for r in per_file if r["rtf"] is not None]
+    return {
+        "engine": name,
+        "files": per_file,
+        "median_rtf": round(statistics.median(rtfs), 4) if rtfs else None,
+        "concurrent": {
+            "concurrency": concurrency,
+            "clips": len(jobs),
+            "wall_sec": round(wall, 3),
+            "aggregate_rtf": round(wall / total_audio, 4) if total_audio else None,
+        },
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="remote vs local STT real-time factor")
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--engines", nargs="+", default=["remote", "local"], choices=["remote", "local"])
+    ap.add_argument("-c", "--concurrency", type=int, default=4)
+    ap.add_argument("-r", "--repeat", type=int, default=3)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+
+    args.files = [os.path.abspath(f) for f in args.files]
+    os.chdir(SERVER_DIR)
+    import main as server  # noqa: E402 — .env / AI_BACKEND 적용된 백엔드 사용
+
+    durations = {f: audio_seconds(f) for f in args.files}
+    results = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "ai_backend": server.AI_BACKEND},
+               "engines": []}
+
+    for name in args.engines:
+        if name == "local":
+            t0 = time.perf_counter()
+            server.local_stt.warmup()
+            results["meta"]["local_warmup_sec"] = round(time.perf_counter() - t0, 3)
+            results["meta"]["local_stt"] = server.local_stt.stats()
+            fn = server.local_stt.transcribe
+        else:
+            fn = lambda p: server.backend.transcribe(p, model=server.TRANSCRIBE_MODEL)  # noqa: E731
+        r = run_engine(name, fn, args.files, durations, args.concurrency, args.repeat)
+        results["engines"].append(r)
+        print(f"{name:7s} median RTF={r['median_rtf']}  "
+              f"concurrent x{args.concurrency}: wall={r['concurrent']['wall_sec']}s "
+              f"aggregate RTF={r['concurrent']['aggregate_rtf']}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"saved → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# server/benchmarks/bench_workers.py
+"""
+멀티 워커 메모리 벤치마크 — 워커당 고유 메모리(USS) 비교 (AI 백엔드는 stub 으로 고정)
+
+    cd server
+    python benchmarks/bench_workers.py -w 4
+    python benchmarks/bench_workers.py -w 4 --modes prefork --out bench/workers.json
+
+  - prefork: serve.py (마스터가 main 을 미리 import + gc.freeze 후 fork)
+    uvicorn: python -m uvicorn main:app --workers N (워커마다 따로 import)
+  - 각 서버에 같은 워밍업 트래픽(문제 생성/미리보기/검색/health)을 보낸 뒤 워커별 /proc/<pid>/smaps_rollup:
+      USS = Private_Clean + Private_Dirty  (그 워커만 쓰는 메모리 — 워커를 하나 늘릴 때 드는 비용)
+      PSS = 공유 페이지를 나눠 가진 몫, RSS = 공유 포함 전체
+  - 합계(마스터 + 워커 PSS 합)도 함께 출력 — 실제로 머신이 쓰는 메모리에 가장 가깝다
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("survey", "unexpected", "roleplay", "advanced", "full15")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---------------------------------------------------------
+# 측정
+# ---------------------------------------------------------
+def smaps_kb(pid: int) -> Optional[Dict[str, int]]:
+    """smaps_rollup → {rss, pss, uss} (kB)"""
+    fields: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def children(pid: int) -> List[int]:
+    out: List[int] = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == pid and b"resource_tracker" not in cmdline:
+            out.append(int(entry))
+    return sorted(out)
+
+
+# ---------------------------------------------------------
+# 서버
+# ---------------------------------------------------------
+def command(mode: str, workers: int, port: int) -> List[str]:
+    if mode == "prefork":
+        return [sys.executable, "serve.py", "-w", str(workers), "--port", str(port),
+                "--log-level", "warning", "--no-access-log"]
+    return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+
+
+def start(mode: str, workers: int) -> Tuple[subprocess.Popen, str, float]:
+    port = _free_port()
+    env = dict(os.environ, AI_BACKEND="stub", BANK_WATCH_SEC="0")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(command(mode, workers, port), cwd=SERVER_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{mode} server exited during startup")
+        # 모든 워커가 떠야 측정 의미가 있다
+        if len(children(proc.pid)) >= workers:
+            try:
+                if httpx.get(f"{url}/health", timeout=0.5).status_code == 200:
+                    return proc, url, time.perf_counter() - t0
+            except httpx.HTTPError:
+                pass
+        time.sleep(0.1)
+    stop(proc)
+    raise RuntimeError(f"{mode} server did not become healthy in 60s")
+
+
+def stop(proc: subprocess.Popen) -> None:
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def warm(url: str, rounds: int) -> int:
+    """워커마다 코드 경로가 한 번씩은 돌도록 — 연결을 매번 새로 열어 accept 가 워커들에 퍼지게"""
+    sent = 0
+    for i in range(rounds):
+        for m in MODES:
+            httpx.post(f"{url}/problems/generate", json={"mode": m}, headers={"X-User-Id": f"w{i}"}, timeout=30)
+            httpx.get(f"{url}/problems/preview", params={"mode": m}, timeout=30)
+            sent += 2
+        httpx.get(f"{url}/problems/search", params={"q": "movie"}, timeout=30)
+        httpx.get(f"{url}/health", timeout=30)
+        sent += 2
+    return sent
+
+
+def measure(mode: str, workers: int, rounds: int) -> Dict[str, Any]:
+    proc, url, startup = start(mode, workers)
+    try:
+        sent = warm(url, rounds)
+        time.sleep(0.5)
+        pids = children(proc.pid)
+        per_worker = [{"pid": p, **(smaps_kb(p) or {})} for p in pids]
+        master = smaps_kb(proc.pid) or {}
+    finally:
+        stop(proc)
+    uss = [w.get("uss", 0) for w in per_worker]
+    return {
+        "mode": mode,
+        "workers": len(per_worker),
+        "startup_sec": round(startup, 2),
+        "warmup_requests": sent,
+        "master": master,
+        "per_worker": per_worker,
+        "uss_mean_kb": round(sum(uss) / len(uss)) if uss else None,
+        "uss_max_kb": max(uss) if uss else None,
+        "pss_total_kb": master.get("pss", 0) + sum(w.get("pss", 0) for w in per_worker),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="per-worker unique memory: pre-fork launcher vs uvicorn --workers")
+    ap.add_argument("-w", "--workers", type=int, default=4)
+    ap.add_argument("--modes", nargs="+", default=["uvicorn", "prefork"], choices=["uvicorn", "prefork"])
+    ap.add_argument("--rounds", type=int, default=20, help="워밍업 반복 횟수")
+    ap.add_argument("--out", help="결과 JSON 경로")
+    args = ap.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("needs Linux /proc/<pid>/smaps_rollup")
+
+    results = [measure(m, args.workers, args.rounds) for m in args.modes]
+    print(f"{'mode':<9} {'workers':>7} {'USS mean':>10} {'USS max':>10} {'PSS total':>10} {'startup':>8}")
+    for r in results:
+        print(f"{r['mode']:<9} {r['workers']:>7} {r['uss_mean_kb'] / 1024:>8.1f}MB {r['uss_max_kb'] / 1024:>8.1f}MB "
+              f"{r['pss_total_kb'] / 1024:>8.1f}MB {r['startup_sec']:>7.2f}s")
+        for w in r["per_worker"]:
+            print(f"    pid {w['pid']:<8} uss={w.get('uss', 0) / 1024:.1f}MB pss={w.get('pss', 0) / 1024:.1f}MB "
+                  f"rss={w.get('rss', 0) / 1024:.1f}MB")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=2)
+        print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
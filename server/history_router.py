@@ -0,0 +1,154 @@
+# server/history_router.py
+from __future__ import annotations
+
+import binascii
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from admission import user_key
+from history_store import get_store
+from waveform_peaks import jobs as peak_jobs, load_peaks
+
+# ---------------------------------------------------------
+# 응시 기록 API (Feedback / FeedbackDetail / Replay / MyPage)
+#   기록은 admission.user_key 라벨(X-User-Id → 없으면 IP)로 나눈다
+#   ※ 인증이 아니다 — 라벨은 클라이언트가 정하므로, 로그인 연동 전까지 같은 라벨을 보내면 그 기록이 보인다
+#   GET /api/feedback?limit=20&cursor=...&question_id=...   최신순, keyset 페이지
+#   GET /api/feedback/{attempt_id}                          상세 (전사문 포함)
+#   GET /api/feedback/{attempt_id}/audio                    녹음 재생 (Range → 206, ETag/If-Modified-Since → 304)
+#   GET /api/feedback/{attempt_id}/peaks                    파형 피크 JSON (waveform_peaks.py, 만드는 중이면 202)
+#   GET /api/progress                                       MyPage 롤업 (streak, 레벨 추이, 유형별 통계)
+# ---------------------------------------------------------
+
+
+class AttemptSummary(BaseModel):
+    id: int
+    exam_id: Optional[str] = None
+    question_id: Optional[str] = None
+    question_type: Optional[str] = None
+    question_text: Optional[str] = None
+    recording_id: Optional[str] = None
+    summary: Optional[str] = None
+    level: Optional[str] = None
+    metrics: Dict[str, Any]
+    tips: List[str]
+    created_at: int
+
+
+class AttemptDetail(AttemptSummary):
+    transcript: str
+
+
+class AttemptPage(BaseModel):
+    items: List[AttemptSummary]
+    next_cursor: Optional[str] = None
+
+
+router = APIRouter(prefix="/api/feedback", tags=["Attempt History"])
+progress_router = APIRouter(prefix="/api/progress", tags=["Attempt History"])
+
+
+@router.get("", response_model=AttemptPage)
+async def list_attempts(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="이전 응답의 next_cursor"),
+    question_id: Optional[str] = Query(None),
+):
+    try:
+        return await run_in_threadpool(
+            get_store().list_attempts, user_key(request), limit=limit, cursor=cursor, question_id=question_id
+        )
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/{attempt_id}", response_model=AttemptDetail)
+async def get_attempt(request: Request, attempt_id: int):
+    row = await run_in_threadpool(get_store().get_attempt, user_key(request), attempt_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    return row
+
+
+# ----- 재생 -----
+# 녹음은 업로드 후 바뀌지 않으므로 (크기, mtime) 만으로 검증자를 만든다.
+# 본문 전송은 FileResponse — Range/If-Range 처리, 파일을 청크 단위로 읽어 보낸다
+AUDIO_MEDIA_TYPES = {
+    ".webm": "audio/webm", ".ogg": "audio/ogg", ".wav": "audio/wav",
+    ".m4a": "audio/mp4", ".mp4": "audio/mp4", ".mp3": "audio/mpeg",
+}
+REPLAY_CACHE_CONTROL = "private, max-age=86400"
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:   # If-None-Match 가 있으면 If-Modified-Since 는 보지 않는다 (RFC 9110)
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _serve_file(request: Request, path: str, media_type: str) -> Response:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": REPLAY_CACHE_CONTROL,
+    }
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+async def _audio_path(request: Request, attempt_id: int) -> str:
+    path = await run_in_threadpool(get_store().get_audio_path, user_key(request), attempt_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return path
+
+
+@router.get("/{attempt_id}/audio")
+async def get_attempt_audio(request: Request, attempt_id: int):
+    path = await _audio_path(request, attempt_id)
+    media_type = AUDIO_MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+    return _serve_file(request, path, media_type)
+
+
+@router.get("/{attempt_id}/peaks")
+async def get_attempt_peaks(request: Request, attempt_id: int):
+    """
+    업로드 후 백그라운드에서 만든 파일. 아직 없으면 202 + Retry-After — 예전 녹음이면 이때 작업을 건다
+    (조회 요청이 직접 디코딩하지 않는다)
+    """
+    path = await _audio_path(request, attempt_id)
+    peaks = load_peaks(path)
+    if peaks is not None:
+        return _serve_file(request, peaks, "application/json")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Recording not found")
+    if peak_jobs.failed(path):
+        raise HTTPException(status_code=422, detail="Recording cannot be decoded")
+    peak_jobs.submit(path)
+    return JSONResponse({"status": "pending"}, status_code=202, headers={"Retry-After": "1"})
+
+
+@progress_router.get("")
+async def get_progress(request: Request):
+    return await run_in_threadpool(get_store().get_progress, user_key(request))
@@ -0,0 +1,357 @@
+# server/history_store.py
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import progress_rollup
+from question_ids import set_bit
+
+# ---------------------------------------------------------
+# 응시(attempt) 기록 저장소 — SQLite (WAL)
+#   - 업로드 1건 = attempt 1행 (사용자, 시험/문항 ID, 녹음 경로, 전사문, 지표, 레벨, 팁)
+#   - 인덱스: (user_id, created_at, id) / (user_id, question_id, created_at, id)
+#   - 목록은 keyset 페이지네이션 (OFFSET 없음) → 기록이 아무리 많아도 페이지당 비용 일정
+#   - 사용자별 진행 롤업(user_rollups)은 attempt 저장과 같은 트랜잭션에서 갱신 (progress_rollup.py)
+#   - 사용자별 '푼 문항' 비트셋(user_seen)도 같은 트랜잭션에서 갱신 (question_ids.py)
+#   - defer_analysis 업로드는 deferred_recordings 에 (recording_id, 소유자, 경로, 전사문, 파형 측정값) 로 남긴다
+#     → 묶음 분석은 본인 녹음만 이 표로 찾아 붙이고, 전사문/측정값도 클라이언트가 보낸 값이 아니라 여기서 읽는다
+#       같은 녹음의 기록은 1건 (재시도하면 기존 기록)
+# .env: HISTORY_DB_PATH=data/opic.sqlite3
+# ---------------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id       TEXT    NOT NULL,
+    exam_id       TEXT,
+    question_id   TEXT,
+    question_type TEXT,
+    question_text TEXT,
+    recording_id  TEXT,
+    audio_path    TEXT,
+    transcript    TEXT    NOT NULL,
+    summary       TEXT,
+    level         TEXT,
+    metrics_json  TEXT    NOT NULL DEFAULT '{}',
+    tips_json     TEXT    NOT NULL DEFAULT '[]',
+    created_at    INTEGER NOT NULL            -- epoch ms
+);
+CREATE INDEX IF NOT EXISTS ix_attempts_user_created
+    ON attempts (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_attempts_user_question
+    ON attempts (user_id, question_id, created_at DESC, id DESC);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_attempts_recording
+    ON attempts (recording_id) WHERE recording_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS user_rollups (
+    user_id    TEXT PRIMARY KEY,
+    doc        TEXT    NOT NULL,              -- progress_rollup 문서 (JSON)
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS deferred_recordings (
+    recording_id TEXT PRIMARY KEY,
+    user_id      TEXT    NOT NULL,
+    audio_path   TEXT    NOT NULL,
+    transcript   TEXT    NOT NULL,
+    metrics_json TEXT    NOT NULL DEFAULT '{}',   -- 업로드 때 잰 파형 측정값
+    created_at   INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_seen (
+    user_id TEXT PRIMARY KEY,
+    bits    BLOB NOT NULL                     -- bit i = 문항 ID i 를 푼 적 있음
+);
+"""
+
+MAX_QID = 1 << 20   # 비트셋 상한 (128KB) — 잘못된 ID 로 거대한 BLOB 이 생기지 않도록
+
+_LIST_COLUMNS = (
+    "id, exam_id, question_id, question_type, question_text, recording_id, "
+    "summary, level, metrics_json, tips_json, created_at"
+)
+
+
+def encode_cursor(created_at: int, attempt_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}:{attempt_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    a, b = raw.split(":", 1)
+    return int(a), int(b)
+
+
+class SQLiteStore:
+    """스레드별 연결 + 최초 1회 스키마 생성. 하위 클래스는 SCHEMA 만 정한다."""
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # ----- 연결 (스레드별, fork 후 재연결) -----
+    def conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None or getattr(self._local, "pid", None) != os.getpid():
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            c = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            c.row_factory = sqlite3.Row
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute("PRAGMA foreign_keys=ON")
+            self._local.conn, self._local.pid = c, os.getpid()
+            self._ensure_schema(c)
+        return c
+
+    def _ensure_schema(self, c: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if not self._initialized:
+                c.executescript(self.SCHEMA)
+                self._initialized = True
+
+
+class HistoryStore(SQLiteStore):
+    SCHEMA = SCHEMA
+
+    # ----- 쓰기 -----
+    def record_attempt(
+        self,
+        *,
+        user_id: str,
+        transcript: str,
+        summary: str,
+        level: str,
+        metrics: Dict[str, Any],
+        tips: List[str],
+        exam_id: Optional[str] = None,
+        question_id: Optional[str] = None,
+        question_type: Optional[str] = None,
+        question_text: Optional[str] = None,
+        recording_id: Optional[str] = None,
+        audio_path: Optional[str] = None,
+        created_at: Optional[int] = None,
+        seen_qid: Optional[int] = None,
+    ) -> int:
+        created_at = created_at if created_at is not None else int(time.time() * 1000)
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            cur = c.execute(
+                "INSERT INTO attempts (user_id, exam_id, question_id, question_type, question_text, "
+                "recording_id, audio_path, transcript, summary, level, metrics_json, tips_json, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (recording_id) WHERE recording_id IS NOT NULL DO NOTHING",
+                (
+                    user_id, exam_id, question_id, question_type, question_text,
+                    recording_id, audio_path, transcript, summary, level,
+                    json.dumps(metrics, ensure_ascii=False), json.dumps(tips, ensure_ascii=False),
+                    created_at,
+                ),
+            )
+            if cur.rowcount == 0:
+                # 같은 녹음의 기록이 이미 있다 (동시 재시도) — 롤업에 두 번 반영하지 않고 그 기록을 돌려준다
+                r = c.execute(
+                    "SELECT id FROM attempts WHERE recording_id = ? AND user_id = ?", (recording_id, user_id)
+                ).fetchone()
+                if r is None:
+                    raise sqlite3.IntegrityError(f"recording {recording_id} belongs to another user")
+                c.execute("COMMIT")
+                return int(r["id"])
+            doc = self._load_rollup(c, user_id)
+            progress_rollup.apply_attempt(
+                doc, created_at=created_at, level=level, metrics=metrics, question_type=question_type
+            )
+            self._save_rollup(c, user_id, doc)
+            if seen_qid is not None and 0 <= seen_qid < MAX_QID:
+                self._mark_seen(c, user_id, seen_qid)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        return int(cur.lastrowid)
+
+    # ----- 읽기 -----
+    def list_attempts(
+        self,
+        user_id: str,
+        *,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        question_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """최신순 목록. next_cursor 를 그대로 다음 요청에 넘기면 이어진다."""
+        where = ["user_id = ?"]
+        args: List[Any] = [user_id]
+        if question_id is not None:
+            where.append("question_id = ?")
+            args.append(question_id)
+        if cursor:
+            created_at, attempt_id = decode_cursor(cursor)
+            where.append("(created_at, id) < (?, ?)")
+            args += [created_at, attempt_id]
+        rows = self.conn().execute(
+            f"SELECT {_LIST_COLUMNS} FROM attempts WHERE {' AND '.join(where)} "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*args, limit + 1),
+        ).fetchall()
+
+        items = [self._row(r) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get_attempt(self, user_id: str, attempt_id: int) -> Optional[Dict[str, Any]]:
+        r = self.conn().execute(
+            f"SELECT {_LIST_COLUMNS}, transcript, audio_path FROM attempts WHERE id = ? AND user_id = ?",
+            (attempt_id, user_id),
+        ).fetchone()
+        if r is None:
+            return None
+        out = self._row(r)
+        out["transcript"] = r["transcript"]
+        return out
+
+    def get_attempt_by_recording(self, user_id: str, recording_id: str) -> Optional[Dict[str, Any]]:
+        """이 녹음으로 이미 남긴 기록 (본인 것만) — 묶음 분석 재시도용"""
+        r = self.conn().execute(
+            f"SELECT {_LIST_COLUMNS}, transcript FROM attempts WHERE recording_id = ? AND user_id = ?",
+            (recording_id, user_id),
+        ).fetchone()
+        if r is None:
+            return None
+        out = self._row(r)
+        out["transcript"] = r["transcript"]
+        return out
+
+    def get_audio_path(self, user_id: str, attempt_id: int) -> Optional[str]:
+        """재생용 녹음 경로 (본인 기록만)"""
+        r = self.conn().execute(
+            "SELECT audio_path FROM attempts WHERE id = ? AND user_id = ?", (attempt_id, user_id)
+        ).fetchone()
+        return r["audio_path"] if r else None
+
+    # ----- 분석을 미룬 녹음 -----
+    def defer_recording(
+        self, *, user_id: str, recording_id: str, audio_path: str, transcript: str, metrics: Dict[str, Any]
+    ) -> None:
+        self.conn().execute(
+            "INSERT INTO deferred_recordings (recording_id, user_id, audio_path, transcript, metrics_json, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(recording_id) DO NOTHING",
+            (recording_id, user_id, audio_path, transcript, json.dumps(metrics, ensure_ascii=False),
+             int(time.time() * 1000)),
+        )
+
+    def get_deferred(self, user_id: str, recording_id: str) -> Optional[Dict[str, Any]]:
+        """본인이 올린 defer_analysis 녹음 {audio_path, transcript, metrics} (남의 recording_id 면 None)"""
+        r = self.conn().execute(
+            "SELECT audio_path, transcript, metrics_json FROM deferred_recordings "
+            "WHERE recording_id = ? AND user_id = ?",
+            (recording_id, user_id),
+        ).fetchone()
+        if r is None:
+            return None
+        return {"audio_path": r["audio_path"], "transcript": r["transcript"], "metrics": json.loads(r["metrics_json"])}
+
+    # ----- 푼 문항 비트셋 -----
+    def get_seen(self, user_id: str) -> Optional[bytes]:
+        r = self.conn().execute("SELECT bits FROM user_seen WHERE user_id = ?", (user_id,)).fetchone()
+        return bytes(r["bits"]) if r else None
+
+    @staticmethod
+    def _mark_seen(c: sqlite3.Connection, user_id: str, qid: int) -> None:
+        r = c.execute("SELECT bits FROM user_seen WHERE user_id = ?", (user_id,)).fetchone()
+        c.execute(
+            "INSERT INTO user_seen (user_id, bits) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET bits = excluded.bits",
+            (user_id, set_bit(bytes(r["bits"]) if r else None, qid)),
+        )
+
+    # ----- 진행 롤업 -----
+    def get_progress(self, user_id: str, now_ms: Optional[int] = None) -> Dict[str, Any]:
+        """기본키 조회 1회 — 기록 개수와 무관"""
+        doc = self._load_rollup(self.conn(), user_id)
+        return progress_rollup.view(doc, now_ms if now_ms is not None else int(time.time() * 1000))
+
+    def rebuild_rollups(self, user_id: Optional[str] = None) -> int:
+        """attempts 전체에서 롤업을 다시 계산 (집계 규칙 변경 / 복구용). 갱신한 사용자 수 반환."""
+        c = self.conn()
+        where, args = ("WHERE user_id = ?", (user_id,)) if user_id else ("", ())
+        docs: Dict[str, Dict[str, Any]] = {}
+        for r in c.execute(
+            f"SELECT user_id, created_at, level, metrics_json, question_type FROM attempts {where} "
+            "ORDER BY user_id, created_at, id",
+            args,
+        ):
+            progress_rollup.apply_attempt(
+                docs.setdefault(r["user_id"], progress_rollup.empty_rollup()),
+                created_at=r["created_at"],
+                level=r["level"],
+                metrics=json.loads(r["metrics_json"]),
+                question_type=r["question_type"],
+            )
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(f"DELETE FROM user_rollups {where}", args)
+            for uid, doc in docs.items():
+                self._save_rollup(c, uid, doc)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        return len(docs)
+
+    @staticmethod
+    def _load_rollup(c: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
+        r = c.execute("SELECT doc FROM user_rollups WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(r["doc"]) if r else progress_rollup.empty_rollup()
+
+    @staticmethod
+    def _save_rollup(c: sqlite3.Connection, user_id: str, doc: Dict[str, Any]) -> None:
+        c.execute(
+            "INSERT INTO user_rollups (user_id, doc, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET doc = excluded.doc, updated_at = excluded.updated_at",
+            (user_id, json.dumps(doc, ensure_ascii=False), int(time.time() * 1000)),
+        )
+
+    @staticmethod
+    def _row(r: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": r["id"],
+            "exam_id": r["exam_id"],
+            "question_id": r["question_id"],
+            "question_type": r["question_type"],
+            "question_text": r["question_text"],
+            "recording_id": r["recording_id"],
+            "summary": r["summary"],
+            "level": r["level"],
+            "metrics": json.loads(r["metrics_json"]),
+            "tips": json.loads(r["tips_json"]),
+            "created_at": r["created_at"],
+        }
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    """프로세스 공용 저장소 (HISTORY_DB_PATH)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore(os.getenv("HISTORY_DB_PATH", "data/opic.sqlite3"))
+    return _store
@@ -0,0 +1,106 @@
+# server/json_stream.py
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# ---------------------------------------------------------
+# 관대한(tolerant) 증분 JSON 파서
+#   - 스트리밍 델타를 feed() 로 넣으면, 최상위 객체의 필드가
+#     "완성되는 즉시" 하나씩 돌려준다 (→ 스트리밍 중 검증/사용 가능)
+#   - 첫 '{' 이전 텍스트(```json 코드펜스, 머리말)와
+#     최상위 객체가 닫힌 뒤의 꼬리(```)는 무시한다
+# ---------------------------------------------------------
+
+
+class IncrementalJSONParser:
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None):
+        self.on_field = on_field
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._text = ""               # 최상위 '{' 부터 누적된 원문
+        self._started = False
+        self._stack: List[str] = []   # 열린 괄호 스택 ('{' / '[')
+        self._in_str = False
+        self._esc = False
+        self._member_start = 0        # 현재 최상위 멤버의 시작 위치
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """chunk 를 소비하고 이번에 새로 완성된 최상위 필드를 반환"""
+        completed: Dict[str, Any] = {}
+        if self.done or not chunk:
+            return completed
+        if not self._started:
+            i = chunk.find("{")
+            if i < 0:
+                return completed
+            self._started = True
+            chunk = chunk[i:]
+
+        start = len(self._text)
+        self._text += chunk
+        text = self._text
+        for pos in range(start, len(text)):
+            ch = text[pos]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._stack.append(ch)
+                if len(self._stack) == 1:
+                    self._member_start = pos + 1
+            elif ch in "}]":
+                if len(self._stack) == 1:
+                    self._close_member(pos, completed)
+                    self._stack.pop()
+                    self._text = text[: pos + 1]
+                    self.done = True
+                    break
+                if self._stack:
+                    self._stack.pop()
+            elif ch == "," and len(self._stack) == 1:
+                self._close_member(pos, completed)
+                self._member_start = pos + 1
+        return completed
+
+    def _close_member(self, end: int, completed: Dict[str, Any]) -> None:
+        member = self._text[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        for k, v in parsed.items():
+            self.fields[k] = v
+            completed[k] = v
+            if self.on_field is not None:
+                self.on_field(k, v)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """지금까지 완성된 필드 (부분 결과)"""
+        return dict(self.fields)
+
+    def finish(self, required: Sequence[str] = ()) -> Dict[str, Any]:
+        """스트림 종료 — 최상위 객체가 닫히지 않았거나 required 필드가 빠졌으면 ValueError"""
+        if not self.done:
+            raise ValueError("incomplete JSON object" if self._started else "no JSON object found")
+        missing = [k for k in required if k not in self.fields]
+        if missing:
+            # 출력 토큰 상한에 걸려 잘린 뒤 모델이 객체만 닫은 경우 등 — 부분 결과를 완성본으로 넘기지 않는다
+            raise ValueError(f"missing required fields: {', '.join(missing)}")
+        return dict(self.fields)
+
+
+def parse_json_lenient(text: str, required: Sequence[str] = ()) -> Dict[str, Any]:
+    """코드펜스/머리말이 섞인 전체 텍스트에서 최상위 JSON 객체를 파싱"""
+    p = IncrementalJSONParser()
+    p.feed(text)
+    return p.finish(required)
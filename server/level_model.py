@@ -0,0 +1,362 @@
+# server/level_model.py
+"""
+로컬 레벨 추정 모델 (LLM 을 기다리지 않는 잠정 레벨)
+
+    cd server
+    python level_model.py train                      # 응시 기록(HISTORY_DB_PATH)으로 학습 → 평가 → current 로 승격
+    python level_model.py train --holdout 0.2 --l2 0.01 --no-promote
+    python level_model.py report                     # current 모델의 평가 보고서 출력
+
+  - 학습 데이터: 쌓인 응시 기록의 (전사문, 파형 지표, 문항 유형) → LLM 이 매긴 level
+    (이 모델이 대신 매긴 기록 — metrics.level_source == "local" — 은 제외해 자기 예측을 다시 배우지 않게)
+  - 모델: 특징 표준화 + 다항 로지스틱 회귀 (NumPy, L2, 전체 배치 경사하강)
+    특징은 전사문(길이, 어휘 다양도, 문장 길이, 필러/접속사/과거형 비율)과 파형(말하기 속도, 휴지) 20여 개
+    추론은 행렬곱 한 번 → 수 µs. 확신도 = 최대 클래스 확률
+  - 평가: 시간순 마지막 holdout 비율을 시험셋으로 — 정확도, ±1 레벨 정확도, 클래스별 정밀도/재현율,
+    혼동행렬, 확신도 임계값별 (적용 비율, 정확도) → LEVEL_SKIP_LLM_CONFIDENCE 를 고르는 근거
+  - 산출물: data/level_models/<version>.json (가중치 + 특징/클래스 목록 + 평가 요약)
+            data/level_models/<version>.report.json (평가 보고서 전체)
+            data/level_models/current.json (서버가 읽는 승격본 — 워커 시작 때 한 번 읽는다)
+  - 서버: 업로드마다 잠정 레벨(provisional_level, provisional_confidence)을 응답에 붙이고 /ws/capture 에는 먼저 보낸다.
+    LEVEL_SKIP_LLM_CONFIDENCE 를 설정하면 확신도가 그 이상일 때 분석 LLM 호출을 건너뛴다 (요약/팁 없음)
+  .env: LEVEL_MODEL_PATH=data/level_models/current.json  LEVEL_SKIP_LLM_CONFIDENCE=(비우면 건너뛰지 않음)
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analysis_schema import OPIC_LEVELS
+
+MODEL_PATH = os.getenv("LEVEL_MODEL_PATH", "data/level_models/current.json")
+MODEL_DIR = os.path.dirname(MODEL_PATH) or "."          # 버전별 산출물도 같은 곳에
+_skip = os.getenv("LEVEL_SKIP_LLM_CONFIDENCE", "")
+SKIP_LLM_CONFIDENCE: Optional[float] = float(_skip) if _skip else None
+CONFIDENCE_STEPS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+# ---------------------------------------------------------
+# 특징
+# ---------------------------------------------------------
+_WORD = re.compile(r"[A-Za-z']+")
+_SENTENCE = re.compile(r"[.!?]+")
+FILLERS = frozenset({"um", "uh", "erm", "er", "hmm", "ah", "like", "yeah", "well"})
+CONNECTORS = frozenset({
+    "because", "although", "though", "however", "while", "whereas", "since", "unless", "therefore",
+    "moreover", "actually", "especially", "which", "whose", "whenever", "instead", "otherwise", "besides",
+})
+QTYPE_GROUPS = {
+    "introduce": "intro",
+    "description": "basic", "routine": "basic", "comparison": "basic", "experience": "basic",
+    "11": "roleplay", "12": "roleplay", "13": "roleplay",
+    "14": "advanced", "15": "advanced",
+}
+GROUPS = ("intro", "basic", "roleplay", "advanced", "unknown")
+
+FEATURES: Tuple[str, ...] = (
+    "log_words", "root_ttr", "mean_word_len", "long_word_ratio", "mean_sentence_words",
+    "filler_rate", "connector_rate", "past_ed_rate", "first_person_rate",
+    "has_audio", "log_audio_sec", "speech_rate", "articulation_rate", "pause_ratio",
+    "mean_pause_sec", "long_pauses_per_min", "longest_silence_sec",
+) + tuple(f"qtype_{g}" for g in GROUPS)
+
+
+def features(text: str, signal: Optional[Dict[str, Any]], question_type: Optional[str]) -> np.ndarray:
+    words = [w.lower() for w in _WORD.findall(text)]
+    n = len(words)
+    nz = max(n, 1)
+    sentences = max(1, len([s for s in _SENTENCE.split(text) if s.strip()]))
+    signal = signal or {}
+    audio_sec = float(signal.get("audio_sec") or 0.0)
+    has_audio = 1.0 if "voiced_sec" in signal else 0.0
+    group = QTYPE_GROUPS.get(str(question_type or ""), "unknown")
+    row = [
+        math.log1p(n),
+        len(set(words)) / math.sqrt(nz),                       # 길이에 덜 민감한 어휘 다양도 (Guiraud)
+        sum(len(w) for w in words) / nz,
+        sum(1 for w in words if len(w) >= 7) / nz,
+        n / sentences,
+        sum(1 for w in words if w in FILLERS) / nz,
+        sum(1 for w in words if w in CONNECTORS) / nz,
+        sum(1 for w in words if len(w) > 4 and w.endswith("ed")) / nz,
+        sum(1 for w in words if w in ("i", "my", "me")) / nz,
+        has_audio,
+        math.log1p(audio_sec),
+        float(signal.get("speech_rate_wpm") or 0.0) / 100.0,
+        float(signal.get("articulation_rate_wpm") or 0.0) / 100.0,
+        float(signal.get("pause_ratio") or 0.0),
+        float(signal.get("mean_pause_sec") or 0.0),
+        float(signal.get("long_pause_count") or 0) / (audio_sec / 60.0) if audio_sec else 0.0,
+        min(float(signal.get("longest_silence_sec") or 0.0), 10.0),
+    ] + [1.0 if group == g else 0.0 for g in GROUPS]
+    return np.asarray(row, dtype=np.float64)
+
+
+# ---------------------------------------------------------
+# 모델
+# ---------------------------------------------------------
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+@dataclass
+class LevelModel:
+    version: str
+    features: Tuple[str, ...]
+    classes: Tuple[str, ...]
+    mean: np.ndarray
+    scale: np.ndarray
+    W: np.ndarray            # (특징 수, 클래스 수)
+    b: np.ndarray
+    summary: Dict[str, Any]
+
+    def proba(self, X: np.ndarray) -> np.ndarray:
+        return _softmax(((X - self.mean) / self.scale) @ self.W + self.b)
+
+    def predict(self, text: str, signal: Optional[Dict[str, Any]] = None,
+                question_type: Optional[str] = None) -> Tuple[str, float]:
+        p = self.proba(features(text, signal, question_type))
+        i = int(p.argmax())
+        return self.classes[i], float(p[i])
+
+    # ----- 직렬화 -----
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "features": list(self.features),
+            "classes": list(self.classes),
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "W": self.W.tolist(),
+            "b": self.b.tolist(),
+            "summary": self.summary,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LevelModel":
+        if tuple(d["features"]) != FEATURES:
+            raise ValueError(f"level model {d.get('version')} was trained on a different feature set")
+        return cls(
+            version=d["version"], features=tuple(d["features"]), classes=tuple(d["classes"]),
+            mean=np.asarray(d["mean"]), scale=np.asarray(d["scale"]),
+            W=np.asarray(d["W"]), b=np.asarray(d["b"]), summary=d.get("summary", {}),
+        )
+
+
+def fit(X: np.ndarray, y: np.ndarray, n_classes: int, l2: float = 0.01, iters: int = 800,
+        lr: float = 0.5) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """표준화 + softmax 회귀 (전체 배치 경사하강). 클래스 수가 적고 특징도 20여 개라 수 초 안에 끝난다"""
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale < 1e-9] = 1.0
+    Z = (X - mean) / scale
+    Y = np.eye(n_classes)[y]
+    W = np.zeros((X.shape[1], n_classes))
+    b = np.zeros(n_classes)
+    m = len(X)
+    for _ in range(iters):
+        G = _softmax(Z @ W + b) - Y
+        W -= lr * (Z.T @ G / m + l2 * W)
+        b -= lr * G.mean(axis=0)
+    return mean, scale, W, b
+
+
+def evaluate(model: LevelModel, X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+    classes = model.classes
+    P = model.proba(X)
+    pred = P.argmax(axis=1)
+    conf = P.max(axis=1)
+    k = len(classes)
+    cm = np.zeros((k, k), dtype=int)
+    np.add.at(cm, (y, pred), 1)
+    per_class = {}
+    for i, c in enumerate(classes):
+        tp, support, predicted = cm[i, i], cm[i].sum(), cm[:, i].sum()
+        if support or predicted:
+            per_class[c] = {
+                "support": int(support),
+                "precision": round(tp / predicted, 3) if predicted else None,
+                "recall": round(tp / support, 3) if support else None,
+            }
+    by_conf = []
+    for t in CONFIDENCE_STEPS:
+        sel = conf >= t
+        by_conf.append({
+            "threshold": t,
+            "coverage": round(float(sel.mean()), 3) if len(y) else 0.0,
+            "accuracy": round(float((pred[sel] == y[sel]).mean()), 3) if sel.any() else None,
+        })
+    # 추론 지연 (단건 — 특징 추출 제외 / 포함)
+    x1 = X[:1] if len(X) else np.zeros((1, len(FEATURES)))
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        model.proba(x1[0])
+    proba_us = (time.perf_counter() - t0) / 1000 * 1e6
+    majority = np.bincount(y, minlength=k).max() / len(y) if len(y) else 0.0
+    return {
+        "rows": int(len(y)),
+        "accuracy": round(float((pred == y).mean()), 3) if len(y) else None,
+        "within_one_level": round(float((np.abs(pred - y) <= 1).mean()), 3) if len(y) else None,
+        "majority_baseline": round(float(majority), 3),
+        "per_class": per_class,
+        "by_confidence": by_conf,
+        "confusion": {"labels": list(classes), "matrix": cm.tolist()},
+        "predict_us": round(proba_us, 1),
+    }
+
+
+# ---------------------------------------------------------
+# 서버에서 쓰는 부분
+# ---------------------------------------------------------
+_model: Optional[LevelModel] = None
+_loaded = False
+
+
+def load(path: str = MODEL_PATH) -> Optional[LevelModel]:
+    """승격된 모델 (없으면 None — 잠정 레벨 없이 동작)"""
+    global _model, _loaded
+    if not _loaded:
+        _loaded = True
+        try:
+            with open(path, encoding="utf-8") as f:
+                _model = LevelModel.from_dict(json.load(f))
+        except FileNotFoundError:
+            _model = None
+        except (ValueError, KeyError) as e:
+            print("LEVEL MODEL NOT LOADED:", e)
+            _model = None
+    return _model
+
+
+def provisional(text: str, signal: Optional[Dict[str, Any]], question_type: Optional[str]) -> Optional[Dict[str, Any]]:
+    model = load()
+    if model is None or not text:
+        return None
+    level, conf = model.predict(text, signal, question_type)
+    return {"level": level, "confidence": round(conf, 3), "version": model.version}
+
+
+def should_skip_llm(p: Optional[Dict[str, Any]]) -> bool:
+    return p is not None and SKIP_LLM_CONFIDENCE is not None and p["confidence"] >= SKIP_LLM_CONFIDENCE
+
+
+def stats() -> Dict[str, Any]:
+    model = load()
+    return {"version": model.version if model else None, "skip_llm_confidence": SKIP_LLM_CONFIDENCE}
+
+
+# ---------------------------------------------------------
+# 학습 CLI
+# ---------------------------------------------------------
+def load_rows(db_path: str) -> List[Dict[str, Any]]:
+    """LLM 이 매긴 응시 기록 (시간순)"""
+    from history_store import HistoryStore
+
+    rows = HistoryStore(db_path).conn().execute(
+        "SELECT transcript, metrics_json, question_type, level FROM attempts "
+        "WHERE level IS NOT NULL AND transcript != '' ORDER BY created_at, id"
+    ).fetchall()
+    out = []
+    for r in rows:
+        metrics = json.loads(r["metrics_json"] or "{}")
+        if r["level"] in OPIC_LEVELS and metrics.get("level_source") != "local":
+            out.append({"text": r["transcript"], "signal": metrics, "question_type": r["question_type"],
+                        "level": r["level"]})
+    return out
+
+
+def _save_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def train(rows: Sequence[Dict[str, Any]], holdout: float, l2: float, iters: int) -> Tuple[LevelModel, Dict[str, Any]]:
+    X = np.stack([features(r["text"], r["signal"], r["question_type"]) for r in rows])
+    classes = tuple(c for c in OPIC_LEVELS if any(r["level"] == c for r in rows))   # 레벨 순서 유지 (±1 평가용)
+    index = {c: i for i, c in enumerate(classes)}
+    y = np.array([index[r["level"]] for r in rows])
+    split = int(len(rows) * (1 - holdout))
+
+    mean, scale, W, b = fit(X[:split], y[:split], len(classes), l2=l2, iters=iters)
+    digest = hashlib.sha256(np.concatenate([W.ravel(), b]).tobytes()).hexdigest()[:8]
+    version = f"lvl-{time.strftime('%Y%m%d-%H%M%S')}-{digest}"
+    model = LevelModel(version, FEATURES, classes, mean, scale, W, b, {})
+    report = {
+        "version": version,
+        "trained_at": int(time.time() * 1000),
+        "params": {"holdout": holdout, "l2": l2, "iters": iters},
+        "train": evaluate(model, X[:split], y[:split]),
+        "test": evaluate(model, X[split:], y[split:]),
+        "weights": {c: dict(sorted(zip(FEATURES, np.round(W[:, i], 3).tolist()), key=lambda kv: -abs(kv[1]))[:5])
+                    for i, c in enumerate(classes)},
+    }
+    model.summary = {k: report["test"][k] for k in ("rows", "accuracy", "within_one_level", "majority_baseline")}
+    model.summary["train_rows"] = split
+    return model, report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    t = report["test"]
+    print(f"model {report['version']}  train={report['train']['rows']} test={t['rows']}")
+    print(f"  accuracy {t['accuracy']}  within ±1 {t['within_one_level']}  "
+          f"(majority baseline {t['majority_baseline']})  predict {t['predict_us']} µs")
+    print("  confidence ≥  coverage  accuracy")
+    for s in t["by_confidence"]:
+        print(f"  {s['threshold']:>12}  {s['coverage']:>8}  {s['accuracy']}")
+    print("  class  support  precision  recall")
+    for c, s in t["per_class"].items():
+        print(f"  {c:>5}  {s['support']:>7}  {str(s['precision']):>9}  {s['recall']}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="train / inspect the local provisional level model")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    tr = sub.add_parser("train")
+    tr.add_argument("--db", default=os.getenv("HISTORY_DB_PATH", "data/opic.sqlite3"))
+    tr.add_argument("--holdout", type=float, default=0.2, help="newest fraction used as the test set")
+    tr.add_argument("--l2", type=float, default=0.01)
+    tr.add_argument("--iters", type=int, default=800)
+    tr.add_argument("--min-rows", type=int, default=100)
+    tr.add_argument("--no-promote", action="store_true", help="write the artifact but keep current.json")
+    sub.add_parser("report")
+    args = ap.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+
+    if args.cmd == "report":
+        model = load()
+        if model is None:
+            sys.exit(f"no model at {MODEL_PATH}")
+        with open(f"{MODEL_DIR}/{model.version}.report.json", encoding="utf-8") as f:
+            print_report(json.load(f))
+        return
+
+    rows = load_rows(args.db)
+    if len(rows) < args.min_rows:
+        sys.exit(f"only {len(rows)} graded attempts in {args.db} (need {args.min_rows})")
+    model, report = train(rows, args.holdout, args.l2, args.iters)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    _save_json(f"{MODEL_DIR}/{model.version}.json", model.to_dict())
+    _save_json(f"{MODEL_DIR}/{model.version}.report.json", report)
+    if not args.no_promote:
+        _save_json(MODEL_PATH, model.to_dict())
+    print_report(report)
+    print(f"saved {MODEL_DIR}/{model.version}.json" + ("" if args.no_promote else f" → {MODEL_PATH}"))
+
+
+if __name__ == "__main__":
+    main()
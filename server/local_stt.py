@@ -0,0 +1,251 @@
+# server/local_stt.py
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from ai_resilience import UpstreamTimeout
+
+# ---------------------------------------------------------
+# 오프라인 CPU 전사 엔진 (faster-whisper / CTranslate2, int8 양자화)
+#   - 워커 프로세스마다 모델 풀을 미리 올려둔다 (warmup — 반드시 fork 이후에)
+#   - 동시에 들어온 짧은 클립(≤30초)은 짧은 윈도우 동안 모아 한 번에 encode/generate (배치)
+#   - 30초를 넘는 클립은 기존 transcribe(VAD 분할) 경로로 개별 처리
+#   - 출력은 원격 경로와 같은 "전사문 문자열" — 분석 단계는 그대로
+# 선택적 의존성: pip install faster-whisper  (없으면 STT_ENGINE=local 요청만 실패)
+# .env:
+#   LOCAL_STT_MODEL=base.en  LOCAL_STT_COMPUTE_TYPE=int8  LOCAL_STT_POOL_SIZE=1
+#   LOCAL_STT_CPU_THREADS=4  LOCAL_STT_BATCH_WINDOW_MS=30  LOCAL_STT_MAX_BATCH=8
+#   LOCAL_STT_MODEL_DIR=     (모델 다운로드/캐시 경로, 비우면 HF 기본 캐시)
+# ---------------------------------------------------------
+
+SAMPLE_RATE = 16000
+SHORT_CLIP_SEC = 30.0
+
+
+class LocalSTTUnavailable(RuntimeError):
+    """faster-whisper 미설치 또는 모델 로드 실패"""
+
+
+@dataclass
+class _Job:
+    audio: "object"               # np.ndarray float32 mono 16k
+    duration: float
+    done: threading.Event = field(default_factory=threading.Event)
+    text: str = ""
+    error: Optional[BaseException] = None
+    cancelled: bool = False       # 호출자가 데드라인으로 이미 포기 → 배치에 넣지 않는다
+
+
+@dataclass
+class LocalTranscript:
+    text: str
+    audio_sec: float
+    elapsed_sec: float
+
+    @property
+    def rtf(self) -> float:
+        """real-time factor — 처리시간 / 오디오 길이 (작을수록 빠름)"""
+        return self.elapsed_sec / self.audio_sec if self.audio_sec else float("nan")
+
+
+class LocalWhisperEngine:
+    def __init__(
+        self,
+        model: str = "base.en",
+        compute_type: str = "int8",
+        pool_size: int = 1,
+        cpu_threads: int = 4,
+        batch_window_ms: float = 30.0,
+        max_batch: int = 8,
+        beam_size: int = 1,
+        language: str = "en",
+        model_dir: Optional[str] = None,
+        deadline_sec: float = 60.0,
+    ):
+        self.model_name = model
+        self.compute_type = compute_type
+        self.pool_size = max(1, pool_size)
+        self.cpu_threads = cpu_threads
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.beam_size = beam_size
+        self.language = language
+        self.model_dir = model_dir or None
+        self.deadline_sec = deadline_sec
+
+        self._models: "queue.Queue[object]" = queue.Queue()
+        self._jobs: "queue.Queue[_Job]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.batches = 0
+        self.batched_clips = 0
+        self.cancelled = 0
+
+    @classmethod
+    def from_env(cls, deadline_sec: float = 60.0) -> "LocalWhisperEngine":
+        return cls(
+            model=os.getenv("LOCAL_STT_MODEL", "base.en"),
+            compute_type=os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8"),
+            pool_size=int(os.getenv("LOCAL_STT_POOL_SIZE", "1")),
+            cpu_threads=int(os.getenv("LOCAL_STT_CPU_THREADS", "4")),
+            batch_window_ms=float(os.getenv("LOCAL_STT_BATCH_WINDOW_MS", "30")),
+            max_batch=int(os.getenv("LOCAL_STT_MAX_BATCH", "8")),
+            model_dir=os.getenv("LOCAL_STT_MODEL_DIR", ""),
+            deadline_sec=deadline_sec,
+        )
+
+    # ----- 모델 풀 -----
+    def warmup(self) -> None:
+        """모델 풀 로드 + 배처 스레드 시작 (여러 번 불러도 1회)"""
+        with self._lock:
+            if self._started:
+                return
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError as e:
+                raise LocalSTTUnavailable("faster-whisper is not installed (pip install faster-whisper)") from e
+            try:
+                for _ in range(self.pool_size):
+                    self._models.put(WhisperModel(
+                        self.model_name,
+                        device="cpu",
+                        compute_type=self.compute_type,
+                        cpu_threads=self.cpu_threads,
+                        download_root=self.model_dir,
+                    ))
+            except Exception as e:
+                raise LocalSTTUnavailable(f"failed to load {self.model_name}: {e}") from e
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="local-stt")
+            threading.Thread(target=self._batch_loop, name="local-stt-batcher", daemon=True).start()
+            self._started = True
+
+    @property
+    def ready(self) -> bool:
+        return self._started
+
+    # ----- 공개 API (블로킹) -----
+    def transcribe(self, path: str) -> str:
+        return self.transcribe_detailed(path).text
+
+    def transcribe_detailed(self, path: str) -> LocalTranscript:
+        self.warmup()
+        from faster_whisper.audio import decode_audio
+
+        t0 = time.perf_counter()
+        audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+        job = _Job(audio=audio, duration=len(audio) / SAMPLE_RATE)
+        self._jobs.put(job)
+        if not job.done.wait(timeout=self.deadline_sec):
+            # 과부하 중 이미 504 를 받은 요청까지 CPU 가 붙잡고 있지 않도록
+            job.cancelled = True
+            raise UpstreamTimeout(f"local-stt: deadline {self.deadline_sec:.0f}s exceeded")
+        if job.error is not None:
+            raise job.error
+        if not job.text:
+            raise RuntimeError("Empty transcription.")
+        return LocalTranscript(job.text, job.duration, time.perf_counter() - t0)
+
+    # ----- 배칭 -----
+    def _batch_loop(self) -> None:
+        while True:
+            first = self._jobs.get()
+            if self._skip(first):
+                continue
+            batch = [first]
+            until = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                left = until - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    job = self._jobs.get(timeout=left)
+                except queue.Empty:
+                    break
+                if not self._skip(job):
+                    batch.append(job)
+            # 모델 하나를 빌려 배치를 처리 (풀이 비면 여기서 대기 → 다음 배치가 더 커진다)
+            model = self._models.get()
+            self._executor.submit(self._run_batch, model, batch)
+
+    def _skip(self, job: _Job) -> bool:
+        if job.cancelled:
+            self.cancelled += 1
+            job.done.set()
+        return job.cancelled
+
+    def _run_batch(self, model, jobs: List[_Job]) -> None:
+        # 모델을 기다리는 동안 데드라인이 지난 것도 뺀다
+        jobs = [j for j in jobs if not self._skip(j)]
+        try:
+            short = [j for j in jobs if j.duration <= SHORT_CLIP_SEC]
+            long = [j for j in jobs if j.duration > SHORT_CLIP_SEC]
+            if short:
+                try:
+                    for j, text in zip(short, self._generate_batch(model, [j.audio for j in short])):
+                        j.text = text
+                except Exception as e:
+                    for j in short:
+                        j.error = e
+                self.batches += 1
+                self.batched_clips += len(short)
+            for j in long:
+                if self._skip(j):
+                    continue
+                try:
+                    segments, _ = model.transcribe(
+                        j.audio, beam_size=self.beam_size, language=self._lang(model), vad_filter=True
+                    )
+                    j.text = " ".join(s.text.strip() for s in segments).strip()
+                except Exception as e:
+                    j.error = e
+        finally:
+            self._models.put(model)
+            for j in jobs:
+                j.done.set()
+
+    def _lang(self, model) -> Optional[str]:
+        return self.language if model.model.is_multilingual else None
+
+    def _generate_batch(self, model, audios: list) -> List[str]:
+        import numpy as np
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_suppressed_tokens
+
+        fe = model.feature_extractor
+        # 30초로 패딩한 log-mel 을 쌓아 한 번에 인코딩
+        feats = np.stack([
+            fe(np.pad(a, (0, max(0, fe.n_samples - len(a))))[: fe.n_samples])[:, : fe.nb_max_frames]
+            for a in audios
+        ])
+        tokenizer = Tokenizer(
+            model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=self._lang(model)
+        )
+        prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+        results = model.model.generate(
+            model.encode(feats),
+            [list(prompt) for _ in audios],
+            beam_size=self.beam_size,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+        )
+        return [tokenizer.decode(r.sequences_ids[0]).strip() for r in results]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "compute_type": self.compute_type,
+            "ready": self._started,
+            "pool_size": self.pool_size,
+            "queued": self._jobs.qsize(),
+            "batches": self.batches,
+            "cancelled": self.cancelled,
+            "avg_batch": round(self.batched_clips / self.batches, 2) if self.batches else None,
+        }
@@ -1,22 +1,50 @@
 # server/main.py
 import os
-import uuid
+import hashlib
 import json
+import uuid
+import asyncio
 import aiofiles
-from typing import Optional
+import anyio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from openai import OpenAI
+from starlette.concurrency import run_in_threadpool
+
+from admission import AdmissionController, AdmissionRejected, client_key, user_key
+from ai_backend import AIBackend, OpenAIBackend, StubBackend
+import openai
+from ai_resilience import UpstreamBadResponse, UpstreamTimeout, UpstreamUnavailable, is_client_error
+from singleflight import SingleFlight, StreamFlight, canonical_key
+from local_stt import LocalSTTUnavailable, LocalWhisperEngine
+from audio_features import SAMPLE_RATE, analyze_fluency, load_audio
+from history_store import get_store
+from stream_capture import CaptureError, CaptureSession
+from analysis_schema import packed_analysis_text_format, validate_packed_field
+import packed_analysis
+from packed_analysis import PackedItem, audio_note
+import request_profiler
+import usage_meter
+from upload_guard import Rejected as UploadRejected, UploadGuardMiddleware, guard as upload_guard
+from resumable_upload import GC_INTERVAL_SEC, SessionError, get_session_store, public_view
+from tts_renditions import FORMATS, MASTER_FORMAT, FormatError, RenditionCache, StreamingTranscoder, negotiate
+import waveform_peaks
+from analyze_routing import Route, analyze_router, router as routing_router
+import level_model
 
 # ← 문제 생성 라우터 (이미 만드신 파일)
+import opic_problems_router
 from opic_problems_router import router as problems_router
+from history_router import progress_router, router as history_router
 
 
 from fastapi import Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 
 
@@ -26,23 +54,122 @@ from fastapi.responses import StreamingResponse
 # OPENAI_API_KEY=sk-...
 # TRANSCRIBE_MODEL=gpt-4o-mini-transcribe
 # ANALYZE_MODEL=gpt-4.1-mini
+# ANALYZE_FAST_MODEL=gpt-4.1-nano   (짧은 답변/자기소개 — 분석 모델 라우팅 규칙은 analyze_routing.py 참고)
 # ALLOWED_ORIGIN=http://localhost:5173
+# STT_DEADLINE_SEC=60 / ANALYZE_DEADLINE_SEC=45 / TTS_DEADLINE_SEC=20
+# STT_HEDGE_PERCENTILE=0.95   (비우면 STT 헤징 끔)
+# AI_BACKEND=openai            (stub: 네트워크 없이 결정적 응답 — 부하테스트용, ai_backend.py 참고)
+# UPLOAD_MAX_CONCURRENCY=8 / UPLOAD_RATE_PER_MIN=6 / UPLOAD_BURST=3     (업스트림 쿼터에 맞춰 조정)
+# TTS_MAX_CONCURRENCY=16 / TTS_RATE_PER_MIN=60 / TTS_BURST=10
+# ADMISSION_MAX_QUEUE=64 / ADMISSION_MAX_WAIT_SEC=30
+# STT_ENGINE=remote            (local: 오프라인 CPU Whisper — local_stt.py 참고, 요청별 stt_engine 으로도 선택)
+# UPLOAD_MAX_MB=25 / UPLOAD_MIN_FREE_MB=512 / UPLOAD_MAX_INFLIGHT=16 / UPLOAD_MAX_WAITING=32   (본문 수신 전 역압 — upload_guard.py)
+# UPLOAD_CHUNK_KB=512 / UPLOAD_SESSION_TTL_SEC=86400 / UPLOAD_FINALIZE_LEASE_SEC=180   (이어받기 업로드 — resumable_upload.py)
+# LEVEL_SKIP_LLM_CONFIDENCE=      (잠정 레벨 확신도가 이 이상이면 분석 LLM 생략 — level_model.py, 비우면 항상 호출)
+# WAVEFORM_BUCKETS=800                                  (재생 화면 파형 피크 — waveform_peaks.py)
+# WEB_CONCURRENCY=4              (python serve.py — 은행/색인을 마스터에서 미리 로드하고 fork 하는 멀티 워커 실행)
+# CAPTURE_MAX_SESSIONS=32 / CAPTURE_MAX_SEC=300   (/ws/capture 동시 녹음 세션 상한, 녹음 1건 길이 상한 — stream_capture.py 참고)
+# HISTORY_DB_PATH=data/opic.sqlite3   (응시 기록 — history_store.py 참고)
+# MODEL_ANSWER_DB_PATH=data/model_answers.sqlite3   (모범 답안 — model_answers.py 배치 작업으로 채움)
+# PACKED_MAX_ITEMS=8 / PACKED_MAX_CHARS=12000   (묶음 분석 한 호출의 상한 — packed_analysis.py 참고)
+# ADMIN_TOKEN=                   (관리 API /admin/usage, /admin/routing — X-Admin-Token 헤더, 비우면 404)
+# PROFILE_ADMIN_TOKEN= / PROFILE_SAMPLE_RATE=0   (요청 프로파일러 — X-Profile-Token 헤더 또는 샘플링, /admin/profiles)
+# USAGE_DB_PATH=data/usage.sqlite3 / USAGE_PRICES=   (업스트림 토큰/비용 집계 — usage_meter.py, /admin/usage)
+# TTS_CACHE_DIR=tts_cache / TTS_CACHE_MAX_MB=256 / TTS_MASTER_FORMAT=wav   (TTS 렌디션 캐시 — tts_renditions.py 참고)
 # ─────────────────────────────────────────────────────────
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe")
 ANALYZE_MODEL = os.getenv("ANALYZE_MODEL", "gpt-4.1-mini")
+TTS_MODEL = os.getenv("TTS_MODEL", "gpt-4o-mini-tts")
 ALLOWED_ORIGIN = os.getenv("ALLOWED_ORIGIN", "http://localhost:5173")
+STT_DEADLINE_SEC = float(os.getenv("STT_DEADLINE_SEC", "60"))
+ANALYZE_DEADLINE_SEC = float(os.getenv("ANALYZE_DEADLINE_SEC", "45"))
+TTS_DEADLINE_SEC = float(os.getenv("TTS_DEADLINE_SEC", "20"))
+STT_HEDGE_PERCENTILE = os.getenv("STT_HEDGE_PERCENTILE", "0.95")
+AI_BACKEND = os.getenv("AI_BACKEND", "openai")
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "8"))
+UPLOAD_RATE_PER_MIN = float(os.getenv("UPLOAD_RATE_PER_MIN", "6"))
+UPLOAD_BURST = int(os.getenv("UPLOAD_BURST", "3"))
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "16"))
+TTS_RATE_PER_MIN = float(os.getenv("TTS_RATE_PER_MIN", "60"))
+TTS_BURST = int(os.getenv("TTS_BURST", "10"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_WAIT_SEC = float(os.getenv("ADMISSION_MAX_WAIT_SEC", "30"))
+STT_ENGINE = os.getenv("STT_ENGINE", "remote")
+CAPTURE_MAX_SESSIONS = int(os.getenv("CAPTURE_MAX_SESSIONS", "32"))
+
+
+def create_backend(kind: str) -> AIBackend:
+    policy = dict(
+        stt_deadline_sec=STT_DEADLINE_SEC,
+        analyze_deadline_sec=ANALYZE_DEADLINE_SEC,
+        tts_deadline_sec=TTS_DEADLINE_SEC,
+        stt_hedge_percentile=float(STT_HEDGE_PERCENTILE) if STT_HEDGE_PERCENTILE else None,
+    )
+    if kind == "stub":
+        return StubBackend.from_env(**policy)
+    if kind == "openai":
+        return OpenAIBackend(api_key=OPENAI_API_KEY, **policy)
+    raise RuntimeError(f"Unknown AI_BACKEND: {kind} (openai|stub)")
+
+
+backend = create_backend(AI_BACKEND)
+
+# 비싼 라우트 입장 제어 (사용자별 토큰 버킷 + 전역 슬롯 + 공정 대기열)
+upload_admission = AdmissionController(
+    "upload", UPLOAD_MAX_CONCURRENCY, UPLOAD_RATE_PER_MIN, UPLOAD_BURST,
+    max_queue=ADMISSION_MAX_QUEUE, max_wait_sec=ADMISSION_MAX_WAIT_SEC,
+)
+tts_admission = AdmissionController(
+    "tts", TTS_MAX_CONCURRENCY, TTS_RATE_PER_MIN, TTS_BURST,
+    max_queue=ADMISSION_MAX_QUEUE, max_wait_sec=ADMISSION_MAX_WAIT_SEC,
+)
 
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY is not set in environment (.env).")
+# 로컬 전사 엔진 — 모델은 워커 시작(lifespan) 또는 첫 요청 때 로드
+local_stt = LocalWhisperEngine.from_env(deadline_sec=STT_DEADLINE_SEC)
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# 동일 내용 동시 요청 합치기 — 업스트림 호출 수가 클라이언트 수가 아닌 "서로 다른 내용" 수에 비례
+analyze_flight = SingleFlight("analyze")
+tts_flight = StreamFlight("tts")
+tts_render_flight = SingleFlight("tts-render")
+
+# TTS 마스터 + 포맷/비트레이트별 렌디션 디스크 캐시
+tts_cache = RenditionCache()
 
 # ─────────────────────────────────────────────────────────
 # FastAPI App
 # ─────────────────────────────────────────────────────────
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 워커 프로세스 안에서 실행 (fork 이후) — 무거운 리소스는 여기서 준비
+    if STT_ENGINE == "local":
+        try:
+            await run_in_threadpool(local_stt.warmup)
+        except LocalSTTUnavailable as e:
+            print("LOCAL STT WARMUP FAILED:", e)
+    gc_task = asyncio.ensure_future(upload_session_gc())
+    yield
+    gc_task.cancel()
+
+
+async def upload_session_gc():
+    """버려진 이어받기 세션 정리 (워커마다 돌아도 삭제는 멱등)"""
+    while True:
+        try:
+            stats = await run_in_threadpool(get_session_store().gc)
+            if stats["expired"]:
+                print("UPLOAD SESSIONS EXPIRED:", stats)
+        except Exception as e:
+            print("UPLOAD SESSION GC FAILED:", e)
+        await asyncio.sleep(GC_INTERVAL_SEC)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# 업로드 역압 — 본문을 읽기 전에 크기/디스크/동시 수신 수로 거절 (upload_guard.py 참고)
+# CORS 보다 안쪽에 둬야 거절 응답에도 CORS 헤더가 붙어 브라우저가 Retry-After 를 읽는다
+app.add_middleware(UploadGuardMiddleware)
 
 # CORS — 프론트 로컬 환경 2개도 함께 허용(원하면 제거 가능)
 allow_origins = {ALLOWED_ORIGIN, "http://localhost:5173", "http://127.0.0.1:5173"}
@@ -54,8 +181,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 업스트림 사용량 집계 범위 (엔드포인트/사용자) — usage_meter.py 참고
+app.add_middleware(usage_meter.UsageScopeMiddleware)
+
+# 요청 프로파일러 — 토큰/샘플링 비율이 없으면 등록하지 않는다 (request_profiler.py 참고)
+if request_profiler.enabled():
+    app.add_middleware(request_profiler.ProfileMiddleware)
+
 # ✅ 문제 생성 라우터 연결 (여기가 핵심)
 app.include_router(problems_router)
+app.include_router(history_router)
+app.include_router(progress_router)
+app.include_router(request_profiler.router)
+app.include_router(usage_meter.router)
+app.include_router(routing_router)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # 부하 차단: 429 + 정확한 Retry-After (정수 초, 올림)
+    retry_after = max(1, int(exc.retry_after + 0.999))
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many requests: {exc.reason}", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
 
 
 # ─────────────────────────────────────────────────────────
@@ -67,147 +217,751 @@ class AnalysisResult(BaseModel):
     level_guess: str
     metrics: dict
     tips: list[str]
+    attempt_id: Optional[int] = None   # 기록 저장 실패 시 None (/api/feedback/{attempt_id})
+    recording_id: Optional[str] = None
+    provisional_level: Optional[str] = None         # 로컬 모델의 즉시 추정 (level_model.py, 모델 없으면 None)
+    provisional_confidence: Optional[float] = None
+    level_source: str = "llm"                       # local: 확신도가 높아 분석 LLM 을 건너뜀 (요약/팁 없음)
 
 
-# ─────────────────────────────────────────────────────────
-# Helpers
-# ─────────────────────────────────────────────────────────
-def extract_output_text(resp) -> str:
-    """
-    OpenAI Responses API 응답에서 텍스트를 최대한 안전하게 뽑아냅니다.
-    SDK 버전에 따라 구조가 달라질 수 있어 여러 경로를 시도합니다.
-    """
-    # 1) 최신 SDK 속성
-    out = getattr(resp, "output_text", None)
-    if isinstance(out, str) and out.strip():
-        return out
-
-    # 2) 객체 속성 탐색 (output -> content -> output_text)
-    try:
-        output = getattr(resp, "output", None)
-        if output and isinstance(output, list):
-            for item in output:
-                content = item.get("content") if isinstance(item, dict) else getattr(item, "content", None)
-                if content and isinstance(content, list):
-                    for c in content:
-                        # 통상 {"type": "output_text", "text": "..."}
-                        if (isinstance(c, dict) and c.get("type") in ("output_text", "text") and c.get("text")):
-                            return c["text"]
-                        # 혹시 객체 속성 형태일 때
-                        if hasattr(c, "type") and getattr(c, "type") in ("output_text", "text"):
-                            t = getattr(c, "text", None)
-                            if t:
-                                return t
-    except Exception:
-        pass
+class UploadSessionBody(BaseModel):
+    total_size: int = Field(..., gt=0)          # 녹음 전체 바이트
+    filename: Optional[str] = "rec.webm"        # 확장자만 쓴다
+    prompt: Optional[str] = None                # 이하 /upload 의 Form 필드와 같음
+    target_len_sec: Optional[int] = 60
+    stt_engine: Optional[str] = None
+    exam_id: Optional[str] = None
+    question_id: Optional[str] = None
+    question_type: Optional[str] = None
+    defer_analysis: bool = False
+
+
+class PackedAnswer(BaseModel):
+    # 전사문 — recording_id 가 있으면 보내지 않아도 되고, 보내도 업로드 때 서버가 저장한 전사문/파형 측정값을 쓴다
+    text: Optional[str] = Field(None, min_length=1, max_length=packed_analysis.PACKED_MAX_ITEM_CHARS)
+    prompt: Optional[str] = None
+    question_type: Optional[str] = None
+    question_id: Optional[str] = None
+    recording_id: Optional[str] = None          # defer_analysis 업로드가 돌려준 값
+    target_len_sec: Optional[int] = None        # 비우면 묶음 공통값
+
 
-    # 3) 마지막 수단: 문자열화
-    return str(resp)
+class PackedAnalyzeBody(BaseModel):
+    exam_id: Optional[str] = None
+    target_len_sec: int = 60
+    items: List[PackedAnswer] = Field(..., min_length=1, max_length=30)
+
+
+class PackedAnalyzeResult(BaseModel):
+    results: List[AnalysisResult]              # items 와 같은 순서
+    calls: int                                 # 업스트림 분석 호출 수 (단건 보충 포함)
 
 
 # ─────────────────────────────────────────────────────────
-# Routes
+# Helpers
 # ─────────────────────────────────────────────────────────
-@app.get("/health")
-def health():
-    return {"ok": True}
+async def fluency_and_peaks(save_path: str, samples, sr: int):
+    """디코딩한 샘플 한 벌로 유창성 분석 + 재생 화면 파형 피크 (피크는 백그라운드 — 응답을 기다리게 하지 않는다)"""
+    waveform_peaks.jobs.submit(save_path, samples, sr)
+    return await run_in_threadpool(analyze_fluency, samples, sr)
 
-@app.post("/upload", response_model=AnalysisResult)
-async def upload_audio(
-    audio: UploadFile = File(...),
-    prompt: Optional[str] = Form(None),        # (선택) 문제 텍스트
-    target_len_sec: Optional[int] = Form(60),  # (선택) 목표 길이(초)
-):
-    # 1) 파일 저장
-    os.makedirs("uploads", exist_ok=True)
-    uid = str(uuid.uuid4())[:8]
-    ext = os.path.splitext(audio.filename or "rec.webm")[1] or ".webm"
-    save_path = f"uploads/{uid}{ext}"
 
+async def fluency_profile(save_path: str):
+    """파형 유창성 분석 — 실패(디코딩 불가 등)해도 업로드는 계속 진행"""
     try:
-        async with aiofiles.open(save_path, "wb") as f:
-            content = await audio.read()
-            await f.write(content)
+        samples, sr = await run_in_threadpool(load_audio, save_path)
+        return await fluency_and_peaks(save_path, samples, sr)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
+        print("FLUENCY ANALYSIS SKIPPED:", e)
+        return None
 
-    # 2) 전사 (Speech-to-Text)
-    try:
-        with open(save_path, "rb") as f:
-            tr = client.audio.transcriptions.create(
-                model=TRANSCRIBE_MODEL,
-                file=f,
-                response_format="json",  # 'json' 또는 'text' 지원
-                # language="ko",
+
+def upstream_error(exc: Exception, what: str) -> HTTPException:
+    """업스트림 장애를 상태코드로 구분 (503: 일시 장애/fail fast, 504: 데드라인 초과, 502: 업스트림 거절/잘못된 응답, 400: 입력 문제)"""
+    if isinstance(exc, UpstreamUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail=f"{what} temporarily unavailable: {exc}",
+            headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))},
+        )
+    if isinstance(exc, UpstreamTimeout):
+        return HTTPException(status_code=504, detail=f"{what} timed out: {exc}")
+    if isinstance(exc, UpstreamBadResponse):
+        return HTTPException(status_code=502, detail=f"{what} returned an invalid response: {exc}")
+    if isinstance(exc, openai.APIError) and not is_client_error(exc):
+        # 인증/모델/권한 등 업스트림 쪽 문제 — 학생 입력 탓이 아니다
+        return HTTPException(status_code=502, detail=f"{what} upstream error: {exc}")
+    return HTTPException(status_code=400, detail=f"{what} failed: {exc}")
+
+
+def transcriber(stt_engine: Optional[str]) -> Callable[[str], str]:
+    """remote|local — 비우면 STT_ENGINE. 반환 함수는 블로킹 (스레드풀에서 호출)"""
+    engine = stt_engine or STT_ENGINE
+    if engine not in ("remote", "local"):
+        raise HTTPException(status_code=400, detail="Invalid stt_engine (remote|local)")
+    if engine == "local":
+        return local_stt.transcribe
+    return lambda path: backend.transcribe(path, model=TRANSCRIBE_MODEL)
+
+
+def transcription_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, LocalSTTUnavailable):
+        return HTTPException(status_code=503, detail=f"Local STT engine unavailable: {exc}")
+    return upstream_error(exc, "Transcription")
+
+
+def routed_analyze(route: Route, system_prompt: str, user_prompt: str, **kwargs):
+    """라우팅된 모델/출력 예산으로 분석 1회 — 같은 입력이 진행 중이면 합류 (기록은 실제 호출만)"""
+    def _call() -> dict:
+        with analyze_router.timed(route):
+            return backend.analyze(
+                system_prompt, user_prompt, model=route.model, max_output_tokens=route.max_output_tokens, **kwargs
             )
-        # SDK에 따라 dict로 올 수 있어 안전 추출
-        text = getattr(tr, "text", None) or (tr.get("text") if isinstance(tr, dict) else "")
-        if not text:
-            raise RuntimeError(f"Empty transcription. Raw: {tr}")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Transcription failed: {e}")
 
-    # 3) 분석 (Responses API) — JSON만 반환하도록 강력 지시
+    return analyze_flight.do(
+        canonical_key(route.model, system_prompt, user_prompt), lambda: run_in_threadpool(_call)
+    )
+
+
+async def analyze_transcript(
+    text: str,
+    prompt: Optional[str],
+    target_len_sec: Optional[int],
+    signal_metrics: dict,
+    question_type: Optional[str] = None,
+) -> dict:
+    """답변 1개 분석 (Responses API) — AnalysisOutput 스키마로 출력 강제(structured output)"""
+    # 스트리밍하면서 필드가 완성되는 즉시 검증한다
     system_prompt = (
         "You are an OPIC-style evaluator for Korean EFL speakers. "
-        "Given a transcript, return ONLY JSON (no code fences). "
-        "Keys: summary, level_guess, metrics{wpm,filler_rate,grammar_issues,vocab_range,spk_len_sec}, tips[]."
+        "Given a transcript, fill in the analysis: summary, level_guess, "
+        "metrics{wpm,filler_rate,grammar_issues,vocab_range,spk_len_sec}, tips[]."
     )
     user_prompt = (
         f"Topic/Prompt (optional): {prompt or 'N/A'}\n"
         f"Target speaking length (sec): {target_len_sec}\n"
         f"Transcript:\n{text}\n"
-        "Return ONLY JSON. No other text."
-    )
+    ) + audio_note(signal_metrics)
+
+    try:
+        return await routed_analyze(analyze_router.choose(text, question_type), system_prompt, user_prompt)
+    except Exception as e:
+        raise upstream_error(e, "Analyze")
+
 
+async def record_result(
+    result: AnalysisResult,
+    *,
+    user: str,
+    save_path: Optional[str],
+    prompt: Optional[str],
+    exam_id: Optional[str],
+    question_id: Optional[str],
+    question_type: Optional[str],
+) -> None:
+    """응시 기록 저장 → result.attempt_id. 실패해도 분석 결과는 돌려준다"""
     try:
-        resp = client.responses.create(
-            model=ANALYZE_MODEL,
-            input=[
-                {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
-                {"role": "user",   "content": [{"type": "input_text", "text": user_prompt}]},
-            ],
+        result.attempt_id = await run_in_threadpool(
+            get_store().record_attempt,
+            user_id=user,
+            exam_id=exam_id,
+            question_id=question_id,
+            question_type=question_type,
+            question_text=prompt,
+            recording_id=result.recording_id,
+            audio_path=save_path,
+            transcript=result.text,
+            summary=result.summary,
+            level=result.level_guess,
+            metrics=result.metrics,
+            tips=result.tips,
+            seen_qid=int(question_id) if question_id and question_id.isdigit()
+            and int(question_id) < opic_problems_router.snapshot().qids.size else None,
         )
-        out_text = extract_output_text(resp)
-        data = json.loads(out_text)
-    except json.JSONDecodeError as e:
-        # 모델이 JSON을 벗어났을 때 디버깅 도우미
-        print("ANALYZE PARSE ERROR RAW:", out_text)
-        raise HTTPException(status_code=400, detail=f"Analyze failed: cannot parse JSON ({e})")
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Analyze failed: {e}")
+        print("ATTEMPT HISTORY NOT SAVED:", e)
 
-    return AnalysisResult(
+
+async def analyze_and_record(
+    *,
+    user: str,
+    uid: str,
+    save_path: str,
+    text: str,
+    profile,
+    prompt: Optional[str],
+    target_len_sec: Optional[int],
+    exam_id: Optional[str],
+    question_id: Optional[str],
+    question_type: Optional[str],
+    on_provisional: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> AnalysisResult:
+    """전사 이후 단계 (분석 → 응시 기록). /upload 와 /ws/capture 가 공유한다."""
+    signal_metrics = profile.metrics(word_count=len(text.split())) if profile else {}
+
+    # 3) 잠정 레벨 (수 µs) → 확신도가 충분하면 분석 LLM 생략
+    guess = level_model.provisional(text, signal_metrics, question_type)
+    if guess is not None and on_provisional is not None:
+        await on_provisional(guess)
+    if level_model.should_skip_llm(guess):
+        data = {"summary": "", "level_guess": guess["level"], "metrics": {"level_source": "local"}, "tips": []}
+    else:
+        data = await analyze_transcript(text, prompt, target_len_sec, signal_metrics, question_type)
+    result = AnalysisResult(
         text=text,
         summary=data.get("summary", ""),
         level_guess=data.get("level_guess", ""),
-        metrics=data.get("metrics", {}),
+        metrics={**data.get("metrics", {}), **signal_metrics},
         tips=data.get("tips", []),
+        recording_id=uid,
+        provisional_level=guess and guess["level"],
+        provisional_confidence=guess and guess["confidence"],
+        level_source=data.get("metrics", {}).get("level_source", "llm"),
+    )
+
+    # 4) 응시 기록 저장
+    await record_result(
+        result, user=user, save_path=save_path, prompt=prompt,
+        exam_id=exam_id, question_id=question_id, question_type=question_type,
+    )
+    return result
+
+
+# ─────────────────────────────────────────────────────────
+# Routes
+# ─────────────────────────────────────────────────────────
+@app.get("/health")
+def health():
+    return {
+        "ok": True,
+        "admission": [upload_admission.stats(), tts_admission.stats()],
+        "singleflight": [analyze_flight.stats(), tts_flight.stats(), tts_render_flight.stats()],
+        "tts_cache": tts_cache.stats(),
+        "usage": usage_meter.meter.stats(),
+        "analyze_routing": analyze_router.stats(),
+        "level_model": level_model.stats(),
+        "upload_guard": upload_guard.stats(),
+        "upload_sessions": get_session_store().counts(),
+        "local_stt": local_stt.stats(),
+        "waveform_peaks": waveform_peaks.jobs.stats(),
+    }
+
+@app.post("/upload", response_model=AnalysisResult)
+async def upload_audio(
+    request: Request,
+    audio: UploadFile = File(...),
+    prompt: Optional[str] = Form(None),        # (선택) 문제 텍스트
+    target_len_sec: Optional[int] = Form(60),  # (선택) 목표 길이(초)
+    stt_engine: Optional[str] = Form(None),    # (선택) remote|local — 비우면 STT_ENGINE
+    exam_id: Optional[str] = Form(None),       # (선택) 응시 기록용 시험/문항 식별자
+    question_id: Optional[str] = Form(None),     # 생성 API 의 qid 를 보내면 '푼 문항' 비트셋에 반영
+    question_type: Optional[str] = Form(None), # (선택) description|routine|comparison|experience|11~15
+    defer_analysis: bool = Form(False),        # 전사/파형 측정까지만 — 분석은 /analyze/packed 로 모아서
+):
+    async with upload_admission.slot(client_key(request)):
+        # 1) 파일 저장
+        os.makedirs("uploads", exist_ok=True)
+        uid = str(uuid.uuid4())[:8]
+        ext = os.path.splitext(audio.filename or "rec.webm")[1] or ".webm"
+        save_path = f"uploads/{uid}{ext}"
+
+        try:
+            async with aiofiles.open(save_path, "wb") as f:
+                content = await audio.read()
+                await f.write(content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
+
+        return await process_recording(
+            user=user_key(request), uid=uid, save_path=save_path, prompt=prompt, target_len_sec=target_len_sec,
+            stt_engine=stt_engine, exam_id=exam_id, question_id=question_id, question_type=question_type,
+            defer_analysis=defer_analysis,
+        )
+
+
+async def process_recording(
+    *,
+    user: str,
+    uid: str,
+    save_path: str,
+    prompt: Optional[str] = None,
+    target_len_sec: Optional[int] = 60,
+    stt_engine: Optional[str] = None,
+    exam_id: Optional[str] = None,
+    question_id: Optional[str] = None,
+    question_type: Optional[str] = None,
+    defer_analysis: bool = False,
+) -> AnalysisResult:
+    """저장된 녹음 → 전사 → 분석 → 기록. /upload 와 이어받기 업로드 finalize 가 공유한다."""
+    # 파형 분석은 전사와 병렬로 (전사보다 훨씬 빨리 끝난다)
+    fluency_task = asyncio.ensure_future(fluency_profile(save_path))
+
+    # 2) 전사 (Speech-to-Text) — 원격(OpenAI/stub) 또는 로컬 CPU 엔진
+    transcribe = transcriber(stt_engine)
+    try:
+        text = await run_in_threadpool(transcribe, save_path)
+    except Exception as e:
+        raise transcription_error(e)
+
+    profile = await fluency_task
+    if defer_analysis:
+        # 기록은 묶음 분석 때 남긴다 — 소유자/전사문/측정값을 적어 두고 recording_id 로 연결
+        signal_metrics = profile.metrics(word_count=len(text.split())) if profile else {}
+        await run_in_threadpool(
+            get_store().defer_recording,
+            user_id=user, recording_id=uid, audio_path=save_path, transcript=text, metrics=signal_metrics,
+        )
+        guess = level_model.provisional(text, signal_metrics, question_type)
+        return AnalysisResult(
+            text=text, summary="", level_guess="", metrics=signal_metrics, tips=[], recording_id=uid,
+            provisional_level=guess and guess["level"], provisional_confidence=guess and guess["confidence"],
+        )
+    return await analyze_and_record(
+        user=user, uid=uid, save_path=save_path, text=text, profile=profile,
+        prompt=prompt, target_len_sec=target_len_sec,
+        exam_id=exam_id, question_id=question_id, question_type=question_type,
     )
 
 
+# ─────────────────────────────────────────────────────────
+# 이어받기 업로드 (resumable_upload.py)
+# ─────────────────────────────────────────────────────────
+def session_error(e: SessionError) -> HTTPException:
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return HTTPException(status_code=e.status, detail=e.detail, headers=headers)
+
+
+@app.post("/upload/sessions")
+async def create_upload_session(body: UploadSessionBody, request: Request):
+    if body.total_size > upload_guard.max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload too large (max {upload_guard.max_bytes >> 20} MB)")
+    try:
+        upload_guard.check_disk(body.total_size)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status, detail=e.detail, headers={"Retry-After": str(int(e.retry_after))})
+    transcriber(body.stt_engine)   # 잘못된 엔진은 다 올리기 전에 400
+    ext = os.path.splitext(body.filename or "rec.webm")[1] or ".webm"
+    if not ext[1:].isalnum() or len(ext) > 8:
+        raise HTTPException(status_code=400, detail="Invalid filename extension")
+    meta = body.model_dump(exclude={"total_size", "filename"})
+    s = await run_in_threadpool(get_session_store().create, user_key(request), ext, body.total_size, meta)
+    return public_view(s)
+
+
+@app.get("/upload/sessions/{session_id}")
+async def get_upload_session(session_id: str, request: Request):
+    """끊긴 뒤 이어 보낼 위치 — offset / next_index"""
+    try:
+        s = await run_in_threadpool(get_session_store().get, session_id, user_key(request))
+    except SessionError as e:
+        raise session_error(e)
+    return JSONResponse(public_view(s), headers={"Upload-Offset": str(s["received"])})
+
+
+@app.put("/upload/sessions/{session_id}/chunks/{index}")
+async def put_upload_chunk(session_id: str, index: int, request: Request):
+    """조각 1개 — 본문은 원시 바이트, X-Chunk-Sha256 으로 검증한 뒤 최종 파일 제자리에 쓴다"""
+    checksum = (request.headers.get("x-chunk-sha256") or "").lower()
+    if len(checksum) != 64:
+        raise HTTPException(status_code=400, detail="X-Chunk-Sha256 header required")
+    if index < 0:
+        raise HTTPException(status_code=400, detail="Invalid chunk index")
+    store = get_session_store()
+    user = user_key(request)
+    try:
+        s = await run_in_threadpool(store.get, session_id, user)
+    except SessionError as e:
+        raise session_error(e)
+    declared = request.headers.get("upload-offset")
+    if declared is not None and declared != str(index * s["chunk_size"]):
+        raise HTTPException(status_code=400, detail="Upload-Offset does not match chunk index")
+
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > s["chunk_size"]:
+            raise HTTPException(status_code=413, detail=f"Chunk larger than chunk_size ({s['chunk_size']})")
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise HTTPException(status_code=422, detail="Chunk checksum mismatch",
+                            headers={"Upload-Offset": str(s["received"])})
+    try:
+        s = await run_in_threadpool(store.write_chunk, session_id, user, index, bytes(data))
+    except SessionError as e:
+        raise session_error(e)
+    return JSONResponse(public_view(s), headers={"Upload-Offset": str(s["received"])})
+
+
+@app.post("/upload/sessions/{session_id}/finalize", response_model=AnalysisResult)
+async def finalize_upload_session(session_id: str, request: Request):
+    """다 받은 녹음을 /upload 와 같은 파이프라인으로. 재시도하면 저장된 결과를 그대로 돌려준다"""
+    store = get_session_store()
+    user = user_key(request)
+    try:
+        s = await run_in_threadpool(store.begin_finalize, session_id, user)
+    except SessionError as e:
+        raise session_error(e)
+    if s["state"] == "done":
+        return AnalysisResult(**json.loads(s["result"]))
+
+    result = None
+    try:
+        async with upload_admission.slot(client_key(request)):
+            result = await process_recording(
+                user=user, uid=public_view(s)["recording_id"], save_path=s["path"], **json.loads(s["meta"])
+            )
+    finally:
+        # 실패(429/5xx/연결 끊김 포함)면 open 으로 되돌려 finalize 만 다시 하면 되게 — 취소돼도 끝까지 실행.
+        # 워커가 죽어 여기까지 못 오면 임대 만료 후 다음 finalize 가 넘겨받는다
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(
+                store.end_finalize, session_id, s["updated_at"], result.model_dump() if result else None
+            )
+    return result
+
+
+@app.delete("/upload/sessions/{session_id}", status_code=204)
+async def delete_upload_session(session_id: str, request: Request):
+    try:
+        await run_in_threadpool(get_session_store().delete, session_id, user_key(request))
+    except SessionError as e:
+        raise session_error(e)
+    return Response(status_code=204)
+
+
+@app.post("/analyze/packed", response_model=PackedAnalyzeResult)
+async def analyze_packed(body: PackedAnalyzeBody, request: Request):
+    """
+    한 시험의 답변 여러 개를 묶어서 분석 — 채점 지침을 답변마다 다시 보내지 않는다.
+    full15 기준 분석 호출 15회 → 2회 (PACKED_MAX_ITEMS=8). 결과는 items 순서대로, 답변마다 응시 기록 1건.
+    묶음 결과에서 빠진 답변만 단건 분석으로 보충한다.
+    recording_id 는 본인의 defer_analysis 업로드만 (아니면 404) — 전사문/파형 측정값은 그 업로드 때 저장한 값.
+    녹음 없는 답변은 text 로만 채점한다. 이미 기록된 녹음(재시도)은 다시 분석하지 않고 그 기록을 돌려준다.
+    """
+    user = user_key(request)
+    store = get_store()
+    answers: List[Dict[str, Any]] = []     # 답변별 {audio_path, transcript, metrics}
+    recorded: Dict[int, AnalysisResult] = {}
+    for i, a in enumerate(body.items):
+        if not a.recording_id:
+            if not a.text:
+                raise HTTPException(status_code=400, detail=f"items[{i}]: text or recording_id required")
+            answers.append({"audio_path": None, "transcript": a.text, "metrics": {}})
+            continue
+        deferred = await run_in_threadpool(store.get_deferred, user, a.recording_id)
+        if deferred is None:
+            raise HTTPException(status_code=404, detail=f"Recording not found: {a.recording_id}")
+        answers.append(deferred)
+        prev = await run_in_threadpool(store.get_attempt_by_recording, user, a.recording_id)
+        if prev is not None:
+            recorded[i] = AnalysisResult(
+                text=prev["transcript"], summary=prev["summary"] or "", level_guess=prev["level"] or "",
+                metrics=prev["metrics"], tips=prev["tips"], attempt_id=prev["id"], recording_id=a.recording_id,
+            )
+
+    todo = [i for i in range(len(body.items)) if i not in recorded]
+    items = [
+        PackedItem(
+            text=answers[i]["transcript"], prompt=body.items[i].prompt, question_type=body.items[i].question_type,
+            target_len_sec=body.items[i].target_len_sec or body.target_len_sec, signal=answers[i]["metrics"],
+        )
+        for i in todo
+    ]
+    calls = 0
+
+    async def run_pack(pack: List[int]) -> List[Optional[dict]]:
+        nonlocal calls
+        system_prompt, user_prompt = packed_analysis.SYSTEM_PROMPT, packed_analysis.user_prompt(items, pack)
+        calls += 1
+        try:
+            route = analyze_router.choose_pack([(items[i].text, items[i].question_type) for i in pack])
+            data = await routed_analyze(
+                route, system_prompt, user_prompt,
+                text_format=packed_analysis_text_format(len(pack)), validator=validate_packed_field,
+                schema_retries=0,   # 묶음이 깨지면 다시 묶어 보내지 않고 아래에서 단건으로
+            )
+        except (UpstreamUnavailable, UpstreamTimeout) as e:
+            raise upstream_error(e, "Analyze")   # 장애 중에 단건으로 쪼개 다시 두드리지 않는다
+        except Exception as e:
+            print("PACKED ANALYSIS FAILED, falling back per item:", e)
+            return [None] * len(pack)
+        return packed_analysis.split_results(data, len(pack))
+
+    outs: List[Optional[dict]] = [None] * len(items)
+    if items:
+        async with upload_admission.slot(client_key(request)):
+            packs = packed_analysis.make_packs(items)
+            for pack, got in zip(packs, await asyncio.gather(*(run_pack(p) for p in packs))):
+                for i, data in zip(pack, got):
+                    outs[i] = data
+
+            missing = [i for i, d in enumerate(outs) if d is None]
+            if missing:
+                calls += len(missing)
+                filled = await asyncio.gather(*(
+                    analyze_transcript(
+                        items[i].text, items[i].prompt, items[i].target_len_sec, items[i].signal,
+                        items[i].question_type,
+                    )
+                    for i in missing
+                ))
+                for i, data in zip(missing, filled):
+                    outs[i] = data
+
+    for i, data in zip(todo, outs):
+        a = body.items[i]
+        result = AnalysisResult(
+            text=answers[i]["transcript"],
+            summary=data.get("summary", ""),
+            level_guess=data.get("level_guess", ""),
+            metrics={**data.get("metrics", {}), **answers[i]["metrics"]},
+            tips=data.get("tips", []),
+            recording_id=a.recording_id,
+        )
+        await record_result(
+            result, user=user, save_path=answers[i]["audio_path"], prompt=a.prompt,
+            exam_id=body.exam_id, question_id=a.question_id, question_type=a.question_type,
+        )
+        recorded[i] = result
+    return PackedAnalyzeResult(results=[recorded[i] for i in range(len(body.items))], calls=calls)
+
+
+capture_sessions = 0
+
+
+def capture_control(msg: dict) -> dict:
+    """텍스트 제어 메시지 → JSON 객체 (깨진 JSON/객체가 아닌 값은 400)"""
+    try:
+        data = json.loads(msg.get("text") or "")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Control messages must be JSON objects")
+    return data
+
+
+@app.websocket("/ws/capture")
+async def capture_ws(ws: WebSocket):
+    """
+    녹음하면서 업로드 — 쉼 단위로 잘라 바로 전사, 정지하면 마지막 구간만 전사하고 분석.
+      1) client → {"type":"start", "mime":"audio/webm", "prompt", "target_len_sec", "stt_engine",
+                   "exam_id", "question_id", "question_type"}
+         (mime "audio/pcm" 이면 16kHz mono s16le 원시 샘플)
+      2) client → 바이너리 프레임 (MediaRecorder 조각 그대로)
+         server → {"type":"partial", "segment", "start_sec", "end_sec", "text", "transcript"}
+      3) client → {"type":"stop"}
+         server → {"type":"final", ...AnalysisResult}  또는 {"type":"error", "status", "detail"}
+    사용자 식별은 X-User-Id 헤더 → 없으면 ?user_id= (브라우저 WebSocket 은 헤더를 못 붙인다)
+    """
+    global capture_sessions
+    await ws.accept()
+    if capture_sessions >= CAPTURE_MAX_SESSIONS:
+        await ws.send_json({"type": "error", "status": 503, "detail": "Too many capture sessions"})
+        await ws.close(code=1013)
+        return
+    try:
+        upload_guard.check_disk()   # 녹음은 디스크에 쌓이므로 /upload 와 같은 워터마크
+    except UploadRejected as e:
+        await ws.send_json({"type": "error", "status": e.status, "detail": e.detail,
+                            "retry_after": int(e.retry_after or 60)})
+        await ws.close(code=1013)
+        return
+    user = user_key(ws)
+    if not ws.headers.get("x-user-id") and ws.query_params.get("user_id"):
+        user = f"u:{ws.query_params['user_id'][:64]}"
+        usage_meter.bind(user=user)
+
+    capture_sessions += 1
+    session: Optional[CaptureSession] = None
+    result: Optional[AnalysisResult] = None
+    try:
+        msg = await ws.receive()
+        if msg["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(msg.get("code", 1000))
+        start = capture_control(msg)
+        if start.get("type") != "start":
+            raise HTTPException(status_code=400, detail="First message must be {\"type\": \"start\"}")
+        transcribe = transcriber(start.get("stt_engine"))
+        # 녹음 1건 = /upload 1건과 같은 토큰 1개 (구간 전사도 업스트림 호출이므로 시작할 때 미리 낸다)
+        upload_admission.charge(client_key(ws))
+        uid = str(uuid.uuid4())[:8]
+        session = CaptureSession(uid, start.get("mime") or "audio/webm", transcribe, ws.send_json,
+                                 max_bytes=upload_guard.max_bytes)
+        await ws.send_json({"type": "started", "recording_id": uid})
+
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
+            if msg.get("bytes"):
+                session.feed(msg["bytes"])
+            elif msg.get("text") and capture_control(msg).get("type") == "stop":
+                break
+
+        # 정지 — 마지막 구간 전사 + 분석 (분석 단계는 슬롯만 — 토큰은 시작할 때 냈다)
+        try:
+            samples = await session.finish()
+        except Exception as e:
+            raise transcription_error(e)
+        async with upload_admission.slot(client_key(ws), charge=False):
+            profile = (
+                await fluency_and_peaks(session.save_path, samples, SAMPLE_RATE)
+                if samples.size else None
+            )
+            text = session.transcript
+            if not text:
+                raise HTTPException(status_code=400, detail="Transcription failed: Empty transcription.")
+            result = await analyze_and_record(
+                user=user, uid=uid, save_path=session.save_path, text=text, profile=profile,
+                prompt=start.get("prompt"), target_len_sec=start.get("target_len_sec", 60),
+                exam_id=start.get("exam_id"), question_id=start.get("question_id"),
+                question_type=start.get("question_type"),
+                on_provisional=lambda g: ws.send_json({"type": "provisional", **g}),
+            )
+        await ws.send_json({"type": "final", **result.model_dump()})
+        await ws.close()
+    except WebSocketDisconnect:
+        pass
+    except (HTTPException, AdmissionRejected, CaptureError) as e:
+        if isinstance(e, HTTPException):
+            payload = {"status": e.status_code, "detail": e.detail}
+        elif isinstance(e, AdmissionRejected):
+            payload = {"status": 429, "detail": f"Too many requests: {e.reason}",
+                       "retry_after": max(1, int(e.retry_after + 0.999))}
+        else:
+            payload = {"status": e.status, "detail": str(e)}
+        await ws.send_json({"type": "error", **payload})
+        await ws.close(code=1011)
+    finally:
+        # 어떤 예외로 끝나든 디코더 스레드/원본 파일을 놓지 않도록 (finish 뒤에 불러도 무해).
+        # 분석까지 끝나지 않은 녹음은 기록에 남지 않으므로 파일도 지운다 (남기면 uploads/ 에 쌓이기만 한다)
+        if session is not None:
+            session.abort()
+            if result is None:
+                session.discard()
+        capture_sessions -= 1
+
+
+async def _stream_master(bc, key: str):
+    """합성되는 대로 흘려보내고, 끝까지 받았으면 마스터로 저장"""
+    async for chunk in bc.subscribe():
+        yield chunk
+    path = tts_cache.master_path(key)
+    if not path.exists():
+        await run_in_threadpool(tts_cache.write, path, b"".join(bc.chunks))
+
+
+async def _stream_rendition(bc, key: str, fmt: str, kbps: int):
+    """합성되는 마스터를 받는 대로 변환해 흘려보내고, 끝까지 받았으면 마스터/렌디션 둘 다 저장"""
+    loop = asyncio.get_running_loop()
+    encoded: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+    encoder = StreamingTranscoder(fmt, kbps, lambda b: loop.call_soon_threadsafe(encoded.put_nowait, b))
+
+    async def pump() -> None:
+        try:
+            async for chunk in bc.subscribe():
+                encoder.feed(chunk)
+        finally:
+            encoder.close()
+
+    feeding = asyncio.ensure_future(pump())
+    parts: List[bytes] = []
+    try:
+        while True:
+            data = await encoded.get()
+            if data is None:
+                break
+            parts.append(data)
+            yield data
+        await feeding                   # 업스트림이 중간에 끊겼으면 여기서 예외 (잘린 렌디션은 저장 안 함)
+        if encoder.error is not None:
+            raise encoder.error
+    finally:
+        encoder.close()                 # 클라이언트가 먼저 끊어도 변환 스레드가 끝나게
+        if not feeding.done():
+            feeding.cancel()
+        elif not feeding.cancelled():
+            feeding.exception()         # 'exception was never retrieved' 경고 방지
+
+    mpath = tts_cache.master_path(key)
+    if not mpath.exists():
+        await run_in_threadpool(tts_cache.write, mpath, b"".join(bc.chunks))
+    await run_in_threadpool(tts_cache.write, tts_cache.rendition_path(key, fmt, kbps), b"".join(parts))
+    tts_cache.transcodes += 1
+
+
+class _LeasedFileResponse(FileResponse):
+    """tts_cache.checkout() 링크를 보낸 뒤 지운다 — Range 오류/연결 끊김으로 끝나도"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            tts_cache.release(Path(self.path))
 
 
 @app.get("/tts")
-def tts(
+async def tts(
+    request: Request,
     text: str = Query(..., min_length=1, description="읽을 텍스트"),
     voice: str = Query("alloy"),
-    audio_format: str = Query("mp3"),
+    audio_format: Optional[str] = Query(None, description="mp3|opus|webm|aac|wav — 비우면 Accept 헤더로 결정"),
+    bitrate: Optional[int] = Query(None, ge=8, le=320, description="kbps (비우면 포맷 기본값, Save-Data: on 이면 저대역)"),
 ):
     """
-    고음질 TTS. mp3 스트리밍으로 반환.
-    Vercel/로컬 모두 잘 동작. 브라우저 <audio src="/tts?text=..."> 로 재생.
+    고음질 TTS. 브라우저 <audio src="/tts?text=..."> 로 재생.
+    (text, voice) 당 마스터 1개만 합성하고, 요청 포맷/비트레이트는 서버에서 변환해 캐시한다.
     """
     try:
-        # SDK v1 기준 (openai 1.x)
-        # 스트리밍이 가능한 버전
-        with client.audio.speech.with_streaming_response.create(
-            model="gpt-4o-mini-tts",
-            voice=voice,
-            input=text,
-            format=audio_format,
-        ) as resp:
-            return StreamingResponse(resp.iter_bytes(), media_type="audio/mpeg")
+        fmt, kbps = negotiate(
+            audio_format, bitrate, request.headers.get("accept"),
+            save_data=request.headers.get("save-data", "").lower() == "on",
+        )
+    except FormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = FORMATS[fmt].media_type
+    headers = {
+        "Vary": "Accept, Save-Data",
+        "Cache-Control": "public, max-age=86400",
+        "X-TTS-Rendition": f"{fmt}-{kbps}k" if kbps else fmt,
+    }
+    key = canonical_key(TTS_MODEL, voice, text)
+    render_key = f"{key}:{fmt}:{kbps}"
+
+    # 1) 렌디션 캐시 → 2) 마스터가 있으면 변환만
+    #    응답에는 checkout 링크를 넘긴다 — 보내는 도중 eviction 이 원본을 지워도 끝까지 나간다
+    lease = tts_cache.checkout(tts_cache.rendition_path(key, fmt, kbps))
+    if lease is None and tts_cache.lookup(tts_cache.master_path(key)) is not None:
+        try:
+            path = await tts_render_flight.do(render_key, lambda: run_in_threadpool(tts_cache.render, key, fmt, kbps))
+            lease = tts_cache.checkout(path)
+        except FileNotFoundError:
+            lease = None   # 그 사이 캐시에서 밀려났다 → 다시 합성
+    if lease is not None:
+        return _LeasedFileResponse(lease, media_type=media_type, headers=headers)
+
+    # 3) 마스터 합성 — 같은 (text, voice) 합성이 진행 중이면 입장 제어 없이 그 스트림에 합류
+    bc = tts_flight.get(key)
+    if bc is None:
+        await tts_admission.acquire(client_key(request))
+        ticket = tts_admission.ticket()
+        bc = tts_flight.get(key)   # 대기하는 동안 다른 요청이 시작했을 수 있다
+        if bc is not None:
+            ticket.release()
+        else:
+            # 슬롯은 업스트림 스트림이 끝나면 반납 (구독자 연결 끊김과 무관)
+            bc = tts_flight.start(
+                key,
+                lambda: backend.speech(text, voice=voice, response_format=MASTER_FORMAT, model=TTS_MODEL),
+                on_done=ticket.release,
+            )
+
+    try:
+        await bc.wait_open()
     except Exception as e:
-        # 모델/키 문제 시 클라이언트가 WebSpeech fallback 하도록 400
-        raise HTTPException(status_code=400, detail=f"TTS failed: {e}")
\ No newline at end of file
+        # 모델/키 문제 시 클라이언트가 WebSpeech fallback 하도록 4xx/5xx
+        raise upstream_error(e, "TTS")
+    if fmt == MASTER_FORMAT:
+        # 마스터 포맷 그대로면 변환할 것이 없으니 그대로 흘려보낸다
+        return StreamingResponse(_stream_master(bc, key), media_type=media_type, headers=headers)
+    # 그 외 포맷은 받는 대로 변환 — 첫 바이트가 마스터 완성을 기다리지 않는다
+    return StreamingResponse(_stream_rendition(bc, key, fmt, kbps), media_type=media_type, headers=headers)
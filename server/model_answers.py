@@ -0,0 +1,231 @@
+# server/model_answers.py
+"""
+문항 × 목표 레벨별 모범 답안 라이브러리 (오프라인 배치 작업)
+
+    cd server
+    python model_answers.py                          # 모든 문항 × IM2/IH/AL, 이미 만든 것은 건너뜀
+    python model_answers.py --levels IH AL -c 8 --rpm 120
+    python model_answers.py --bank roleplay --limit 20
+    AI_BACKEND=stub python model_answers.py          # 네트워크 없이 파이프라인 점검
+
+  - 동시 호출 -c 개, 분당 --rpm 개 (토큰 버킷) — 업스트림 쿼터를 넘지 않게
+  - 호출은 서버와 같은 backend.analyze (analyze 정책: 데드라인/백오프 재시도/서킷 브레이커)
+    정책이 포기하면(서킷 열림, 재시도 소진, 데드라인) Retry-After 만큼 쉬고 그 작업을 다시 — JOB_ATTEMPTS 번까지
+  - 결과는 (qid, level) 단위로 즉시 저장 → 중간에 끊겨도 다시 실행하면 남은 것만 생성
+    (문항 텍스트 해시가 바뀐 행은 다시 생성, --force 면 전부 다시)
+  - 요청 시점에는 저장소만 읽는다: GET /problems/{question_id}/model-answer?level=IH
+  .env: MODEL_ANSWER_DB_PATH=data/model_answers.sqlite3  MODEL_ANSWER_MODEL=(비우면 ANALYZE_MODEL)
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from admission import TokenBucket
+from ai_resilience import UpstreamTimeout, UpstreamUnavailable
+from analysis_schema import MODEL_ANSWER_TEXT_FORMAT, OPIC_LEVELS, validate_model_answer_field
+from history_store import SQLiteStore
+
+DEFAULT_LEVELS = ("IM2", "IH", "AL")
+JOB_ATTEMPTS = 3                 # 작업 1건당 analyze 정책 호출 횟수 (정책 안의 재시도와 별개)
+
+# 레벨별 답안 길이/복잡도 가이드 (OPIc 채점 기준 요약)
+LEVEL_GUIDE = {
+    "IM1": "about 60-80 words, simple sentences, a few connectors (and, but, so)",
+    "IM2": "about 90-110 words, mostly simple sentences with some compound ones, basic past tense narration",
+    "IM3": "about 110-130 words, paragraph-level answer, some complex sentences",
+    "IH": "about 140-170 words, organised paragraphs, varied tenses, comparisons and some idioms",
+    "AL": "about 180-220 words, fully organised with intro/body/wrap-up, natural idioms, "
+          "hypotheticals and nuanced opinions",
+}
+
+SYSTEM_PROMPT = (
+    "You write model answers for the OPIc English speaking test for Korean learners. "
+    "Write a natural first-person spoken answer (no headings, no lists) at the requested level, "
+    "then list 4-6 key expressions from your answer with a short Korean explanation each."
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_answers (
+    qid           INTEGER NOT NULL,
+    level         TEXT    NOT NULL,
+    text_hash     TEXT    NOT NULL,           -- 생성 당시 문항 텍스트 해시 (바뀌면 다시 생성)
+    answer        TEXT    NOT NULL,
+    expressions   TEXT    NOT NULL,           -- JSON [{expression, meaning}]
+    model         TEXT    NOT NULL,
+    created_at    INTEGER NOT NULL,
+    PRIMARY KEY (qid, level)
+) WITHOUT ROWID;
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+class ModelAnswerStore(SQLiteStore):
+    SCHEMA = SCHEMA
+
+    def put(self, qid: int, level: str, thash: str, answer: str, expressions: List[Dict[str, str]], model: str) -> None:
+        self.conn().execute(
+            "INSERT OR REPLACE INTO model_answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (qid, level, thash, answer, json.dumps(expressions, ensure_ascii=False), model, int(time.time() * 1000)),
+        )
+
+    def done_keys(self) -> Dict[tuple, str]:
+        """(qid, level) → text_hash — 재개(resume) 판단용"""
+        return {(r["qid"], r["level"]): r["text_hash"]
+                for r in self.conn().execute("SELECT qid, level, text_hash FROM model_answers")}
+
+    def get(self, qid: int, level: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql, args = "SELECT * FROM model_answers WHERE qid = ?", [qid]
+        if level:
+            sql += " AND level = ?"
+            args.append(level)
+        rows = self.conn().execute(sql, args).fetchall()
+        rows.sort(key=lambda r: OPIC_LEVELS.index(r["level"]) if r["level"] in OPIC_LEVELS else -1)
+        return [{
+            "level": r["level"],
+            "answer": r["answer"],
+            "key_expressions": json.loads(r["expressions"]),
+            "model": r["model"],
+            "text_hash": r["text_hash"],
+            "created_at": r["created_at"],
+        } for r in rows]
+
+    def count(self) -> int:
+        return self.conn().execute("SELECT COUNT(*) FROM model_answers").fetchone()[0]
+
+
+_store: Optional[ModelAnswerStore] = None
+_store_lock = threading.Lock()
+
+
+def get_model_answer_store() -> ModelAnswerStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ModelAnswerStore(os.getenv("MODEL_ANSWER_DB_PATH", "data/model_answers.sqlite3"))
+    return _store
+
+
+def user_prompt(q: Dict[str, Any], level: str) -> str:
+    return (
+        f"Question type: {q['type']} (topic: {q['topic']})\n"
+        f"Target level: {level} — {LEVEL_GUIDE.get(level, 'level-appropriate length and complexity')}\n"
+        f"Question:\n{q['text']}\n"
+    )
+
+
+# ---------------------------------------------------------
+# 배치 작업
+# ---------------------------------------------------------
+async def run_batch(
+    backend,
+    store: ModelAnswerStore,
+    questions: List[Dict[str, Any]],
+    levels: List[str],
+    model: str,
+    concurrency: int,
+    rpm: float,
+    force: bool = False,
+) -> Dict[str, int]:
+    done = {} if force else store.done_keys()
+    jobs = [(q, lv) for q in questions for lv in levels
+            if done.get((q["qid"], lv)) != text_hash(q["text"])]
+    print(f"{len(jobs)} to generate ({len(questions) * len(levels) - len(jobs)} already done)")
+
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="model-answer")
+    sem = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rpm / 60.0, burst=max(1, min(concurrency, rpm / 60.0)))
+    counts = {"ok": 0, "failed": 0, "skipped": len(questions) * len(levels) - len(jobs)}
+    t0 = time.perf_counter()
+
+    def generate(q: Dict[str, Any], level: str) -> dict:
+        # backend.analyze 가 analyze 정책(ResilientCaller)을 거친다 — _analyze_stream 을 직접 부르지 말 것
+        return backend.analyze(
+            SYSTEM_PROMPT, user_prompt(q, level), model=model,
+            text_format=MODEL_ANSWER_TEXT_FORMAT, validator=validate_model_answer_field,
+        )
+
+    async def one(q: Dict[str, Any], level: str) -> None:
+        async with sem:
+            for attempt in range(1, JOB_ATTEMPTS + 1):
+                while (wait := bucket.try_take()) > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    data = await loop.run_in_executor(pool, generate, q, level)
+                    await loop.run_in_executor(pool, lambda: store.put(
+                        q["qid"], level, text_hash(q["text"]), data["answer"], data["key_expressions"], model
+                    ))
+                    counts["ok"] += 1
+                    break
+                except (UpstreamUnavailable, UpstreamTimeout) as e:
+                    if attempt < JOB_ATTEMPTS:
+                        # 세마포어를 쥔 채 쉰다 — 업스트림이 아픈 동안 배치 전체가 느려지는 게 맞다
+                        pause = e.retry_after if isinstance(e, UpstreamUnavailable) else 1.0
+                        await asyncio.sleep(max(1.0, pause))
+                        continue
+                    counts["failed"] += 1
+                    print(f"  qid={q['qid']} {level} FAILED after {attempt} tries: {type(e).__name__}: {e}")
+                except Exception as e:   # 실패는 기록만 — 다음 실행에서 다시 시도
+                    counts["failed"] += 1
+                    print(f"  qid={q['qid']} {level} FAILED: {type(e).__name__}: {e}")
+                    break
+            n = counts["ok"] + counts["failed"]
+            if n % 25 == 0 or n == len(jobs):
+                print(f"  {n}/{len(jobs)}  ok={counts['ok']} failed={counts['failed']}  "
+                      f"{n / (time.perf_counter() - t0):.2f}/s")
+
+    try:
+        await asyncio.gather(*(one(q, lv) for q, lv in jobs))
+    finally:
+        pool.shutdown(wait=False)
+    return counts
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="precompute model answers per question and target level")
+    ap.add_argument("--levels", nargs="+", default=list(DEFAULT_LEVELS), choices=list(OPIC_LEVELS))
+    ap.add_argument("--bank", choices=["basic", "unexpected", "roleplay", "advanced"])
+    ap.add_argument("-c", "--concurrency", type=int, default=4)
+    ap.add_argument("--rpm", type=float, default=60.0, help="upstream requests per minute")
+    ap.add_argument("--limit", type=int, help="only the first N questions (trial run)")
+    ap.add_argument("--model", help="default: MODEL_ANSWER_MODEL or ANALYZE_MODEL")
+    ap.add_argument("--force", action="store_true", help="regenerate even if already stored")
+    args = ap.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    import main as server  # noqa: E402 — .env / AI_BACKEND 적용된 백엔드 사용
+    from opic_problems_router import snapshot
+
+    bank = snapshot().compiled
+    questions = [q for q in (bank.question(i) for i in range(bank.size))
+                 if q is not None and (not args.bank or q["bank"] == args.bank)]
+    if args.limit:
+        questions = questions[: args.limit]
+    model = args.model or os.getenv("MODEL_ANSWER_MODEL") or server.ANALYZE_MODEL
+    store = get_model_answer_store()
+    print(f"backend={server.AI_BACKEND} model={model} questions={len(questions)} levels={args.levels}")
+
+    counts = asyncio.run(run_batch(
+        server.backend, store, questions, args.levels, model, args.concurrency, args.rpm, args.force
+    ))
+    print(f"done: {counts}  (store has {store.count()} answers → {store.path})")
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,235 @@
 # server/opic_problems_router.py
 from __future__ import annotations
 
-import json
+import os
 import random
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Tuple
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException, Query
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse, Response
 from pydantic import BaseModel, Field
 
+from admission import user_key
+from history_store import get_store
+from model_answers import get_model_answer_store
+from question_bank import BANK_FILES, QID_FILE, RULE_CAPS, CompiledBank, open_banks
+from question_ids import QuestionIds, seen_mask
+from question_search import SearchIndex, docs_from_pools
+
 # ---------------------------------------------------------
-# 파일 로드 (JSON은 이 파일 기준 ../opic_test_data/ 에 둔다)
+# 문제 은행 로드 (원본 JSON은 이 파일 기준 ../opic_test_data/ 에 둔다)
 #   - basic_questions.json
 #   - unexpected_questions.json
 #   - roleplay_questions.json
 #   - advanced_questions.json
+# 런타임은 JSON 대신 컴파일된 아티팩트를 mmap 한다 (question_bank.py)
+#   → 은행은 dict-of-lists 와 같은 읽기 전용 뷰, 문항 텍스트는 접근할 때 디코딩
+# 원본이 바뀌면 (BANK_WATCH_SEC 간격으로 mtime 확인) 다시 로드하고 검색 색인은 바뀐 문항만 고친다
 # ---------------------------------------------------------
 HERE = Path(__file__).parent
 DATA_DIR = HERE / "opic_test_data"   # <- JSON들 넣어둘 폴더
-
-def _load_bank(filename: str) -> Dict[str, Dict[str, List[str]]]:
-    path = DATA_DIR / filename
-    if not path.exists():
-        raise FileNotFoundError(f"Questions JSON not found: {path}")
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-BASIC_BANK       = _load_bank("basic_questions.json")        # 서베이
-UNEXPECTED_BANK  = _load_bank("unexpected_questions.json")   # 돌발
-ROLEPLAY_BANK    = _load_bank("roleplay_questions.json")     # 롤플레잉 11/12/13
-ADVANCED_BANK    = _load_bank("advanced_questions.json")     # 어드밴스 14/15
+BANK_WATCH_SEC = float(os.getenv("BANK_WATCH_SEC", "5"))   # 0 이면 감시 안 함
+
+SEARCH_INDEX = SearchIndex()
+_bank_lock = threading.Lock()
+_bank_mtime = 0.0
+_bank_checked = 0.0
+
+
+@dataclass(frozen=True)
+class BankSnapshot:
+    """
+    한 번의 로드로 만든 은행 + 문항 ID — 재로드는 이 객체를 통째로 바꾼다.
+    요청은 시작할 때 snapshot() 으로 하나를 잡고 끝까지 그것만 쓴다
+    (한 응답 안에서 옛 은행의 풀과 새 은행의 qid 가 섞이지 않게)
+    """
+    compiled: CompiledBank
+    qids: QuestionIds
+
+    @property
+    def basic(self) -> Mapping[str, Mapping[str, Sequence[str]]]:        # 서베이
+        return self.compiled.banks["basic"]
+
+    @property
+    def unexpected(self) -> Mapping[str, Mapping[str, Sequence[str]]]:   # 돌발
+        return self.compiled.banks["unexpected"]
+
+    @property
+    def roleplay(self) -> Mapping[str, Mapping[str, Sequence[str]]]:     # 롤플레잉 11/12/13
+        return self.compiled.banks["roleplay"]
+
+    @property
+    def advanced(self) -> Mapping[str, Mapping[str, Sequence[str]]]:     # 어드밴스 14/15
+        return self.compiled.banks["advanced"]
+
+
+def _source_mtime() -> float:
+    paths = [DATA_DIR / f for f in (*BANK_FILES.values(), QID_FILE)]
+    return max((p.stat().st_mtime for p in paths if p.exists()), default=0.0)
+
+
+def load_banks() -> Dict[str, int]:
+    """아티팩트를 (필요하면 다시 컴파일해) 열고 은행 스냅샷/검색 색인을 교체"""
+    global _banks, _bank_mtime
+    with _bank_lock:
+        _bank_mtime = _source_mtime()
+        compiled = open_banks(DATA_DIR)
+        pools = compiled.pools()
+        # 문항 고정 ID (question_ids.py) — 생성 결과의 각 문항에 "qid" 로 실어 보낸다
+        _banks = BankSnapshot(compiled, QuestionIds.from_pools(pools, compiled.size))
+        return SEARCH_INDEX.sync(docs_from_pools(pools.items()))
+
+
+def snapshot() -> BankSnapshot:
+    """
+    현재 은행 스냅샷 — 은행을 읽는 모든 경로(생성/미리보기/토픽/검색/모범 답안)가 이걸 거친다
+    → 원본이 바뀌었으면 여기서 한 번 다시 로드하므로 경로마다 보는 은행이 어긋나지 않는다
+    """
+    maybe_reload_banks()
+    with _bank_lock:
+        return _banks
+
+
+def maybe_reload_banks() -> None:
+    global _bank_checked
+    now = time.monotonic()
+    if not BANK_WATCH_SEC or now - _bank_checked < BANK_WATCH_SEC:
+        return
+    _bank_checked = now
+    if _source_mtime() != _bank_mtime:
+        try:
+            print("QUESTION BANK RELOADED:", load_banks())
+        except Exception as e:   # 잘못된 편집 → 기존 은행 유지
+            print("QUESTION BANK RELOAD FAILED:", e)
+
+
+load_banks()
 
 # ---------------------------------------------------------
 # 문제 생성 로직 (원본 함수 그대로 가져오되 FastAPI app 제거)
+#   banks: 요청 시작 때 잡은 BankSnapshot — 모든 단계가 같은 은행/ID 를 본다
+#   seen: 사용자가 이미 푼 문항 마스크 (banks.qids.size 길이 bool 배열) — 주면 안 본 문항 우선,
+#         풀이 소진되면 전체에서 고른다 (avoid_seen 모드)
 # ---------------------------------------------------------
-RULE_CAPS = {"routine": 1, "comparison": 1, "experience": 2}  # description은 고정 1
+# RULE_CAPS (description은 고정 1, 나머지 유형별 상한) 는 question_bank.py — 컴파일 시 검증에도 사용
 
-def pick_random_topic(bank: Dict[str, Dict[str, List[str]]]) -> str:
+def pick_random_topic(banks: BankSnapshot, name: str, seen: Optional[np.ndarray] = None) -> str:
+    return pick_topics(banks, name, 1, seen)[0]
+
+def pick_topics(banks: BankSnapshot, name: str, k: int, seen: Optional[np.ndarray] = None) -> List[str]:
+    """서로 다른 주제 k개. seen 이 있으면 안 본 문항이 남은 주제 중에서 (모자라면 나머지로 채움)"""
+    bank = banks.compiled.banks[name]
     topics = list(bank.keys())
     if not topics:
         raise ValueError("QUESTION_BANK is empty.")
-    return random.choice(topics)
+    if len(topics) < k:
+        raise ValueError(f"QUESTION_BANK must contain at least {k} topics.")
+    if seen is None:
+        return random.sample(topics, k)
+    fresh = [t for t in topics if any(
+        (~seen[banks.qids.pool(name, t, qtype)[1]]).any() for qtype in bank[t]
+    )]
+    chosen = random.sample(fresh, min(k, len(fresh)))
+    rest = [t for t in topics if t not in chosen]
+    return chosen + random.sample(rest, k - len(chosen))
+
+def pick_numbered(
+    banks: BankSnapshot, name: str, topic: str, keys: List[str], seen: Optional[np.ndarray] = None
+) -> List[Tuple[str, str, int]]:
+    """롤플/어드밴스: 주제 블록에서 번호(key)별 1문항 → [(key, text, qid)]"""
+    out = []
+    for key in keys:
+        picked = banks.qids.choose(name, topic, key, seen)
+        if picked is not None:
+            out.append((key, picked[0], picked[1]))
+    return out
 
 def generate_set_from_bank(
-    bank: Dict[str, Dict[str, List[str]]],
+    banks: BankSnapshot,
+    name: str,
     topic: Optional[str],
-    n: int
+    n: int,
+    seen: Optional[np.ndarray] = None,
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """하나의 주제에서 n문항 생성 (description=1, 나머지 caps 준수)"""
     if topic is None:
-        topic = pick_random_topic(bank)
+        topic = pick_random_topic(banks, name, seen)
 
-    data = bank.get(topic)
+    data = banks.compiled.banks[name].get(topic)
     if not data:
         raise KeyError(f"Topic not found: {topic}")
-
-    descriptions = list(data.get("description", []))
-    routines = list(data.get("routine", []))
-    experiences = list(data.get("experience", []))
-    comparisons = list(data.get("comparison", []))
-    if not descriptions:
-        raise ValueError(f"No 'description' questions for topic: {topic}")
+    qids = banks.qids
 
     questions: List[Dict[str, Any]] = []
     # 1) description
-    q1 = random.choice(descriptions)
-    questions.append({"number": 1, "type": "description", "text": q1})
+    first = qids.choose(name, topic, "description", seen)
+    if first is None:
+        raise ValueError(f"No 'description' questions for topic: {topic}")
+    questions.append({"number": 1, "type": "description", "text": first[0], "qid": first[1]})
 
-    # 2) 나머지
+    # 2) 나머지 — 같은 세트 안에서는 중복 없이
     used = {"routine": 0, "comparison": 0, "experience": 0}
-    pools = {"routine": routines, "comparison": comparisons, "experience": experiences}
+    picked: List[int] = []
 
     for idx in range(2, n + 1):
-        candidates = [t for t, limit in RULE_CAPS.items() if used[t] < limit and pools.get(t)]
+        candidates = [t for t, limit in RULE_CAPS.items()
+                      if used[t] < limit and len(data.get(t, [])) > used[t]]
         if not candidates:
             break
         t = random.choice(candidates)
-        qtext = random.choice(pools[t])
-        pools[t].remove(qtext)
+        q = qids.choose(name, topic, t, seen, exclude=picked)
         used[t] += 1
-        questions.append({"number": idx, "type": t, "text": qtext})
+        if q is None:
+            continue
+        picked.append(q[1])
+        questions.append({"number": len(questions) + 1, "type": t, "text": q[0], "qid": q[1]})
 
     return topic, questions
 
-def generate_unexpected(n: int = 3) -> Dict[str, Any]:
-    topic, qs = generate_set_from_bank(UNEXPECTED_BANK, None, n)
+def generate_unexpected(banks: BankSnapshot, n: int = 3, seen: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    topic, qs = generate_set_from_bank(banks, "unexpected", None, n, seen)
     return {
         "mode": "unexpected",
         "count": len(qs),
         "sets": [{"topic": topic, "questions": qs}],
     }
 
-def generate_survey() -> Dict[str, Any]:
+def generate_survey(banks: BankSnapshot, seen: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """서베이: 서로 다른 주제 2개 × 각 3문항 = 6문항"""
-    topics = list(BASIC_BANK.keys())
-    if len(topics) < 2:
+    if len(banks.basic) < 2:
         raise ValueError("basic_questions.json must contain at least 2 topics.")
-    chosen = random.sample(topics, 2)
+    chosen = pick_topics(banks, "basic", 2, seen)
 
     sets = []
     total = 0
     for t in chosen:
-        topic, qs = generate_set_from_bank(BASIC_BANK, t, 3)
+        topic, qs = generate_set_from_bank(banks, "basic", t, 3, seen)
         sets.append({"topic": topic, "questions": qs})
         total += len(qs)
 
     return {"mode": "survey", "count": total, "sets": sets}
 
-def generate_roleplay() -> Dict[str, Any]:
+def generate_roleplay(banks: BankSnapshot, seen: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """롤플레잉: 한 주제에서 11/12/13 각 1문항"""
-    topic = pick_random_topic(ROLEPLAY_BANK)
-    block = ROLEPLAY_BANK.get(topic, {})
-    questions = []
-
-    for i, key in enumerate(["11", "12", "13"], start=1):
-        lst = list(block.get(key, []))
-        if not lst:
-            continue
-        q = random.choice(lst)
-        questions.append({"number": i, "type": key, "text": q})
+    topic = pick_random_topic(banks, "roleplay", seen)
+    questions = [
+        {"number": i, "type": key, "text": q, "qid": qid}
+        for i, (key, q, qid) in enumerate(
+            pick_numbered(banks, "roleplay", topic, ["11", "12", "13"], seen), start=1
+        )
+    ]
 
     if not questions:
         raise ValueError(f"No questions found for topic: {topic}")
 
     return {"mode": "roleplay", "count": len(questions), "sets": [{"topic": topic, "questions": questions}]}
 
-def generate_full15() -> Dict[str, Any]:
+def generate_full15(banks: BankSnapshot, seen: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """Q1 INTRO + 서베이(2×3=6) + 돌발3 + 롤플3 + 어드밴스2 = 15문항"""
     # 1) INTRO (Q1)
     intro_set = {
@@ -139,38 +242,32 @@ def generate_full15() -> Dict[str, Any]:
     }
 
     # 2) SURVEY 두 블록 (Q2-4, Q5-7)
-    survey_topics = random.sample(list(BASIC_BANK.keys()), 2)
-    t1, qs1 = generate_set_from_bank(BASIC_BANK, survey_topics[0], 3)
+    survey_topics = pick_topics(banks, "basic", 2, seen)
+    t1, qs1 = generate_set_from_bank(banks, "basic", survey_topics[0], 3, seen)
     for i, q in enumerate(qs1, start=2): q["number"] = i
     survey_set_1 = {"topic": t1, "questions": qs1}
 
-    t2, qs2 = generate_set_from_bank(BASIC_BANK, survey_topics[1], 3)
+    t2, qs2 = generate_set_from_bank(banks, "basic", survey_topics[1], 3, seen)
     for i, q in enumerate(qs2, start=5): q["number"] = i
     survey_set_2 = {"topic": t2, "questions": qs2}
 
     # 3) UNEXPECTED (Q8-10)
-    utopic, uqs = generate_set_from_bank(UNEXPECTED_BANK, None, 3)
+    utopic, uqs = generate_set_from_bank(banks, "unexpected", None, 3, seen)
     for i, q in enumerate(uqs, start=8): q["number"] = i
     unexpected_set = {"topic": utopic, "questions": uqs}
 
     # 4) ROLEPLAY (Q11-13)
-    rtopic = pick_random_topic(ROLEPLAY_BANK)
-    rblock = ROLEPLAY_BANK[rtopic]
-    rqs = []
-    for key, num in (("11", 11), ("12", 12), ("13", 13)):
-        lst = list(rblock.get(key, []))
-        if lst: rqs.append({"number": num, "type": key, "text": random.choice(lst)})
+    rtopic = pick_random_topic(banks, "roleplay", seen)
+    rqs = [{"number": int(key), "type": key, "text": q, "qid": qid}
+           for key, q, qid in pick_numbered(banks, "roleplay", rtopic, ["11", "12", "13"], seen)]
     if not rqs:
         raise ValueError(f"No roleplay questions for topic: {rtopic}")
     roleplay_set = {"topic": rtopic, "questions": rqs}
 
     # 5) ADVANCED (Q14-15)
-    atopic = pick_random_topic(ADVANCED_BANK)
-    ablock = ADVANCED_BANK[atopic]
-    aqs = []
-    for key, num in (("14", 14), ("15", 15)):
-        lst = list(ablock.get(key, []))
-        if lst: aqs.append({"number": num, "type": key, "text": random.choice(lst)})
+    atopic = pick_random_topic(banks, "advanced", seen)
+    aqs = [{"number": int(key), "type": key, "text": q, "qid": qid}
+           for key, q, qid in pick_numbered(banks, "advanced", atopic, ["14", "15"], seen)]
     if not aqs:
         raise ValueError(f"No advanced questions for topic: {atopic}")
     advanced_set = {"topic": atopic, "questions": aqs}
@@ -179,18 +276,13 @@ def generate_full15() -> Dict[str, Any]:
     total = sum(len(s["questions"]) for s in all_sets)
     return {"mode": "full15", "count": total, "sets": all_sets}
 
-def generate_advanced() -> Dict[str, Any]:
+def generate_advanced(banks: BankSnapshot, seen: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """어드밴스: 한 주제에서 14/15 각 1문항"""
-    topic = pick_random_topic(ADVANCED_BANK)
-    block = ADVANCED_BANK.get(topic, {})
-    questions = []
-
-    for i, key in enumerate(["14", "15"], start=1):
-        lst = list(block.get(key, []))
-        if not lst:
-            continue
-        q = random.choice(lst)
-        questions.append({"number": i, "type": key, "text": q})
+    topic = pick_random_topic(banks, "advanced", seen)
+    questions = [
+        {"number": i, "type": key, "text": q, "qid": qid}
+        for i, (key, q, qid) in enumerate(pick_numbered(banks, "advanced", topic, ["14", "15"], seen), start=1)
+    ]
 
     if not questions:
         raise ValueError(f"No advanced questions for topic: {topic}")
@@ -291,6 +383,7 @@ class GenerateBody(BaseModel):
     mode: str = Field("unexpected", description="survey|unexpected|roleplay|advanced|full15")
     # 아래는 옵션: 일부 모드에서 수를 바꾸고 싶으면 사용
     n: Optional[int] = Field(None, description="unexpected에서 문항 수 (기본 3)")
+    avoid_seen: bool = Field(False, description="이미 푼 문항 제외 (X-User-Id 기준, 소진되면 전체에서)")
 
 class GenerateJSONResponse(BaseModel):
     mode: str
@@ -300,20 +393,22 @@ class GenerateJSONResponse(BaseModel):
 router = APIRouter(prefix="/problems", tags=["OPIc Problems"])
 
 @router.post("/generate", response_model=GenerateJSONResponse)
-def api_generate(body: GenerateBody):
+def api_generate(body: GenerateBody, request: Request):
     """JSON API: 문제 생성"""
+    banks = snapshot()
     try:
+        seen = seen_mask(get_store().get_seen(user_key(request)), banks.qids.size) if body.avoid_seen else None
         if body.mode == "survey":
-            result = generate_survey()
+            result = generate_survey(banks, seen)
         elif body.mode == "roleplay":
-            result = generate_roleplay()
+            result = generate_roleplay(banks, seen)
         elif body.mode == "advanced":
-            result = generate_advanced()
+            result = generate_advanced(banks, seen)
         elif body.mode == "full15":
-            result = generate_full15()
+            result = generate_full15(banks, seen)
         elif body.mode == "unexpected":
             n = body.n if body.n and body.n > 0 else 3
-            result = generate_unexpected(n=n)
+            result = generate_unexpected(banks, n=n, seen=seen)
         else:
             raise HTTPException(status_code=400, detail="Invalid mode")
         return result
@@ -326,17 +421,18 @@ def api_preview(
     n: Optional[int] = None
 ):
     """브라우저로 결과를 바로 확인하고 싶을 때(HTML)"""
+    banks = snapshot()
     try:
         if mode == "survey":
-            result = generate_survey()
+            result = generate_survey(banks)
         elif mode == "roleplay":
-            result = generate_roleplay()
+            result = generate_roleplay(banks)
         elif mode == "advanced":
-            result = generate_advanced()
+            result = generate_advanced(banks)
         elif mode == "full15":
-            result = generate_full15()
+            result = generate_full15(banks)
         else:
-            result = generate_unexpected(n=n if n else 3)
+            result = generate_unexpected(banks, n=n if n else 3)
     except Exception as e:
         result = {"error": str(e)}
     return HTMLResponse(render_result_html(result))
@@ -344,5 +440,40 @@ def api_preview(
 @router.get("/topics")
 def api_topics(mode: str = Query(default="unexpected", pattern="^(survey|unexpected|roleplay)$")):
     """모드별 토픽 리스트"""
-    bank = {"survey": BASIC_BANK, "unexpected": UNEXPECTED_BANK, "roleplay": ROLEPLAY_BANK}[mode]
+    banks = snapshot()
+    bank = {"survey": banks.basic, "unexpected": banks.unexpected, "roleplay": banks.roleplay}[mode]
     return {"mode": mode, "topics": list(bank.keys())}
+
+@router.get("/search")
+def api_search(
+    q: str = Query(..., min_length=1, max_length=200, description="키워드 (접두어 가능: recycl, trav)"),
+    limit: int = Query(10, ge=1, le=50),
+    bank: Optional[str] = Query(None, pattern="^(basic|unexpected|roleplay|advanced)$"),
+    type: Optional[str] = Query(None, description="description|routine|comparison|experience|11~15"),
+    topic: Optional[str] = Query(None),
+):
+    """키워드 검색 — BM25 순위, 각 결과에 qid/유형/주제 포함"""
+    snapshot()                 # 원본이 바뀌었으면 검색 색인도 여기서 맞춘다
+    t0 = time.perf_counter()
+    with _bank_lock:
+        hits = SEARCH_INDEX.search(q, limit=limit, bank=bank, qtype=type, topic=topic)
+    return {
+        "query": q,
+        "count": len(hits),
+        "took_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "hits": hits,
+    }
+
+@router.get("/{question_id}/model-answer")
+def api_model_answer(
+    question_id: int,
+    level: Optional[str] = Query(None, pattern="^(NL|NM|NH|IL|IM1|IM2|IM3|IH|AL)$", description="비우면 전체 레벨"),
+):
+    """미리 생성해 둔 모범 답안 (model_answers.py) — 요청 시 업스트림 호출 없음"""
+    q = snapshot().compiled.question(question_id)
+    if q is None:
+        raise HTTPException(status_code=404, detail="Question not found")
+    answers = get_model_answer_store().get(question_id, level)
+    if not answers:
+        raise HTTPException(status_code=404, detail="Model answer not generated yet")
+    return {"question": q, "answers": answers}
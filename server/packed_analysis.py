@@ -0,0 +1,94 @@
+# server/packed_analysis.py
+"""
+묶음 분석 — 한 시험(full15 등)의 답변 여러 개를 한 번(또는 몇 번)의 구조화 호출로 채점
+
+  - 채점 지침(system prompt)은 호출당 한 번만 → 답변마다 되풀이하던 프롬프트 토큰/요청 오버헤드 제거
+  - 한 묶음은 항목 수(PACKED_MAX_ITEMS)와 전사문 글자 수(PACKED_MAX_CHARS)로 제한
+    → 출력 길이/지연이 한 호출에 몰리지 않게. 묶음끼리는 병렬로 호출
+  - 결과는 index 로 답변에 다시 나눈다. 빠지거나 중복된 항목은 None → 호출자가 단건 분석으로 채움
+  - 답변 1개의 전사문은 PACKED_MAX_ITEM_CHARS 까지 (요청 하나가 만들 수 있는 프롬프트 비용에 상한)
+  .env: PACKED_MAX_ITEMS=8  PACKED_MAX_CHARS=12000  PACKED_MAX_ITEM_CHARS=4000
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+PACKED_MAX_ITEMS = int(os.getenv("PACKED_MAX_ITEMS", "8"))
+PACKED_MAX_CHARS = int(os.getenv("PACKED_MAX_CHARS", "12000"))
+PACKED_MAX_ITEM_CHARS = int(os.getenv("PACKED_MAX_ITEM_CHARS", "4000"))   # 3분 답변 전사문의 여유 있는 상한
+
+SYSTEM_PROMPT = (
+    "You are an OPIC-style evaluator for Korean EFL speakers. "
+    "You will receive several numbered answers from one test session. "
+    "Evaluate every item independently, on its own transcript only, and return exactly one result per item "
+    "with the same index: summary, level_guess, metrics{wpm,filler_rate,grammar_issues,vocab_range,spk_len_sec}, tips[]."
+)
+
+
+@dataclass
+class PackedItem:
+    text: str
+    prompt: Optional[str] = None
+    question_type: Optional[str] = None
+    target_len_sec: Optional[int] = None
+    signal: Dict[str, Any] = field(default_factory=dict)   # 파형 측정값 (audio_features)
+
+
+def audio_note(signal: Dict[str, Any]) -> str:
+    """전사문에는 드러나지 않는 머뭇거림을 채점에 반영하도록 측정값을 한 줄로"""
+    if not signal or "voiced_sec" not in signal:
+        return ""
+    return (
+        f"Measured from audio: speaking {signal['voiced_sec']}s of {signal['audio_sec']}s, "
+        f"{signal['pause_count']} pauses ({signal['long_pause_count']} over 1s), "
+        f"longest silence {signal['longest_silence_sec']}s, "
+        f"articulation rate {signal['articulation_rate_wpm']} wpm\n"
+    )
+
+
+def make_packs(
+    items: Sequence[PackedItem],
+    max_items: int = PACKED_MAX_ITEMS,
+    max_chars: int = PACKED_MAX_CHARS,
+) -> List[List[int]]:
+    """입력 순서대로 채워 넣는 묶음 분할 → 항목 위치 목록들 (한 항목이 상한보다 길면 혼자 한 묶음)"""
+    packs: List[List[int]] = []
+    cur: List[int] = []
+    chars = 0
+    for i, item in enumerate(items):
+        n = len(item.text) + len(item.prompt or "")
+        if cur and (len(cur) >= max_items or chars + n > max_chars):
+            packs.append(cur)
+            cur, chars = [], 0
+        cur.append(i)
+        chars += n
+    if cur:
+        packs.append(cur)
+    return packs
+
+
+def user_prompt(items: Sequence[PackedItem], pack: Sequence[int]) -> str:
+    parts = []
+    for n, i in enumerate(pack, start=1):
+        item = items[i]
+        parts.append(
+            f"### Item {n}\n"
+            f"Question type: {item.question_type or 'N/A'}\n"
+            f"Topic/Prompt (optional): {item.prompt or 'N/A'}\n"
+            f"Target speaking length (sec): {item.target_len_sec}\n"
+            f"{audio_note(item.signal)}"
+            f"Transcript:\n{item.text}\n"
+        )
+    return "\n".join(parts)
+
+
+def split_results(data: Dict[str, Any], n: int) -> List[Optional[Dict[str, Any]]]:
+    """{"results": [...]} → 길이 n 의 목록 (index 1..n 순서). 범위 밖/중복 index 는 버린다"""
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+    for r in data.get("results") or []:
+        idx = r.get("index")
+        if isinstance(idx, int) and 1 <= idx <= n and out[idx - 1] is None:
+            out[idx - 1] = {k: v for k, v in r.items() if k != "index"}
+    return out
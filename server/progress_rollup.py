@@ -0,0 +1,148 @@
+# server/progress_rollup.py
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from analysis_schema import OPIC_LEVELS
+
+# ---------------------------------------------------------
+# 사용자별 학습 진행 롤업 (MyPage)
+#   업로드 1건마다 문서 1개를 갱신 → 대시보드 읽기는 사용자당 O(1)
+#   - 연속 학습일(streak): 마지막 학습일과 비교해 +1 / 유지 / 1로 리셋
+#   - wpm, filler_rate 이동평균: EWMA (ROLLUP_EWMA_ALPHA)
+#   - 레벨 분포 + 최근 레벨 추이 (최대 TREND_LEN 개)
+#   - 문항 유형별(description/routine/comparison/experience/11~15) 누적 평균
+# 날짜 경계는 HISTORY_TZ_OFFSET_MIN (기본 KST = +540분)
+# ---------------------------------------------------------
+
+EWMA_ALPHA = float(os.getenv("ROLLUP_EWMA_ALPHA", "0.2"))
+TZ = timezone(timedelta(minutes=int(os.getenv("HISTORY_TZ_OFFSET_MIN", "540"))))
+TREND_LEN = 20
+QUESTION_TYPES = ("description", "routine", "comparison", "experience", "11", "12", "13", "14", "15")
+
+
+def local_day(epoch_ms: int) -> int:
+    """epoch ms → 로컬 날짜의 ordinal (연속 여부는 정수 차이로 판단)"""
+    return datetime.fromtimestamp(epoch_ms / 1000, TZ).date().toordinal()
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if f == f else None   # NaN 제외
+
+
+def _ewma(prev: Optional[float], x: Optional[float]) -> Optional[float]:
+    if x is None:
+        return prev
+    return x if prev is None else prev + EWMA_ALPHA * (x - prev)
+
+
+def _mean(agg: Dict[str, Any], key: str, x: Optional[float]) -> None:
+    """누적 평균 (합 대신 개수+평균 → 값이 커져도 정밀도 유지)"""
+    if x is None:
+        return
+    n = agg.get(f"{key}_n", 0) + 1
+    prev = agg.get(f"{key}_avg") or 0.0
+    agg[f"{key}_n"] = n
+    agg[f"{key}_avg"] = prev + (x - prev) / n
+
+
+def empty_rollup() -> Dict[str, Any]:
+    return {
+        "attempts": 0,
+        "first_day": None,
+        "last_day": None,
+        "streak": 0,
+        "best_streak": 0,
+        "active_days": 0,
+        "wpm_ewma": None,
+        "filler_rate_ewma": None,
+        "levels": {},
+        "trend": [],
+        "by_type": {},
+        "last_attempt_at": None,
+    }
+
+
+def apply_attempt(
+    doc: Dict[str, Any],
+    *,
+    created_at: int,
+    level: Optional[str],
+    metrics: Dict[str, Any],
+    question_type: Optional[str],
+) -> Dict[str, Any]:
+    """문서에 attempt 1건을 반영 (제자리 갱신 후 반환)"""
+    day = local_day(created_at)
+    doc["attempts"] += 1
+
+    # 연속 학습일 — 시간순 도착을 가정, 과거 날짜로 늦게 들어온 기록은 streak 에 반영하지 않는다
+    last = doc["last_day"]
+    if last is None or day > last:
+        doc["active_days"] += 1
+        doc["streak"] = doc["streak"] + 1 if last is not None and day == last + 1 else 1
+        doc["last_day"] = day
+        doc["best_streak"] = max(doc["best_streak"], doc["streak"])
+    if doc["first_day"] is None or day < doc["first_day"]:
+        doc["first_day"] = day
+
+    wpm = _num(metrics.get("wpm"))
+    filler = _num(metrics.get("filler_rate"))
+    doc["wpm_ewma"] = _ewma(doc["wpm_ewma"], wpm)
+    doc["filler_rate_ewma"] = _ewma(doc["filler_rate_ewma"], filler)
+
+    if level:
+        doc["levels"][level] = doc["levels"].get(level, 0) + 1
+        doc["trend"] = (doc["trend"] + [[created_at, level]])[-TREND_LEN:]
+
+    qtype = question_type if question_type in QUESTION_TYPES else "other"
+    agg = doc["by_type"].setdefault(qtype, {"attempts": 0, "levels": {}})
+    agg["attempts"] += 1
+    _mean(agg, "wpm", wpm)
+    _mean(agg, "filler_rate", filler)
+    if level:
+        agg["levels"][level] = agg["levels"].get(level, 0) + 1
+        agg["last_level"] = level
+
+    doc["last_attempt_at"] = max(created_at, doc["last_attempt_at"] or 0)
+    return doc
+
+
+def _level_rank(level: str) -> int:
+    return OPIC_LEVELS.index(level) if level in OPIC_LEVELS else -1
+
+
+def view(doc: Dict[str, Any], now_ms: int) -> Dict[str, Any]:
+    """API 응답 형태. 오늘/어제 학습하지 않았으면 현재 streak 은 0."""
+    today = local_day(now_ms)
+    last = doc["last_day"]
+    current = doc["streak"] if last is not None and today - last <= 1 else 0
+    levels = doc["levels"]
+    return {
+        "attempts": doc["attempts"],
+        "streak_days": current,
+        "best_streak_days": doc["best_streak"],
+        "active_days": doc["active_days"],
+        "studied_today": last == today,
+        "wpm_avg": round(doc["wpm_ewma"], 1) if doc["wpm_ewma"] is not None else None,
+        "filler_rate_avg": round(doc["filler_rate_ewma"], 3) if doc["filler_rate_ewma"] is not None else None,
+        "level_distribution": dict(sorted(levels.items(), key=lambda kv: _level_rank(kv[0]))),
+        "best_level": max(levels, key=_level_rank) if levels else None,
+        "level_trend": [{"at": at, "level": lv} for at, lv in doc["trend"]],
+        "by_type": {
+            t: {
+                "attempts": a["attempts"],
+                "wpm_avg": round(a["wpm_avg"], 1) if a.get("wpm_avg") is not None else None,
+                "filler_rate_avg": round(a["filler_rate_avg"], 3) if a.get("filler_rate_avg") is not None else None,
+                "level_distribution": a["levels"],
+                "last_level": a.get("last_level"),
+            }
+            for t, a in doc["by_type"].items()
+        },
+        "last_attempt_at": doc["last_attempt_at"],
+    }
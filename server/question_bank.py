@@ -0,0 +1,360 @@
+# server/question_bank.py
+"""
+문제 은행 바이너리 아티팩트 (컴파일 → mmap 로딩)
+
+    cd server
+    python question_bank.py               # JSON 검증 + 컴파일 → data/cache/question_bank.opicbank
+    python question_bank.py --check       # 검증만 (RULE_CAPS 를 만족 못 하면 exit 1)
+
+  - 서버는 JSON 을 파싱하지 않고 아티팩트를 mmap 한다 → 워커가 여럿이어도 페이지 캐시 1벌 공유
+  - 아티팩트는 소스 트리(opic_test_data/)가 아니라 캐시 디렉터리에 둔다.
+    없거나 원본(JSON, question_ids.json)이 바뀌었으면 시작할 때 한 번 다시 컴파일하고,
+    그 디렉터리에 쓸 수 없으면(읽기 전용 배포/컨테이너) 메모리에서 컴파일해 그대로 쓴다 (mmap 공유만 못 함)
+    → 읽기 전용 이미지에서는 빌드 단계에서 위 명령을 한 번 돌려 두거나 QUESTION_BANK_PATH 로 완성본을 지정
+  - 문항 ID 는 question_ids.py 의 고정 ID 를 그대로 쓴다
+  .env: QUESTION_BANK_CACHE_DIR=data/cache  QUESTION_BANK_PATH=(비우면 <캐시 디렉터리>/question_bank.opicbank)
+
+형식 (little-endian, 섹션은 8바이트 정렬):
+  header   : magic, version, content_hash(sha256, header 이후 전체), source_hash, 섹션 오프셋/개수
+  strings  : u32 오프셋[n+1] + UTF-8 blob  — 문항/주제/유형/은행 이름 모두 한 번씩만 저장 (intern)
+  questions: qid 로 바로 찾는 레코드 (text, bank, topic, type 문자열 번호) — 빈 ID 는 0xFFFFFFFF
+  pools    : (bank, topic, type) 별 [start, count) → members 구간 (JSON 순서 유지)
+  members  : u32 qid 배열
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from question_ids import QuestionIds
+
+Bank = Dict[str, Dict[str, List[str]]]
+
+MAGIC = b"OPICBANK"
+VERSION = 1
+ARTIFACT_NAME = "question_bank.opicbank"
+BANK_FILES = {
+    "basic": "basic_questions.json",          # 서베이
+    "unexpected": "unexpected_questions.json",  # 돌발
+    "roleplay": "roleplay_questions.json",    # 롤플레잉 11/12/13
+    "advanced": "advanced_questions.json",    # 어드밴스 14/15
+}
+QID_FILE = "question_ids.json"
+
+RULE_CAPS = {"routine": 1, "comparison": 1, "experience": 2}  # description은 고정 1
+SET_SIZE = 3                                                  # 서베이/돌발 한 세트 문항 수
+NUMBERED_KEYS = {"roleplay": ("11", "12", "13"), "advanced": ("14", "15")}
+
+# magic, version, content_hash, source_hash,
+# n_strings, strings_off, blob_off, blob_len, n_questions, questions_off, n_pools, pools_off, n_members, members_off
+_HEADER = struct.Struct("<8sI32s32s10I")
+_NONE = 0xFFFFFFFF
+QREC = np.dtype([("text", "<u4"), ("bank", "<u4"), ("topic", "<u4"), ("type", "<u4")])
+POOLREC = np.dtype([("bank", "<u4"), ("topic", "<u4"), ("type", "<u4"), ("start", "<u4"), ("count", "<u4")])
+
+
+# ---------------------------------------------------------
+# JSON 원본
+# ---------------------------------------------------------
+def load_json_banks(data_dir: Path) -> Dict[str, Bank]:
+    banks = {}
+    for name, filename in BANK_FILES.items():
+        path = data_dir / filename
+        if not path.exists():
+            raise FileNotFoundError(f"Questions JSON not found: {path}")
+        with path.open("r", encoding="utf-8") as f:
+            banks[name] = json.load(f)
+    return banks
+
+
+def source_hash(data_dir: Path) -> bytes:
+    """원본 파일 바이트 해시 (파싱 없음) — 아티팩트가 최신인지 판단"""
+    h = hashlib.sha256()
+    for filename in (*BANK_FILES.values(), QID_FILE):
+        path = data_dir / filename
+        h.update(filename.encode())
+        h.update(path.read_bytes() if path.exists() else b"")
+    return h.digest()
+
+
+def validate_banks(banks: Dict[str, Bank]) -> List[str]:
+    """생성기가 항상 채울 수 있는 은행인지 검사 → 문제 목록 (비면 통과)"""
+    errors = []
+    for name, bank in banks.items():
+        if not bank:
+            errors.append(f"{name}: bank is empty")
+        for topic, block in bank.items():
+            for qtype, texts in block.items():
+                if not isinstance(texts, list) or any(not isinstance(t, str) or not t.strip() for t in texts):
+                    errors.append(f"{name}/{topic}/{qtype}: questions must be non-empty strings")
+            if name in NUMBERED_KEYS:
+                for key in NUMBERED_KEYS[name]:
+                    if not block.get(key):
+                        errors.append(f"{name}/{topic}: no '{key}' questions")
+            else:
+                if not block.get("description"):
+                    errors.append(f"{name}/{topic}: no 'description' questions")
+                fill = sum(min(len(block.get(t, [])), cap) for t, cap in RULE_CAPS.items())
+                if fill < SET_SIZE - 1:
+                    errors.append(
+                        f"{name}/{topic}: RULE_CAPS {RULE_CAPS} allow only {fill} follow-up question(s), "
+                        f"need {SET_SIZE - 1}"
+                    )
+    if len(banks.get("basic", {})) < 2:
+        errors.append("basic: survey needs at least 2 topics")
+    return errors
+
+
+# ---------------------------------------------------------
+# 컴파일
+# ---------------------------------------------------------
+def _align(buf: bytearray) -> int:
+    buf.extend(b"\x00" * (-len(buf) % 8))
+    return len(buf)
+
+
+def compile_banks(banks: Dict[str, Bank], qids: QuestionIds, src_hash: bytes = b"\x00" * 32) -> bytes:
+    strings: Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        sid = strings.get(s)
+        if sid is None:
+            sid = strings[s] = len(strings)
+        return sid
+
+    questions = np.full(qids.size, _NONE, dtype=QREC)
+    pools, members = [], []
+    for bank_name, bank in banks.items():
+        for topic, block in bank.items():
+            for qtype in block:
+                _, ids = qids.pool(bank_name, topic, qtype)
+                texts = block[qtype]
+                b, t, k = intern(bank_name), intern(topic), intern(qtype)
+                pools.append((b, t, k, len(members), len(ids)))
+                for text, qid in zip(texts, ids.tolist()):
+                    questions[qid] = (intern(text), b, t, k)
+                    members.append(qid)
+
+    blob = bytearray()
+    offsets = [0]
+    for s in strings:   # dict 는 삽입 순서 = 번호 순서
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+
+    body = bytearray(b"\x00" * _HEADER.size)
+    strings_off = _align(body)
+    body += np.array(offsets, dtype="<u4").tobytes()
+    blob_off = _align(body)
+    body += blob
+    questions_off = _align(body)
+    body += questions.tobytes()
+    pools_off = _align(body)
+    body += np.array(pools, dtype=POOLREC).tobytes()
+    members_off = _align(body)
+    body += np.array(members, dtype="<u4").tobytes()
+
+    content_hash = hashlib.sha256(bytes(body[_HEADER.size:])).digest()
+    _HEADER.pack_into(
+        body, 0, MAGIC, VERSION, content_hash, src_hash,
+        len(strings), strings_off, blob_off, len(blob), qids.size, questions_off,
+        len(pools), pools_off, len(members), members_off,
+    )
+    return bytes(body)
+
+
+def artifact_path() -> Path:
+    return Path(os.getenv("QUESTION_BANK_PATH", "")
+                or Path(os.getenv("QUESTION_BANK_CACHE_DIR", "data/cache")) / ARTIFACT_NAME)
+
+
+def compile_dir(data_dir: Path) -> bytes:
+    """검증 → 컴파일 (바이트로)"""
+    banks = load_json_banks(data_dir)
+    errors = validate_banks(banks)
+    if errors:
+        raise ValueError("invalid question bank:\n  " + "\n  ".join(errors))
+    qids = QuestionIds.load(data_dir / QID_FILE, banks)
+    if qids.missing:
+        print(f"WARNING: {len(qids.missing)} question(s) have no stable id yet — run: python question_ids.py")
+    return compile_banks(banks, qids, source_hash(data_dir))
+
+
+def build(data_dir: Path, out: Optional[Path] = None) -> Path:
+    """검증 → 컴파일 → 원자적 교체 (동시에 여러 워커가 불러도 안전)"""
+    out = out or artifact_path()
+    _write_atomic(out, compile_dir(data_dir))
+    return out
+
+
+def _write_atomic(out: Path, data: bytes) -> None:
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, out)
+
+
+# ---------------------------------------------------------
+# 런타임 (mmap) — dict-of-lists 와 같은 읽기 인터페이스
+# ---------------------------------------------------------
+class PoolView(Sequence):
+    """한 (bank, topic, type) 의 문항 텍스트 — 접근할 때 mmap 에서 디코딩"""
+
+    def __init__(self, cb: "CompiledBank", ids: np.ndarray):
+        self._cb = cb
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._cb.text(int(q)) for q in self.ids[i]]
+        return self._cb.text(int(self.ids[i]))
+
+
+class TopicView(Mapping):
+    def __init__(self, pools: Dict[str, PoolView]):
+        self._pools = pools
+
+    def __getitem__(self, qtype: str) -> PoolView:
+        return self._pools[qtype]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._pools)
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+
+class BankView(Mapping):
+    def __init__(self, topics: Dict[str, TopicView]):
+        self._topics = topics
+
+    def __getitem__(self, topic: str) -> TopicView:
+        return self._topics[topic]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._topics)
+
+    def __len__(self) -> int:
+        return len(self._topics)
+
+
+class CompiledBank:
+    def __init__(self, path: Optional[Path], verify: bool = True, data: Optional[bytes] = None):
+        """path 를 mmap — data 를 주면 파일 없이 그 바이트를 그대로 쓴다 (path=None)"""
+        self.path = path
+        if data is not None:
+            self._mm = data
+        else:
+            with path.open("rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.content_hash, self.source_hash,
+         n_strings, strings_off, blob_off, blob_len, n_questions, questions_off,
+         n_pools, pools_off, n_members, members_off) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a question bank artifact v{VERSION}")
+        if verify and hashlib.sha256(self._mm[_HEADER.size:]).digest() != self.content_hash:
+            raise ValueError(f"{path}: content hash mismatch (corrupted artifact)")
+
+        # 전부 mmap 위의 zero-copy 뷰
+        self._str_offsets = np.frombuffer(self._mm, "<u4", n_strings + 1, strings_off)
+        self._blob_off = blob_off
+        self.questions = np.frombuffer(self._mm, QREC, n_questions, questions_off)
+        self._pools = np.frombuffer(self._mm, POOLREC, n_pools, pools_off)
+        self._members = np.frombuffer(self._mm, "<u4", n_members, members_off)
+        self.banks = self._build_views()
+
+    @property
+    def size(self) -> int:
+        return int(self.questions.size)
+
+    def string(self, sid: int) -> str:
+        a, b = self._str_offsets[sid], self._str_offsets[sid + 1]
+        return self._mm[self._blob_off + a: self._blob_off + b].decode("utf-8")
+
+    def text(self, qid: int) -> str:
+        sid = int(self.questions[qid]["text"])
+        if sid == _NONE:
+            raise KeyError(f"unknown question id: {qid}")
+        return self.string(sid)
+
+    def question(self, qid: int) -> Optional[Dict[str, object]]:
+        """qid → {qid, bank, topic, type, text} (없으면 None)"""
+        if not 0 <= qid < self.size or int(self.questions[qid]["text"]) == _NONE:
+            return None
+        r = self.questions[qid]
+        return {"qid": qid, "bank": self.string(int(r["bank"])), "topic": self.string(int(r["topic"])),
+                "type": self.string(int(r["type"])), "text": self.string(int(r["text"]))}
+
+    def pools(self) -> Dict[Tuple[str, str, str], Tuple[PoolView, np.ndarray]]:
+        out = {}
+        for bank, topics in self.banks.items():
+            for topic, block in topics.items():
+                for qtype, pool in block.items():
+                    out[(bank, topic, qtype)] = (pool, pool.ids.astype(np.int64))
+        return out
+
+    def _build_views(self) -> Dict[str, BankView]:
+        # 풀 테이블(수백 행)만 읽어 뷰 골격을 만든다 — 문항 텍스트는 건드리지 않음
+        tree: Dict[str, Dict[str, Dict[str, PoolView]]] = {}
+        for b, t, k, start, count in self._pools.tolist():
+            tree.setdefault(self.string(b), {}).setdefault(self.string(t), {})[self.string(k)] = PoolView(
+                self, self._members[start: start + count]
+            )
+        return {
+            bank: BankView({topic: TopicView(block) for topic, block in topics.items()})
+            for bank, topics in tree.items()
+        }
+
+
+def open_banks(data_dir: Path, path: Optional[Path] = None) -> CompiledBank:
+    """
+    아티팩트를 mmap. 없거나 원본보다 오래됐으면 다시 컴파일한다.
+    원본 JSON 이 없는 배포(아티팩트만 복사)에서는 그대로 사용.
+    아티팩트 위치에 쓸 수 없으면 메모리에서 컴파일한 것을 돌려준다.
+    """
+    path = path or artifact_path()
+    has_sources = all((data_dir / f).exists() for f in BANK_FILES.values())
+    if path.exists():
+        cb = CompiledBank(path)
+        if not has_sources or cb.source_hash == source_hash(data_dir):
+            return cb
+        print(f"question bank sources changed — recompiling {path.name}")
+    data = compile_dir(data_dir)
+    try:
+        _write_atomic(path, data)
+    except OSError as e:
+        print(f"question bank artifact not writable ({e}) — using in-memory copy")
+        return CompiledBank(None, data=data)
+    return CompiledBank(path)
+
+
+def main() -> None:
+    data_dir = Path(__file__).parent / "opic_test_data"
+    if "--check" in sys.argv[1:]:
+        errors = validate_banks(load_json_banks(data_dir))
+        for e in errors:
+            print("ERROR:", e)
+        sys.exit(1 if errors else 0)
+    try:
+        out = build(data_dir)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    cb = CompiledBank(out)
+    print(f"compiled {cb.size} ids, {len(cb._pools)} pools → {out} "
+          f"({out.stat().st_size} bytes, sha256 {cb.content_hash.hex()[:16]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# server/question_ids.py
+"""
+문항 고정 정수 ID + 사용자별 '이미 푼 문항' 비트셋
+
+  - ID 는 opic_test_data/question_ids.json 에 기록된 값을 쓴다 (append-only → 배포/재시작에도 안정)
+    키 = "<bank>/<topic>/<type>/<문항 텍스트 sha1 앞 16자>"  (문구를 고치면 새 문항 = 새 ID)
+  - 은행에 새 문항이 생기면 실행 중에는 임시로 다음 번호를 주고, 아래 명령으로 파일에 확정한다
+
+        cd server
+        python question_ids.py            # 누락된 문항에 ID 부여 후 저장 (기존 ID 는 절대 바꾸지 않음)
+        python question_ids.py --check    # 누락 있으면 exit 1 (CI 용)
+
+  - 비트셋: bit i = ID i 문항을 본 적 있음. 문항 수가 수백~수천이라 사용자당 수백 바이트.
+    풀(pool) 단위로 ID 배열을 미리 만들어 두고, 마스크 한 번(~seen[ids])으로 안 본 문항만 고른다
+    → 응시 기록이 아무리 많아도 생성 비용은 문항 수에만 비례
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Bank = Dict[str, Dict[str, List[str]]]
+
+
+def question_key(bank: str, topic: str, qtype: str, text: str) -> str:
+    digest = hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+    return f"{bank}/{topic}/{qtype}/{digest}"
+
+
+class QuestionIds:
+    def __init__(self, ids: Dict[str, int], next_id: int, missing: List[str]):
+        self.ids = ids
+        self.next_id = next_id
+        self.missing = missing          # 파일에 아직 없는 키 (임시 ID 부여됨)
+        # (bank, topic, type) → (텍스트 목록, 같은 순서의 ID 배열)
+        self._pools: Dict[Tuple[str, str, str], Tuple[Sequence[str], np.ndarray]] = {}
+
+    @classmethod
+    def load(cls, path: Path, banks: Dict[str, Bank]) -> "QuestionIds":
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            ids, next_id = dict(data["ids"]), int(data["next_id"])
+        else:
+            ids, next_id = {}, 0
+
+        missing: List[str] = []
+        self = cls(ids, next_id, missing)
+        for bank_name, bank in banks.items():
+            for topic, block in bank.items():
+                for qtype, texts in block.items():
+                    qids = []
+                    for text in texts:
+                        key = question_key(bank_name, topic, qtype, text)
+                        if key not in ids:
+                            ids[key] = self.next_id
+                            self.next_id += 1
+                            missing.append(key)
+                        qids.append(ids[key])
+                    self._pools[(bank_name, topic, qtype)] = (list(texts), np.array(qids, dtype=np.int64))
+        return self
+
+    @classmethod
+    def from_pools(cls, pools: Dict[Tuple[str, str, str], Tuple[Sequence[str], np.ndarray]], size: int) -> "QuestionIds":
+        """컴파일된 아티팩트(question_bank.py)에서 — 키 ↔ ID 표 없이 풀만 (save/qid 는 JSON 경로에서)"""
+        self = cls({}, size, [])
+        self._pools = dict(pools)
+        return self
+
+    def save(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"next_id": self.next_id, "ids": self.ids}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.write("\n")
+
+    @property
+    def size(self) -> int:
+        """비트셋 길이 (ID 는 0..size-1)"""
+        return self.next_id
+
+    def pool(self, bank: str, topic: str, qtype: str) -> Tuple[Sequence[str], np.ndarray]:
+        return self._pools.get((bank, topic, qtype), ([], np.zeros(0, dtype=np.int64)))
+
+    def qid(self, bank: str, topic: str, qtype: str, text: str) -> Optional[int]:
+        return self.ids.get(question_key(bank, topic, qtype, text))
+
+    # ----- 선택 -----
+    def choose(
+        self,
+        bank: str,
+        topic: str,
+        qtype: str,
+        seen: Optional[np.ndarray],
+        exclude: Sequence[int] = (),
+    ) -> Optional[Tuple[str, int]]:
+        """
+        풀에서 1문항. seen 이 있으면 안 본 문항 중에서 고르고,
+        다 봤으면 (풀 소진) 전체에서 고른다. exclude 는 이번 세트에서 이미 뽑은 ID.
+        """
+        texts, ids = self.pool(bank, topic, qtype)
+        if not len(texts):
+            return None
+        ok = ~np.isin(ids, exclude) if len(exclude) else np.ones(ids.size, dtype=bool)
+        if seen is not None and (ok & ~seen[ids]).any():
+            ok &= ~seen[ids]
+        idx = np.flatnonzero(ok)
+        if idx.size == 0:
+            return None
+        i = int(idx[random.randrange(idx.size)])
+        return texts[i], int(ids[i])
+
+
+# ---------------------------------------------------------
+# 비트셋 ↔ bytes (DB 저장 형식: little-endian bit order)
+# ---------------------------------------------------------
+def seen_mask(blob: Optional[bytes], size: int) -> np.ndarray:
+    """bytes 비트셋 → 길이 size 의 bool 배열 (짧으면 False 로 채움)"""
+    mask = np.zeros(size, dtype=bool)
+    if blob:
+        bits = np.unpackbits(np.frombuffer(blob, dtype=np.uint8), bitorder="little")[:size].astype(bool)
+        mask[: bits.size] = bits
+    return mask
+
+
+def set_bit(blob: Optional[bytes], qid: int) -> bytes:
+    buf = bytearray(blob or b"")
+    byte = qid >> 3
+    if byte >= len(buf):
+        buf.extend(b"\x00" * (byte + 1 - len(buf)))
+    buf[byte] |= 1 << (qid & 7)
+    return bytes(buf)
+
+
+def main() -> None:
+    from question_bank import QID_FILE, load_json_banks
+
+    data_dir = Path(__file__).parent / "opic_test_data"
+    path = data_dir / QID_FILE
+    qids = QuestionIds.load(path, load_json_banks(data_dir))
+    if "--check" in sys.argv[1:]:
+        if qids.missing:
+            print(f"{len(qids.missing)} question(s) without a stable id — run: python question_ids.py")
+            sys.exit(1)
+        print(f"ok: {len(qids.ids)} ids")
+        return
+    qids.save(path)
+    print(f"assigned {len(qids.missing)} new id(s), total {len(qids.ids)} → {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# server/question_search.py
+from __future__ import annotations
+
+import bisect
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ---------------------------------------------------------
+# 문항 키워드 검색 (역색인 + BM25 + 접두어 매칭)
+#   - 문서 = 문항 1개 (문항 텍스트 + 주제 이름), 문서 번호 = 고정 qid
+#   - 질의어마다 정확히 일치하는 단어 + 그 단어로 시작하는 단어(접두어)를 함께 찾는다
+#     "recycl" → recycle, recycling, recycled ... (접두어 확장은 가중치를 낮춘다)
+#   - sync(): 바뀐 문항만 색인을 고친다 (텍스트 해시 비교) → 은행이 바뀌어도 전체 재색인 없음
+# ---------------------------------------------------------
+
+K1 = 1.2
+B = 0.75
+PREFIX_WEIGHT = 0.6        # 접두어로만 일치한 단어의 가중치
+MAX_EXPANSIONS = 32        # 질의어 하나당 접두어 확장 상한
+MIN_PREFIX_LEN = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could did do does for from had has have how i if in into is it its "
+    "me my of on or so tell that the their them then there these they this to was we were what when where "
+    "which who why will with would you your about".split()
+)
+
+Doc = Tuple[str, str, str, str]   # (bank, topic, type, text)
+
+
+def _stem(tok: str) -> str:
+    """아주 가벼운 정규화 — 소유격/복수형 s 만 뗀다 (나머지는 접두어 매칭이 흡수)"""
+    if tok.endswith("'s"):
+        tok = tok[:-2]
+    elif "'" in tok:
+        tok = tok.split("'", 1)[0]
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith(("ss", "us", "is")):
+        tok = tok[:-1]
+    return tok
+
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower().replace("’", "'")
+    return [t for t in (_stem(m) for m in _TOKEN_RE.findall(text)) if t and t not in STOPWORDS]
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        self.docs: Dict[int, Doc] = {}
+        self._sig: Dict[int, int] = {}                       # qid → 색인한 내용의 crc32
+        self._postings: Dict[str, Dict[int, int]] = {}       # term → {qid: tf}
+        self._frozen: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}   # term → (qids, tf) 질의용 캐시
+        self._vocab: List[str] = []                          # 정렬 유지 — 접두어는 bisect 로
+        self._doc_len = np.zeros(0, dtype=np.float64)
+        self._total_len = 0
+
+    # ----- 색인 -----
+    def sync(self, docs: Dict[int, Doc]) -> Dict[str, int]:
+        """docs(qid → 문서) 와 같아지도록 추가/변경/삭제분만 반영"""
+        added = changed = removed = 0
+        for qid in [q for q in self.docs if q not in docs]:
+            self._remove(qid)
+            removed += 1
+        for qid, doc in docs.items():
+            sig = zlib.crc32("\x1f".join(doc).encode("utf-8"))
+            old = self._sig.get(qid)
+            if old == sig:
+                continue
+            if old is not None:
+                self._remove(qid)
+                changed += 1
+            else:
+                added += 1
+            self._add(qid, doc, sig)
+        return {"added": added, "changed": changed, "removed": removed, "docs": len(self.docs)}
+
+    def _add(self, qid: int, doc: Doc, sig: int) -> None:
+        _, topic, _, text = doc
+        tf = Counter(tokenize(text) + tokenize(topic))
+        if qid >= self._doc_len.size:
+            self._doc_len = np.concatenate((self._doc_len, np.zeros(qid + 1 - self._doc_len.size)))
+        self._doc_len[qid] = sum(tf.values())
+        self._total_len += int(self._doc_len[qid])
+        for term, n in tf.items():
+            post = self._postings.get(term)
+            if post is None:
+                post = self._postings[term] = {}
+                bisect.insort(self._vocab, term)
+            post[qid] = n
+            self._frozen.pop(term, None)
+        self.docs[qid] = doc
+        self._sig[qid] = sig
+
+    def _remove(self, qid: int) -> None:
+        _, topic, _, text = self.docs.pop(qid)
+        del self._sig[qid]
+        for term in set(tokenize(text) + tokenize(topic)):
+            post = self._postings[term]
+            post.pop(qid, None)
+            self._frozen.pop(term, None)
+            if not post:
+                del self._postings[term]
+                del self._vocab[bisect.bisect_left(self._vocab, term)]
+        self._total_len -= int(self._doc_len[qid])
+        self._doc_len[qid] = 0
+
+    def _posting(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arr = self._frozen.get(term)
+        if arr is None:
+            post = self._postings[term]
+            arr = self._frozen[term] = (
+                np.fromiter(post.keys(), dtype=np.int64, count=len(post)),
+                np.fromiter(post.values(), dtype=np.float64, count=len(post)),
+            )
+        return arr
+
+    def _expand(self, tok: str) -> List[Tuple[str, float]]:
+        """정확히 일치 (가중치 1) + 접두어 일치 (PREFIX_WEIGHT)"""
+        out = [(tok, 1.0)] if tok in self._postings else []
+        if len(tok) >= MIN_PREFIX_LEN:
+            i = bisect.bisect_left(self._vocab, tok)
+            while i < len(self._vocab) and self._vocab[i].startswith(tok) and len(out) < MAX_EXPANSIONS:
+                if self._vocab[i] != tok:
+                    out.append((self._vocab[i], PREFIX_WEIGHT))
+                i += 1
+        return out
+
+    # ----- 검색 -----
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        bank: Optional[str] = None,
+        qtype: Optional[str] = None,
+        topic: Optional[str] = None,
+    ) -> List[Dict[str, object]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+        avgdl = self._total_len / n_docs
+        scores = np.zeros(self._doc_len.size, dtype=np.float64)
+        matched: Dict[int, set] = {}
+
+        for tok in dict.fromkeys(tokenize(query)):
+            # 한 질의어에 대해 문서별로 가장 좋은 확장어 점수만 (접두어가 여러 개 걸려도 중복 가산 없음)
+            best = np.zeros_like(scores)
+            for term, weight in self._expand(tok):
+                qids, tf = self._posting(term)
+                df = qids.size
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                dl = self._doc_len[qids]
+                s = weight * idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+                better = s > best[qids]
+                best[qids[better]] = s[better]
+                for q in qids[better].tolist():
+                    matched.setdefault(q, set()).add(term)
+            scores += best
+
+        hit = np.flatnonzero(scores > 0)
+        if bank or qtype or topic:
+            keep = [
+                q for q in hit.tolist()
+                if (not bank or self.docs[q][0] == bank)
+                and (not topic or self.docs[q][1] == topic)
+                and (not qtype or self.docs[q][2] == qtype)
+            ]
+            hit = np.array(keep, dtype=np.int64)
+        if hit.size > limit:
+            hit = hit[np.argpartition(-scores[hit], limit - 1)[:limit]]
+        hit = hit[np.lexsort((hit, -scores[hit]))]   # 점수 내림차순, 같으면 qid 순 (결정적)
+
+        out = []
+        for q in hit.tolist():
+            b, t, k, text = self.docs[q]
+            out.append({
+                "qid": q, "score": round(float(scores[q]), 4),
+                "bank": b, "topic": t, "type": k, "text": text,
+                "matched": sorted(matched.get(q, ())),
+            })
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"docs": len(self.docs), "terms": len(self._vocab)}
+
+
+def docs_from_pools(pools: Iterable[Tuple[Tuple[str, str, str], Tuple[object, np.ndarray]]]) -> Dict[int, Doc]:
+    """QuestionIds/CompiledBank 의 풀 → qid 별 문서"""
+    docs: Dict[int, Doc] = {}
+    for (bank, topic, qtype), (texts, ids) in pools:
+        for i, qid in enumerate(ids.tolist()):
+            docs[qid] = (bank, topic, qtype, texts[i])
+    return docs
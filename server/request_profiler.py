@@ -0,0 +1,206 @@
+# server/request_profiler.py
+"""
+요청 단위 통계적 프로파일러 (운영 중 느린 요청의 파이썬 시간이 어디로 갔는지)
+
+  - 켜는 조건 (둘 다 비어 있으면 미들웨어 자체를 등록하지 않는다 → 오버헤드 0)
+      PROFILE_ADMIN_TOKEN 과 같은 X-Profile-Token 헤더가 붙은 요청
+      PROFILE_SAMPLE_RATE (0~1) 확률로 무작위 요청 (PROFILE_PATHS 접두어로 범위 제한)
+  - 프로파일 중에는 별도 스레드가 PROFILE_INTERVAL_MS 마다 sys._current_frames() 로
+    모든 스레드의 스택을 찍는다 (이벤트 루프 + 스레드풀 워커). 쉬고 있는 스레드는 뺀다
+    ※ 같은 시간대의 다른 요청도 섞인다 — 느린 요청을 다시 보내 재현할 때 쓰는 도구
+  - 결과는 collapsed stack 텍스트 (flamegraph.pl / speedscope 에 그대로) → 워커별 메모리 링 버퍼
+  - 응답 헤더 X-Profile-Id 로 찾아서
+      GET /admin/profiles              목록 (최근순, 자기 시간 상위 함수)
+      GET /admin/profiles/{id}         다운로드 (text/plain, collapsed)
+    관리 API 는 X-Admin-Token == PROFILE_ADMIN_TOKEN 일 때만 (토큰 미설정이면 404)
+  .env: PROFILE_ADMIN_TOKEN=  PROFILE_SAMPLE_RATE=0  PROFILE_PATHS=/upload,/problems
+        PROFILE_INTERVAL_MS=5  PROFILE_RING_SIZE=50  PROFILE_MAX_ACTIVE=2
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from admin_auth import require_admin, token_matches
+
+ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PATHS = tuple(p for p in os.getenv("PROFILE_PATHS", "/upload,/problems").split(",") if p)
+INTERVAL_SEC = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0
+RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "50"))
+MAX_ACTIVE = int(os.getenv("PROFILE_MAX_ACTIVE", "2"))
+TOP_N = 10
+
+# 리프 프레임이 이것이면 '쉬는 중' — 이벤트 루프 대기, 스레드풀 대기
+_IDLE_LEAVES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get")}
+
+
+def enabled() -> bool:
+    return bool(ADMIN_TOKEN) or SAMPLE_RATE > 0
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """프로파일 1건 — 시작~정지 사이 모든 스레드 스택을 주기적으로 센다"""
+
+    def __init__(self, interval: float = INTERVAL_SEC):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top(self, n: int = TOP_N) -> List[Dict[str, Any]]:
+        """자기 시간(리프) 기준 상위 함수"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{"frame": f, "samples": c, "pct": round(100.0 * c / total, 1)} for f, c in leaves.most_common(n)]
+
+
+class ProfileRing:
+    """최근 프로파일 N 개 (워커 프로세스 메모리)"""
+
+    def __init__(self, size: int = RING_SIZE):
+        self._items: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self.active = 0
+        self.skipped = 0     # MAX_ACTIVE 초과로 건너뜀
+
+    def add(self, meta: Dict[str, Any], collapsed: str) -> None:
+        self._items.append({**meta, "collapsed": collapsed})
+
+    def next_id(self) -> str:
+        return f"{os.getpid()}-{next(self._ids)}"
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in p.items() if k != "collapsed"} for p in reversed(self._items)]
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return next((p for p in self._items if p["id"] == profile_id), None)
+
+
+ring = ProfileRing()
+
+
+class ProfileMiddleware:
+    """순수 ASGI 미들웨어 — 프로파일 대상이 아니면 헤더 한 번 보고 그대로 통과"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _reason(self, scope) -> Optional[str]:
+        if ADMIN_TOKEN:
+            for k, v in scope["headers"]:
+                if k == b"x-profile-token":
+                    return "header" if token_matches(v, ADMIN_TOKEN) else None
+        if SAMPLE_RATE > 0 and scope["path"].startswith(PATHS) and random.random() < SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self._reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            return await self.app(scope, receive, send)
+        if ring.active >= MAX_ACTIVE:
+            ring.skipped += 1
+            return await self.app(scope, receive, send)
+
+        profile_id = ring.next_id()
+        status = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        ring.active += 1
+        sampler = Sampler().start()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            await run_in_threadpool(sampler.stop)   # 샘플러 스레드 join — 이벤트 루프를 막지 않게
+            ring.active -= 1
+            ring.add({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status[0],
+                "reason": reason,
+                "duration_ms": round(elapsed * 1000, 1),
+                "samples": sampler.samples,
+                "created_at": int(time.time() * 1000),
+                "top": sampler.top(),
+            }, sampler.collapsed())
+
+
+# ---------------------------------------------------------
+# 관리 API
+# ---------------------------------------------------------
+router = APIRouter(prefix="/admin/profiles", tags=["admin"])
+
+
+@router.get("")
+def list_profiles(request: Request):
+    require_admin(request, ADMIN_TOKEN)
+    return {"profiles": ring.list(), "active": ring.active, "skipped": ring.skipped, "pid": os.getpid()}
+
+
+@router.get("/{profile_id}", response_class=PlainTextResponse)
+def download_profile(profile_id: str, request: Request):
+    require_admin(request, ADMIN_TOKEN)
+    p = ring.get(profile_id)
+    if p is None:
+        raise HTTPException(status_code=404, detail="Profile not found (other worker or evicted)")
+    return PlainTextResponse(
+        p["collapsed"],
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed.txt"'},
+    )
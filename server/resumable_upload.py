@@ -0,0 +1,228 @@
+# server/resumable_upload.py
+"""
+이어받기 업로드 (모바일에서 연결이 끊겨도 처음부터 다시 보내지 않게)
+
+    POST   /upload/sessions                     세션 생성 {total_size, filename, 분석 옵션...}
+                                                → {session_id, chunk_size, offset}
+    PUT    /upload/sessions/{id}/chunks/{index} 본문 = 조각 바이트, 헤더 X-Chunk-Sha256: <hex>
+                                                (선택) Upload-Offset: index * chunk_size
+    GET    /upload/sessions/{id}                받은 위치(offset) 조회 → 끊긴 뒤 여기서부터 이어서
+    POST   /upload/sessions/{id}/finalize       다 받았으면 기존 파이프라인(전사 → 분석 → 기록)
+    DELETE /upload/sessions/{id}                취소
+
+  - 조각은 최종 녹음 파일(uploads/<recording_id><ext>)의 제자리에 바로 pwrite → 재조립 복사 없음
+  - 받은 위치는 SQLite 에 (워커 여러 개/재시작에도 이어받기 가능). 위치는 순서대로만 전진:
+      offset == 받은 위치  → 쓰고 전진
+      offset <  받은 위치  → 이미 받음 (재전송은 그대로 200)
+      offset >  받은 위치  → 409 + Upload-Offset (앞 조각이 빠짐)
+    쓰고 나서 위치를 올리므로, 그 사이 죽으면 같은 자리를 다시 덮어쓸 뿐이다
+  - finalize 는 상태 전이(open → finalizing → done)로 한 번만 처리, 결과를 저장해 재시도에 같은 응답
+    finalizing 은 임대(lease) — UPLOAD_FINALIZE_LEASE_SEC 동안 갱신이 없으면 (워커가 죽었다) 다음 finalize 가
+    넘겨받는다. 끝낼 때는 자기 임대(updated_at)가 그대로일 때만 상태를 바꾼다
+  - 마지막 활동 후 UPLOAD_SESSION_TTL_SEC 지난 미완료 세션은 파일째 지운다 (lifespan 에서 주기 실행)
+  .env: UPLOAD_SESSION_DB_PATH=data/uploads.sqlite3  UPLOAD_CHUNK_KB=512
+        UPLOAD_SESSION_TTL_SEC=86400  UPLOAD_SESSION_GC_SEC=600  UPLOAD_FINALIZE_LEASE_SEC=180
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from history_store import SQLiteStore
+from waveform_peaks import peaks_path
+
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "512")) * 1024
+SESSION_TTL_SEC = float(os.getenv("UPLOAD_SESSION_TTL_SEC", "86400"))
+GC_INTERVAL_SEC = float(os.getenv("UPLOAD_SESSION_GC_SEC", "600"))
+# 전사 + 분석 데드라인 + 입장 대기보다 길게 — 살아 있는 finalize 를 빼앗지 않도록
+FINALIZE_LEASE_SEC = float(os.getenv("UPLOAD_FINALIZE_LEASE_SEC", "180"))
+UPLOAD_DIR = "uploads"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id          TEXT    PRIMARY KEY,
+    user_id     TEXT    NOT NULL,
+    path        TEXT    NOT NULL,             -- 최종 녹음 파일 (조각을 제자리에 쓴다)
+    total_size  INTEGER NOT NULL,
+    chunk_size  INTEGER NOT NULL,
+    received    INTEGER NOT NULL DEFAULT 0,   -- 앞에서부터 연속으로 받은 바이트
+    state       TEXT    NOT NULL DEFAULT 'open',   -- open | finalizing | done
+    meta        TEXT    NOT NULL DEFAULT '{}',     -- 분석 옵션 (prompt, exam_id ...)
+    result      TEXT,                              -- finalize 응답 (재시도 시 그대로)
+    created_at  INTEGER NOT NULL,
+    updated_at  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_upload_sessions_updated ON upload_sessions (state, updated_at);
+"""
+
+
+class SessionError(Exception):
+    def __init__(self, status: int, detail: str, offset: Optional[int] = None):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.offset = offset
+
+
+def _now() -> int:
+    return int(time.time() * 1000)
+
+
+class UploadSessionStore(SQLiteStore):
+    SCHEMA = SCHEMA
+
+    def create(self, user_id: str, ext: str, total_size: int, meta: Dict[str, Any]) -> Dict[str, Any]:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        sid = uuid.uuid4().hex
+        path = f"{UPLOAD_DIR}/{sid[:8]}{ext}"     # recording_id = 앞 8자리 (/upload 와 같은 형식)
+        with open(path, "wb"):
+            pass
+        now = _now()
+        self.conn().execute(
+            "INSERT INTO upload_sessions (id, user_id, path, total_size, chunk_size, meta, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (sid, user_id, path, total_size, CHUNK_SIZE, json.dumps(meta, ensure_ascii=False), now, now),
+        )
+        return self.get(sid, user_id)
+
+    def get(self, sid: str, user_id: str) -> Dict[str, Any]:
+        r = self.conn().execute(
+            "SELECT * FROM upload_sessions WHERE id = ? AND user_id = ?", (sid, user_id)
+        ).fetchone()
+        if r is None:
+            raise SessionError(404, "Upload session not found")
+        return dict(r)
+
+    # ----- 조각 -----
+    def write_chunk(self, sid: str, user_id: str, index: int, data: bytes) -> Dict[str, Any]:
+        """검증이 끝난 조각을 제자리에 쓰고 받은 위치를 전진 (블로킹)"""
+        s = self.get(sid, user_id)
+        if s["state"] != "open":
+            raise SessionError(409, f"Upload session is {s['state']}", offset=s["received"])
+        offset = index * s["chunk_size"]
+        expected = min(s["chunk_size"], s["total_size"] - offset)
+        if offset >= s["total_size"] or len(data) != expected:
+            raise SessionError(400, f"Chunk {index} must be {max(expected, 0)} bytes", offset=s["received"])
+        if offset < s["received"]:
+            return s                                  # 재전송 — 이미 받은 조각
+        if offset > s["received"]:
+            raise SessionError(409, "Chunk out of order", offset=s["received"])
+
+        fd = os.open(s["path"], os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+        self.conn().execute(
+            "UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ? AND received = ?",
+            (offset + len(data), _now(), sid, offset),
+        )
+        return self.get(sid, user_id)
+
+    # ----- 마무리 -----
+    def begin_finalize(self, sid: str, user_id: str) -> Dict[str, Any]:
+        """
+        open (또는 임대가 만료된 finalizing) → finalizing (한 요청만 성공).
+        이미 done 이면 저장된 결과와 함께 그대로 반환. 반환값의 updated_at 이 임대 — end_finalize 에 넘긴다
+        """
+        s = self.get(sid, user_id)
+        if s["state"] == "done":
+            return s
+        if s["received"] != s["total_size"]:
+            raise SessionError(409, "Upload incomplete", offset=s["received"])
+        now = _now()
+        cur = self.conn().execute(
+            "UPDATE upload_sessions SET state = 'finalizing', updated_at = ? WHERE id = ? "
+            "AND (state = 'open' OR (state = 'finalizing' AND updated_at < ?))",
+            (now, sid, now - int(FINALIZE_LEASE_SEC * 1000)),
+        )
+        if cur.rowcount != 1:
+            raise SessionError(409, "Upload session is already being finalized", offset=s["received"])
+        return self.get(sid, user_id)
+
+    def end_finalize(self, sid: str, lease: int, result: Optional[Dict[str, Any]]) -> None:
+        """
+        성공이면 done + 결과 저장, 실패(None)면 open 으로 되돌려 finalize 를 다시 시도할 수 있게.
+        임대를 다른 요청이 넘겨받았으면 아무것도 바꾸지 않는다
+        """
+        if result is None:
+            self.conn().execute(
+                "UPDATE upload_sessions SET state = 'open', updated_at = ? "
+                "WHERE id = ? AND state = 'finalizing' AND updated_at = ?",
+                (_now(), sid, lease),
+            )
+        else:
+            self.conn().execute(
+                "UPDATE upload_sessions SET state = 'done', result = ?, updated_at = ? "
+                "WHERE id = ? AND state = 'finalizing' AND updated_at = ?",
+                (json.dumps(result, ensure_ascii=False), _now(), sid, lease),
+            )
+
+    def delete(self, sid: str, user_id: str) -> None:
+        s = self.get(sid, user_id)
+        if s["state"] == "finalizing" and s["updated_at"] >= _now() - int(FINALIZE_LEASE_SEC * 1000):
+            raise SessionError(409, "Upload session is being finalized")
+        self.conn().execute("DELETE FROM upload_sessions WHERE id = ?", (sid,))
+        if s["state"] != "done":               # done 이면 녹음 파일은 응시 기록이 쓴다
+            _remove(s["path"])
+
+    # ----- 정리 -----
+    def gc(self, ttl_sec: float = SESSION_TTL_SEC) -> Dict[str, int]:
+        """마지막 활동 후 ttl 이 지난 세션 — 미완료는 파일까지, 완료는 행만 지운다"""
+        cutoff = _now() - int(ttl_sec * 1000)
+        c = self.conn()
+        stale = c.execute(
+            "SELECT id, path, state FROM upload_sessions WHERE updated_at < ?", (cutoff,)
+        ).fetchall()
+        removed = 0
+        for r in stale:
+            # 처리 중(finalizing)이 ttl 넘게 멈춰 있으면 죽은 워커가 남긴 것
+            c.execute("DELETE FROM upload_sessions WHERE id = ? AND updated_at < ?", (r["id"], cutoff))
+            if r["state"] != "done":
+                _remove(r["path"])
+                removed += 1
+        return {"expired": len(stale), "files_removed": removed}
+
+    def counts(self) -> Dict[str, int]:
+        return {r["state"]: r["n"] for r in self.conn().execute(
+            "SELECT state, COUNT(*) AS n FROM upload_sessions GROUP BY state"
+        )}
+
+
+def _remove(path: str) -> None:
+    """녹음 파일과 (finalize 실패 전에 만들어졌을 수 있는) 파형 피크"""
+    for p in (path, peaks_path(path)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def public_view(s: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": s["id"],
+        "recording_id": os.path.splitext(os.path.basename(s["path"]))[0],
+        "total_size": s["total_size"],
+        "chunk_size": s["chunk_size"],
+        "offset": s["received"],
+        "next_index": s["received"] // s["chunk_size"],
+        "state": s["state"],
+        "expires_at": s["updated_at"] + int(SESSION_TTL_SEC * 1000),
+    }
+
+
+_store: Optional[UploadSessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> UploadSessionStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UploadSessionStore(os.getenv("UPLOAD_SESSION_DB_PATH", "data/uploads.sqlite3"))
+    return _store
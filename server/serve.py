@@ -0,0 +1,145 @@
+# server/serve.py
+"""
+멀티 워커 실행기 (pre-fork) — 읽기 전용 데이터를 마스터에서 한 번만 만들고 워커들이 공유
+
+    cd server
+    python serve.py --workers 4 --port 8000
+    python serve.py -w 4 --host 0.0.0.0 --log-level warning
+
+  uvicorn --workers N 은 워커마다 main.py 를 새로 import 한다 → 문제 은행 파싱/검색 색인/스키마/SDK 모듈이
+  워커 수만큼 메모리에 올라간다. 여기서는
+    1) 마스터: gc 를 끈 채 main import (은행/색인/문항 ID/레벨 모델/OpenAPI 스키마까지 미리 만든다)
+    2) gc.freeze() — 지금까지의 객체를 영구 세대로 옮긴다. 워커의 GC 가 이 객체들의 헤더를 건드리지 않으므로
+       페이지가 copy-on-write 로 공유된 채 남는다 (참조 카운트 변화로 일부 페이지는 결국 복사된다)
+    3) 리슨 소켓을 마스터가 열고 fork → 워커마다 uvicorn.Server(sockets=[sock]) — 같은 포트를 함께 accept
+    4) 워커: gc 다시 켬. 네트워크 클라이언트/스레드는 os.register_at_fork 로 비워 둔 상태에서 첫 사용 때 생성
+       (OpenAI 커넥션 풀, 분석 호출 스레드풀, SQLite 연결, 사용량 flush 스레드 — 모두 pid 기준 지연 초기화)
+  - 워커가 죽으면 마스터가 다시 fork (마스터는 요청을 받지 않으므로 상태가 import 직후 그대로)
+  - SIGTERM/SIGINT → 워커에 전달, 모두 끝나면 종료
+  - 은행 원본이 바뀌면 각 워커가 BANK_WATCH_SEC 감시로 다시 읽는다 (그 뒤로는 워커별 사본)
+  .env: WEB_CONCURRENCY=4  (--workers 기본값)
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+RESPAWN_BACKOFF_SEC = 1.0     # 시작하자마자 죽는 워커를 계속 fork 하지 않게
+
+
+def preload():
+    """마스터에서 한 번 — 워커가 공유할 불변 데이터를 전부 만든다"""
+    import main
+    import level_model
+    import opic_problems_router  # noqa: F401 — import 시 은행 로드 + 검색 색인 생성
+
+    level_model.load()
+    main.app.openapi()            # 스키마 생성도 워커마다 하지 않게
+    try:
+        import av  # noqa: F401 — 디코더 모듈 (audio_features 는 첫 업로드 때 import 한다)
+    except ImportError:
+        pass
+    return main.app
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args) -> None:
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    config = uvicorn.Config(
+        app, lifespan="on", log_level=args.log_level, access_log=not args.no_access_log,
+        timeout_keep_alive=args.keep_alive,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="pre-fork multi-worker server (shared read-only data)")
+    ap.add_argument("-w", "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "4")))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--backlog", type=int, default=2048)
+    ap.add_argument("--keep-alive", type=int, default=5, help="keep-alive timeout (sec)")
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--no-access-log", action="store_true")
+    args = ap.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+
+    gc.disable()                  # import 중 GC 가 돌면 살아남은 객체 헤더가 이미 더럽혀진다
+    t0 = time.perf_counter()
+    app = preload()
+    gc.collect()                  # 쓰레기는 치우고 남은 것만 얼린다
+    gc.freeze()
+    sock = bind(args.host, args.port, args.backlog)
+    print(f"[serve] preloaded in {time.perf_counter() - t0:.2f}s, {gc.get_freeze_count()} objects frozen; "
+          f"{args.workers} workers on {args.host}:{args.port} (master pid {os.getpid()})", flush=True)
+
+    workers: Dict[int, float] = {}    # pid → 시작 시각
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, args)
+            except BaseException as e:   # noqa: BLE001 — 워커는 여기서 끝난다
+                print(f"[serve] worker {os.getpid()} crashed: {e!r}", file=sys.stderr, flush=True)
+                code = 1
+            finally:
+                sys.stdout.flush()
+            sys.exit(code)            # atexit (사용량 flush 등) 은 워커에서도 돈다
+        workers[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"[serve] worker {pid} exited ({os.waitstatus_to_exitcode(status)}), respawning", flush=True)
+        if time.monotonic() - started < RESPAWN_BACKOFF_SEC:
+            time.sleep(RESPAWN_BACKOFF_SEC)
+        if not stopping:
+            spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
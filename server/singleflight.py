@@ -0,0 +1,173 @@
+# server/singleflight.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+T = TypeVar("T")
+
+# ---------------------------------------------------------
+# 프로세스 내 single-flight (요청 합치기)
+#   - 같은 canonical key 로 동시에 들어온 요청은 진행 중인 업스트림 호출 1건에 합류
+#   - SingleFlight : 결과 1개를 공유 (분석)
+#   - StreamFlight : 스트리밍 바이트를 모든 대기자에게 팬아웃 (TTS)
+#     늦게 합류한 구독자는 버퍼에 쌓인 앞부분부터 다시 받는다
+# 완료되면 키를 지운다 (캐시가 아님 — 동시 요청만 합친다)
+# ---------------------------------------------------------
+
+
+def canonical_key(*parts: Any) -> str:
+    """공백 정규화 후 해시 — 내용이 같으면 같은 키"""
+    norm = "\x1f".join(" ".join(str(p).split()) for p in parts)
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, "asyncio.Task[Any]"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            # 별도 태스크로 실행 — 먼저 온 요청이 취소(연결 끊김)돼도 합류한 요청은 계속 기다린다
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # 'exception was never retrieved' 경고 방지
+
+    def stats(self) -> dict:
+        return {"name": self.name, "in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers}
+
+
+class Broadcast:
+    """업스트림 스트림 1개 → 구독자 N명. 생산자는 스레드, 구독자는 이벤트 루프."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, on_follow: Optional[Callable[[], None]] = None):
+        self._loop = loop
+        self._on_follow = on_follow      # 두 번째 구독자부터 — 실제로 합쳐진 요청 수
+        self.subscribers = 0
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.opened: "asyncio.Future[None]" = loop.create_future()
+        self._changed = asyncio.Event()
+
+    # ----- 생산자 (워커 스레드) -----
+    def produce(self, open_stream: Callable[[], Any]) -> None:
+        try:
+            stream = open_stream()
+        except BaseException as e:  # noqa: BLE001 — 구독자에게 그대로 전달
+            self._loop.call_soon_threadsafe(self._open_failed, e)
+            return
+        self._loop.call_soon_threadsafe(self._open_ok)
+        try:
+            for chunk in stream.iter_bytes():
+                if chunk:
+                    self._loop.call_soon_threadsafe(self._push, chunk)
+        except BaseException as e:  # noqa: BLE001
+            self._loop.call_soon_threadsafe(self._finish, e)
+        else:
+            self._loop.call_soon_threadsafe(self._finish, None)
+
+    # ----- 이벤트 루프 쪽 상태 갱신 -----
+    def _open_ok(self) -> None:
+        if not self.opened.done():
+            self.opened.set_result(None)
+
+    def _open_failed(self, e: BaseException) -> None:
+        if not self.opened.done():
+            self.opened.set_exception(e)
+        self._finish(e)
+
+    def _notify(self) -> None:
+        ev, self._changed = self._changed, asyncio.Event()
+        ev.set()
+
+    def _push(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    # ----- 구독자 -----
+    async def wait_open(self) -> None:
+        """연결 실패(키/모델/업스트림 장애)는 여기서 예외로 — 응답 시작 전에 상태코드를 정할 수 있게"""
+        await asyncio.shield(self.opened)
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        self.subscribers += 1
+        if self.subscribers > 1 and self._on_follow is not None:
+            self._on_follow()
+        i = 0
+        while True:
+            changed = self._changed
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class StreamFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._streams: Dict[str, Broadcast] = {}
+        self._tasks: "set[asyncio.Task[None]]" = set()   # 태스크 GC 방지용 참조
+        self.leaders = 0
+        self.followers = 0
+
+    def get(self, key: str) -> Optional[Broadcast]:
+        """진행 중인 스트림 조회만 — followers 는 실제로 구독할 때 센다"""
+        return self._streams.get(key)
+
+    def _followed(self) -> None:
+        self.followers += 1
+
+    def start(
+        self, key: str, open_stream: Callable[[], Any], on_done: Optional[Callable[[], None]] = None
+    ) -> Broadcast:
+        """
+        호출 사이에 await 가 없어야 한다 (get → start 가 원자적이어야 중복 호출이 없음).
+        on_done: 업스트림 스트림이 끝나면 (구독자 연결과 무관하게) 호출 — 입장 슬롯 반납 등
+        """
+        bc = Broadcast(asyncio.get_running_loop(), on_follow=self._followed)
+        self._streams[key] = bc
+        self.leaders += 1
+
+        async def _run() -> None:
+            try:
+                await run_in_threadpool(bc.produce, open_stream)
+            finally:
+                if self._streams.get(key) is bc:
+                    del self._streams[key]
+                if on_done is not None:
+                    on_done()
+
+        task = asyncio.ensure_future(_run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return bc
+
+    def stats(self) -> dict:
+        return {"name": self.name, "in_flight": len(self._streams), "leaders": self.leaders, "followers": self.followers}
@@ -0,0 +1,394 @@
+# server/stream_capture.py
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import wave
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from audio_features import FRAME_SEC, SAMPLE_RATE, frame_energy_db, voiced_mask, _runs
+from waveform_peaks import peaks_path
+
+# ---------------------------------------------------------
+# 실시간 녹음 수집 + 구간별 점진 전사 (WebSocket /ws/capture 용)
+#   - 녹음 조각(MediaRecorder timeslice)을 받는 즉시 디코더에 흘려 16kHz mono PCM 으로
+#     · audio/webm, audio/ogg 등 컨테이너: 세션 동안 유지되는 디코더 1개 (PyAV → 없으면 ffmpeg 파이프)
+#     · audio/pcm (s16le 16kHz): 디코딩 없이 그대로
+#   - 에너지 VAD(audio_features) 로 쉼(pause)을 찾아 구간을 자르고, 잘린 구간은 바로 전사
+#     → 학생이 말하는 동안 부분 전사문이 흘러가고, 정지 시에는 마지막 구간만 남는다
+#   - 구간 전사는 세션당 순차 (결과 순서 보장)
+#   - 세션당 상한: 받은 바이트 max_bytes(/upload 의 UPLOAD_MAX_MB), 녹음 길이 CAPTURE_MAX_SEC → 넘으면 413
+# .env: CAPTURE_MAX_SEC=300
+# ---------------------------------------------------------
+
+SEGMENT_PAUSE_SEC = float(os.getenv("CAPTURE_SEGMENT_PAUSE_SEC", "0.6"))   # 이만큼 쉬면 자른다
+MIN_SEGMENT_SEC = float(os.getenv("CAPTURE_MIN_SEGMENT_SEC", "4"))
+MAX_SEGMENT_SEC = float(os.getenv("CAPTURE_MAX_SEGMENT_SEC", "25"))       # Whisper 30초 창 이내
+CHECK_EVERY_SEC = 0.25
+MAX_CAPTURE_SEC = float(os.getenv("CAPTURE_MAX_SEC", "300"))
+
+PCM_MIME = "audio/pcm"
+
+
+class CaptureError(RuntimeError):
+    def __init__(self, detail: str, status: int = 415):
+        super().__init__(detail)
+        self.status = status
+
+
+# ---------------------------------------------------------
+# 디코더 — feed() 는 즉시 반환, PCM 은 on_pcm 콜백 (디코더 스레드에서 호출)
+# ---------------------------------------------------------
+class BlockingPipe(io.RawIOBase):
+    """feed 된 바이트를 읽는 쪽이 기다리는 파이프 (PyAV 가 파일처럼 읽는다)"""
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._closed = False
+        self._cv = threading.Condition()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def write_chunk(self, data: bytes) -> None:
+        with self._cv:
+            self._buf += data
+            self._cv.notify_all()
+
+    def end(self) -> None:
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    def readinto(self, b) -> int:
+        with self._cv:
+            while not self._buf and not self._closed:
+                self._cv.wait()
+            n = min(len(b), len(self._buf))
+            b[:n] = self._buf[:n]
+            del self._buf[:n]
+            return n
+
+
+class PCMDecoder:
+    def __init__(self, on_pcm: Callable[[np.ndarray], None]):
+        self._on_pcm = on_pcm
+        self._carry = b""
+
+    def feed(self, data: bytes) -> None:
+        data = self._carry + data
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        if usable:
+            self._on_pcm(np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0)
+
+    def close(self) -> None:
+        pass
+
+    def join(self) -> None:
+        pass
+
+
+class PyAVDecoder:
+    def __init__(self, on_pcm: Callable[[np.ndarray], None]):
+        import av
+
+        self._av = av
+        self._on_pcm = on_pcm
+        self._pipe = BlockingPipe()
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="capture-decode", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        av = self._av
+        try:
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            with av.open(self._pipe, mode="r") as container:
+                for frame in container.decode(audio=0):
+                    for out in resampler.resample(frame):
+                        self._on_pcm(out.to_ndarray().reshape(-1).astype(np.float32) / 32768.0)
+                for out in resampler.resample(None):
+                    self._on_pcm(out.to_ndarray().reshape(-1).astype(np.float32) / 32768.0)
+        except Exception as e:   # 손상/중간에 끊긴 스트림 — 받은 데까지만 사용
+            self.error = e
+
+    def feed(self, data: bytes) -> None:
+        self._pipe.write_chunk(data)
+
+    def close(self) -> None:
+        self._pipe.end()
+
+    def join(self) -> None:
+        self._thread.join()
+
+
+class FFmpegDecoder:
+    def __init__(self, on_pcm: Callable[[np.ndarray], None]):
+        self._on_pcm = on_pcm
+        self._proc = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-fflags", "nobuffer", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._inbox: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write, name="capture-ffmpeg-in", daemon=True)
+        self._reader = threading.Thread(target=self._read, name="capture-ffmpeg-out", daemon=True)
+        self._writer.start()
+        self._reader.start()
+        self.error: Optional[BaseException] = None
+
+    def _write(self) -> None:
+        try:
+            while (data := self._inbox.get()) is not None:
+                self._proc.stdin.write(data)
+                self._proc.stdin.flush()
+        except OSError as e:
+            self.error = e
+        finally:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+
+    def _read(self) -> None:
+        carry = b""
+        while chunk := self._proc.stdout.read1(32768):
+            data = carry + chunk
+            usable = len(data) - len(data) % 2
+            carry = data[usable:]
+            self._on_pcm(np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0)
+        self._proc.wait()
+
+    def feed(self, data: bytes) -> None:
+        self._inbox.put(data)
+
+    def close(self) -> None:
+        self._inbox.put(None)
+
+    def join(self) -> None:
+        self._writer.join()
+        self._reader.join()
+
+
+def make_decoder(mime: str, on_pcm: Callable[[np.ndarray], None]):
+    if mime.split(";")[0].strip() == PCM_MIME:
+        return PCMDecoder(on_pcm)
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        if shutil.which("ffmpeg"):
+            return FFmpegDecoder(on_pcm)
+        raise CaptureError("no streaming decoder for compressed audio (install PyAV or ffmpeg, or send audio/pcm)")
+    return PyAVDecoder(on_pcm)
+
+
+# ---------------------------------------------------------
+# 구간 분할
+# ---------------------------------------------------------
+def find_cut(window: np.ndarray, sr: int = SAMPLE_RATE) -> Optional[int]:
+    """
+    window(마지막 자른 지점부터의 PCM) 안에서 자를 위치 (샘플 인덱스) — 없으면 None
+      - MIN_SEGMENT_SEC 이후의 SEGMENT_PAUSE_SEC 이상 쉼 중 마지막 것의 가운데
+      - MAX_SEGMENT_SEC 를 넘었는데 쉼이 없으면 가장 긴 무음의 가운데 (그것도 없으면 강제로)
+    """
+    dur = len(window) / sr
+    if dur < MIN_SEGMENT_SEC:
+        return None
+    mask = voiced_mask(frame_energy_db(window, sr))
+    if not mask.any():
+        return int(MAX_SEGMENT_SEC * sr) if dur >= MAX_SEGMENT_SEC else None   # 긴 무음은 잘라서 버림
+    s, e = _runs(~mask)
+    min_frames = int(MIN_SEGMENT_SEC / FRAME_SEC)
+    long_gap = (e - s) >= int(SEGMENT_PAUSE_SEC / FRAME_SEC)
+    ok = long_gap & (s >= min_frames)
+    if ok.any():
+        i = np.flatnonzero(ok)[-1]
+        return int((s[i] + e[i]) // 2 * FRAME_SEC * sr)
+    if dur >= MAX_SEGMENT_SEC:
+        inner = s > 0
+        if inner.any():
+            i = np.flatnonzero(inner)[np.argmax((e - s)[inner])]
+            return int((s[i] + e[i]) // 2 * FRAME_SEC * sr)
+        return int(MAX_SEGMENT_SEC * sr)
+    return None
+
+
+def write_wav(path: str, samples: np.ndarray, sr: int = SAMPLE_RATE) -> None:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+
+
+class CaptureSession:
+    """
+    녹음 1건. 이벤트 루프에서만 사용 (feed/finish), 디코더 스레드는 call_soon_threadsafe 로 PCM 전달.
+    transcribe(path) 는 블로킹 함수 (스레드풀에서 실행), on_partial 은 구간 전사 직후 호출.
+    """
+
+    def __init__(
+        self,
+        uid: str,
+        mime: str,
+        transcribe: Callable[[str], str],
+        on_partial: Callable[[dict], Awaitable[None]],
+        workdir: str = "uploads",
+        max_bytes: Optional[int] = None,
+        max_sec: float = MAX_CAPTURE_SEC,
+    ):
+        self.is_pcm = mime.split(";")[0].strip() == PCM_MIME
+        # 파일 확장자는 클라이언트 mime 에서 오므로 /upload/sessions 의 파일명 확장자와 같은 기준으로 검증
+        ext = ".wav" if self.is_pcm else ("." + mime.split(";")[0].split("/")[-1].strip() if "/" in mime else ".webm")
+        if not ext[1:].isalnum() or len(ext) > 8:
+            raise CaptureError(f"Unsupported mime type: {mime[:64]}")
+        self.uid = uid
+        self.mime = mime
+        self.workdir = workdir
+        self.max_bytes = max_bytes
+        self.max_samples = int(max_sec * SAMPLE_RATE)
+        self._transcribe = transcribe
+        self._on_partial = on_partial
+        self._loop = asyncio.get_running_loop()
+        self._chunks: List[np.ndarray] = []
+        self._pending: List[np.ndarray] = []    # 마지막 자른 지점 이후
+        self._pending_len = 0
+        self._since_check = 0
+        self.offset = 0                         # 마지막 자른 지점 (전체 샘플 기준)
+        self.texts: List[str] = []
+        self.segments = 0
+        self.received_bytes = 0
+        self.total_samples = 0
+        self._limit: Optional[str] = None       # 디코더 쪽에서 넘은 상한 (다음 feed 에서 알린다)
+        self._segq: "asyncio.Queue[Optional[tuple]]" = asyncio.Queue()
+
+        os.makedirs(workdir, exist_ok=True)
+        self.save_path = os.path.join(workdir, f"{uid}{ext}")
+        self._raw = None if self.is_pcm else open(self.save_path, "wb")
+        try:
+            self._decoder = make_decoder(mime, lambda x: self._loop.call_soon_threadsafe(self._on_pcm, x))
+        except BaseException:
+            if self._raw is not None:
+                self._raw.close()
+                os.remove(self.save_path)
+            raise
+        self._worker = asyncio.ensure_future(self._transcribe_loop())
+
+    # ----- 입력 -----
+    def feed(self, data: bytes) -> None:
+        self.received_bytes += len(data)
+        if self.max_bytes is not None and self.received_bytes > self.max_bytes:
+            self._limit = f"Recording too large (max {self.max_bytes >> 20} MB)"
+        if self._limit is not None:
+            raise CaptureError(self._limit, status=413)
+        if self._raw is not None:
+            self._raw.write(data)           # 원본 녹음 보관 (로컬 디스크 append — 작은 조각이라 루프에서 직접)
+        self._decoder.feed(data)
+
+    def _on_pcm(self, x: np.ndarray) -> None:
+        if not x.size or self._limit is not None:
+            return
+        self.total_samples += x.size
+        if self.total_samples > self.max_samples:
+            self._limit = f"Recording too long (max {self.max_samples // SAMPLE_RATE} s)"
+            return
+        self._chunks.append(x)
+        self._pending.append(x)
+        self._pending_len += x.size
+        self._since_check += x.size
+        if self._since_check >= CHECK_EVERY_SEC * SAMPLE_RATE:
+            self._since_check = 0
+            self._maybe_cut(final=False)
+
+    def _maybe_cut(self, final: bool) -> None:
+        window = np.concatenate(self._pending) if self._pending else np.zeros(0, dtype=np.float32)
+        while window.size:
+            cut = find_cut(window)
+            if cut is None:
+                break
+            self._emit(window[:cut])
+            window = window[cut:]
+        if final and window.size:
+            self._emit(window)
+            window = window[:0]
+        self._pending = [window] if window.size else []
+        self._pending_len = window.size
+
+    def _emit(self, seg: np.ndarray) -> None:
+        start = self.offset / SAMPLE_RATE
+        self.offset += seg.size
+        has_voice = bool(voiced_mask(frame_energy_db(seg, SAMPLE_RATE)).any())
+        self._segq.put_nowait((self.segments, start, self.offset / SAMPLE_RATE, seg if has_voice else None))
+        self.segments += 1
+
+    # ----- 구간 전사 (순차) -----
+    async def _transcribe_loop(self) -> None:
+        while (item := await self._segq.get()) is not None:
+            idx, start, end, seg = item
+            text = ""
+            if seg is not None:
+                path = os.path.join(self.workdir, f"{self.uid}_seg{idx}.wav")
+                try:
+                    await run_in_threadpool(write_wav, path, seg)
+                    text = await run_in_threadpool(self._transcribe, path)
+                except RuntimeError as e:
+                    if "Empty transcription" not in str(e):
+                        raise
+                finally:
+                    if os.path.exists(path):
+                        os.remove(path)
+            self.texts.append(text.strip())
+            await self._on_partial({
+                "type": "partial", "segment": idx, "start_sec": round(start, 2), "end_sec": round(end, 2),
+                "text": text.strip(), "transcript": self.transcript,
+            })
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(t for t in self.texts if t)
+
+    # ----- 종료 -----
+    async def finish(self) -> np.ndarray:
+        """입력 끝 — 디코더를 비우고 마지막 구간까지 전사. 전체 PCM 반환."""
+        self._decoder.close()
+        await run_in_threadpool(self._decoder.join)
+        await asyncio.sleep(0)                  # 디코더 스레드가 남긴 call_soon_threadsafe 처리
+        if self._raw is not None:
+            self._raw.close()
+        self._maybe_cut(final=True)
+        self._segq.put_nowait(None)
+        await self._worker
+        samples = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+        if self.is_pcm:
+            await run_in_threadpool(write_wav, self.save_path, samples)
+        elif getattr(self._decoder, "error", None) is not None and not samples.size:
+            raise CaptureError(f"could not decode {self.mime}: {self._decoder.error}")
+        return samples
+
+    def abort(self) -> None:
+        """연결이 끊김/오류 — 디코더/전사 정리 (원본 파일은 discard 로). 여러 번 불러도 된다"""
+        self._decoder.close()
+        if self._raw is not None and not self._raw.closed:
+            self._raw.close()
+        self._worker.cancel()
+
+    def discard(self) -> None:
+        """응시 기록으로 남지 않은 녹음 — 원본과 파형 피크를 지운다 (아무도 참조하지 않아 GC 도 안 된다)"""
+        for path in (self.save_path, peaks_path(self.save_path)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
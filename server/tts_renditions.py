@@ -0,0 +1,343 @@
+# server/tts_renditions.py
+"""
+TTS 포맷 협상 + 마스터 1개에서 로컬 변환한 렌디션 캐시
+
+  - 업스트림 합성은 (model, voice, text) 당 한 번 — 고음질 마스터(TTS_MASTER_FORMAT, 기본 wav)
+  - 요청 포맷/비트레이트별 렌디션(opus/webm/aac/mp3)은 마스터를 PyAV 로 변환해 디스크에 캐시
+    → 같은 문항을 다른 기기/포맷으로 요청해도 업스트림 호출이 늘지 않는다
+  - 포맷: audio_format 파라미터 > Accept 헤더 (q 값 순) > 기본 mp3
+    비트레이트: bitrate 파라미터(kbps, 허용 단계로 맞춤) > Save-Data: on 이면 저대역 프리셋 > 기본
+  - 캐시에 없으면 마스터 합성 스트림을 받는 대로 변환해 흘려보낸다 (StreamingTranscoder)
+    → 첫 바이트 지연은 업스트림 첫 조각 + 인코더 지연 정도, 끝까지 받으면 마스터/렌디션 둘 다 저장
+  - 캐시 상한을 넘으면 오래 안 쓴 파일부터 지운다 — 메모리 LRU 색인 + 누적 바이트 (쓰기마다 디렉터리를 훑지 않음)
+    다른 워커가 쓴 파일은 RESCAN_SEC 마다 한 번 디스크를 다시 읽어 반영
+  - 적중 파일은 요청 전용 하드링크(checkout)로 내보낸다 → 응답 도중 다른 요청이 원본을 지워도 끝까지 전송
+  .env: TTS_CACHE_DIR=tts_cache  TTS_CACHE_MAX_MB=256  TTS_MASTER_FORMAT=wav
+"""
+from __future__ import annotations
+
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from stream_capture import BlockingPipe
+
+MASTER_FORMAT = os.getenv("TTS_MASTER_FORMAT", "wav")
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024)
+RESCAN_SEC = 300.0          # 다른 워커가 쓴 파일을 색인에 반영하는 주기
+LEASE_PREFIX = ".lease-"    # checkout 하드링크 — 점으로 시작해 색인/eviction 대상이 아니다
+LEASE_MAX_SEC = 3600.0      # 응답이 끝나지 못하고 남은 링크는 재스캔 때 정리
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    container: str              # PyAV(ffmpeg) muxer 이름
+    codec: str
+    media_type: str
+    ext: str
+
+
+FORMATS: Dict[str, AudioFormat] = {
+    "mp3": AudioFormat("mp3", "mp3", "libmp3lame", "audio/mpeg", ".mp3"),
+    "opus": AudioFormat("opus", "ogg", "libopus", "audio/ogg; codecs=opus", ".ogg"),
+    "webm": AudioFormat("webm", "webm", "libopus", "audio/webm; codecs=opus", ".webm"),
+    "aac": AudioFormat("aac", "adts", "aac", "audio/aac", ".aac"),
+    "wav": AudioFormat("wav", "wav", "pcm_s16le", "audio/wav", ".wav"),
+}
+
+# Accept 의 미디어 타입 → 포맷
+MEDIA_TYPES = {
+    "audio/mpeg": "mp3", "audio/mp3": "mp3",
+    "audio/ogg": "opus", "audio/opus": "opus", "application/ogg": "opus",
+    "audio/webm": "webm",
+    "audio/aac": "aac", "audio/aacp": "aac", "audio/mp4": "aac", "audio/x-m4a": "aac",
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav",
+}
+DEFAULT_FORMAT = "mp3"
+
+# 비트레이트(kbps) — 캐시 종류가 무한히 늘지 않도록 허용 단계로 맞춘다
+BITRATE_STEPS = (12, 16, 24, 32, 48, 64, 96, 128)
+DEFAULT_KBPS = {"mp3": 64, "opus": 32, "webm": 32, "aac": 48}
+SAVE_DATA_KBPS = {"mp3": 32, "opus": 16, "webm": 16, "aac": 24}   # Save-Data: on (모바일 저속망)
+
+
+class FormatError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# 협상
+# ---------------------------------------------------------
+def parse_accept(accept: Optional[str]) -> List[Tuple[str, float]]:
+    """Accept 헤더 → [(media_type, q)] q 내림차순 (같은 q 는 나온 순서)"""
+    out = []
+    for i, part in enumerate((accept or "").split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for f in fields[1:]:
+            if f.startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            out.append((fields[0].lower(), q, i))
+    out.sort(key=lambda t: (-t[1], t[2]))
+    return [(m, q) for m, q, _ in out]
+
+
+def negotiate(
+    audio_format: Optional[str],
+    bitrate: Optional[int],
+    accept: Optional[str],
+    save_data: bool = False,
+) -> Tuple[str, int]:
+    """→ (포맷 이름, kbps). 무손실(wav)은 비트레이트 개념이 없어 0"""
+    if audio_format:
+        fmt = audio_format.lower()
+        if fmt not in FORMATS:
+            raise FormatError(f"Unsupported audio_format: {audio_format} ({'|'.join(FORMATS)})")
+    else:
+        fmt = DEFAULT_FORMAT
+        for media, _ in parse_accept(accept):
+            if media in MEDIA_TYPES:
+                fmt = MEDIA_TYPES[media]
+                break
+            if media in ("*/*", "audio/*"):
+                break
+    if fmt not in DEFAULT_KBPS:
+        return fmt, 0
+    if bitrate:
+        kbps = min(BITRATE_STEPS, key=lambda s: (abs(s - bitrate), s))
+    else:
+        kbps = (SAVE_DATA_KBPS if save_data else DEFAULT_KBPS)[fmt]
+    return fmt, kbps
+
+
+# ---------------------------------------------------------
+# 변환 (PyAV — ffmpeg 라이브러리 내장, 외부 바이너리 불필요)
+# ---------------------------------------------------------
+def transcode(master: bytes, fmt: str, kbps: int) -> bytes:
+    """마스터 오디오 bytes → 모노 렌디션 bytes (블로킹 — 스레드풀에서 호출)"""
+    out_buf = io.BytesIO()
+    _transcode(io.BytesIO(master), out_buf, fmt, kbps)
+    return out_buf.getvalue()
+
+
+def _transcode(src_file: BinaryIO, dst_file: BinaryIO, fmt: str, kbps: int) -> None:
+    """src_file/dst_file 은 seek 없이 순서대로만 읽고 쓴다 (파이프/소켓에도 쓸 수 있게)"""
+    import av  # 무거운 import 는 실제 변환 때만
+
+    spec = FORMATS[fmt]
+    src = av.open(src_file, mode="r")
+    dst = av.open(dst_file, mode="w", format=spec.container)
+    try:
+        in_stream = src.streams.audio[0]
+        codec = av.codec.Codec(spec.codec, "w")
+        rates = codec.audio_rates or ()
+        rate = in_stream.rate if not rates or in_stream.rate in rates else min(
+            rates, key=lambda r: (r < in_stream.rate, abs(r - in_stream.rate))
+        )
+        out_stream = dst.add_stream(spec.codec, rate=rate, layout="mono")
+        if kbps:
+            out_stream.bit_rate = kbps * 1000
+        sample_fmt = out_stream.codec_context.format.name
+        resampler = av.AudioResampler(
+            format=sample_fmt, layout="mono", rate=rate,
+            frame_size=out_stream.codec_context.frame_size or None,
+        )
+        for frame in src.decode(in_stream):
+            frame.pts = None
+            for rf in resampler.resample(frame):
+                dst.mux(out_stream.encode(rf))
+        for rf in resampler.resample(None):
+            dst.mux(out_stream.encode(rf))
+        dst.mux(out_stream.encode(None))
+    finally:
+        dst.close()
+        src.close()
+
+
+class _Sink(io.RawIOBase):
+    def __init__(self, on_data: Callable[[bytes], None]):
+        self._on_data = on_data
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._on_data(bytes(b))
+        return len(b)
+
+
+class StreamingTranscoder:
+    """
+    마스터 조각을 feed() 하는 대로 변환 — 인코딩된 조각은 on_data 로 (변환 스레드에서 호출),
+    끝나면 on_data(None). 실패하면 error 에 남기고 역시 on_data(None).
+    """
+
+    def __init__(self, fmt: str, kbps: int, on_data: Callable[[Optional[bytes]], None]):
+        self._pipe = BlockingPipe()
+        self._on_data = on_data
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, args=(fmt, kbps), name="tts-transcode", daemon=True)
+        self._thread.start()
+
+    def _run(self, fmt: str, kbps: int) -> None:
+        try:
+            _transcode(self._pipe, _Sink(self._on_data), fmt, kbps)
+        except Exception as e:   # 중간에 끊긴 마스터 — 호출자가 error 를 보고 저장하지 않는다
+            self.error = e
+        finally:
+            self._on_data(None)
+
+    def feed(self, data: bytes) -> None:
+        self._pipe.write_chunk(data)
+
+    def close(self) -> None:
+        self._pipe.end()
+
+
+# ---------------------------------------------------------
+# 디스크 캐시
+# ---------------------------------------------------------
+class RenditionCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()   # 경로 → 크기, 오래 안 쓴 것부터
+        self._total = 0
+        self._scanned_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.transcodes = 0
+        self.evicted = 0
+
+    def master_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.master.{MASTER_FORMAT}"
+
+    def rendition_path(self, key: str, fmt: str, kbps: int) -> Path:
+        if fmt == MASTER_FORMAT:
+            return self.master_path(key)   # 마스터 그대로 — 변환 없음
+        return self.root / key[:2] / f"{key}.{fmt}-{kbps}k{FORMATS[fmt].ext}"
+
+    def lookup(self, path: Path) -> Optional[Path]:
+        """있으면 mtime 을 갱신(LRU — 다른 워커의 재스캔용)하고 경로 반환"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._lock:
+            if str(path) in self._index:
+                self._index.move_to_end(str(path))
+        return path
+
+    def checkout(self, path: Path) -> Optional[Path]:
+        """
+        적중 파일을 응답 전용 이름으로 고정 (하드링크) — release() 전까지는 eviction 이
+        원본을 지워도 내용이 남는다. 없으면 None (miss)
+        """
+        if self.lookup(path) is None:
+            return None
+        lease = path.with_name(f"{LEASE_PREFIX}{uuid.uuid4().hex}{path.suffix}")
+        try:
+            os.link(path, lease)
+        except FileNotFoundError:
+            return None            # lookup 과 link 사이에 지워졌다
+        except OSError:
+            return path            # 하드링크를 못 쓰는 파일시스템 — 예전처럼 원본 경로로
+        return lease
+
+    def release(self, lease: Path) -> None:
+        if lease.name.startswith(LEASE_PREFIX):
+            try:
+                os.remove(lease)
+            except FileNotFoundError:
+                pass
+
+    def write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)   # 원자적 — 읽는 쪽은 완성된 파일만 본다
+        self._added(path, len(data))
+
+    def render(self, key: str, fmt: str, kbps: int) -> Path:
+        """
+        디스크의 마스터로 렌디션 파일을 만들어 경로 반환 (블로킹).
+        마스터가 없으면 FileNotFoundError → 호출자가 다시 합성.
+        """
+        mpath = self.master_path(key)
+        master = mpath.read_bytes()
+        out = self.rendition_path(key, fmt, kbps)
+        if out != mpath and not out.exists():
+            self.write(out, transcode(master, fmt, kbps))
+            self.transcodes += 1
+        return out
+
+    def _files(self) -> Iterable[os.DirEntry]:
+        if not self.root.exists():
+            return
+        for sub in os.scandir(self.root):
+            if sub.is_dir():
+                yield from (e for e in os.scandir(sub.path) if e.is_file())
+
+    def _rescan(self) -> None:
+        """디스크 전체를 mtime 순으로 다시 색인 (잠금 안에서, RESCAN_SEC 에 한 번)"""
+        now = time.time()
+        files = []
+        for e in self._files():
+            try:
+                st = e.stat()
+            except FileNotFoundError:
+                continue
+            if e.name.startswith(LEASE_PREFIX):
+                if now - st.st_mtime > LEASE_MAX_SEC:
+                    self.release(Path(e.path))
+            elif not e.name.startswith("."):
+                files.append((st.st_mtime, e.path, st.st_size))
+        files.sort()
+        self._index = OrderedDict((path, size) for _, path, size in files)
+        self._total = sum(self._index.values())
+        self._scanned_at = time.monotonic()
+
+    def _added(self, path: Path, size: int) -> None:
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._scanned_at is None or time.monotonic() - self._scanned_at > RESCAN_SEC:
+                self._rescan()          # 방금 쓴 파일도 여기서 잡힌다
+            else:
+                self._total += size - self._index.pop(str(path), 0)
+                self._index[str(path)] = size
+            if self._total <= self.max_bytes:
+                return
+            # 여유를 두고 멈춰 매 쓰기마다 지우지 않게
+            while self._index and self._total > self.max_bytes * 0.9:
+                victim, size = self._index.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    continue
+                self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "dir": str(self.root), "hits": self.hits, "misses": self.misses,
+            "transcodes": self.transcodes, "evicted": self.evicted,
+            "indexed_files": len(self._index), "indexed_mb": round(self._total / 1024 / 1024, 2),
+        }
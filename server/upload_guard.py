@@ -0,0 +1,210 @@
+# server/upload_guard.py
+"""
+업로드 수신 역압 (본문을 읽기 전에 거절)
+
+  FastAPI 는 핸들러가 불리기 전에 multipart 본문을 끝까지 읽어 임시 파일에 쓴다.
+  그래서 /upload 안의 입장 제어(admission.py)는 '이미 디스크에 받은 뒤' 에야 동작한다.
+  이 미들웨어는 ASGI 단계에서 헤더만 보고 먼저 판단한다.
+    1) 길이를 모르는 본문(Transfer-Encoding: chunked) → 411, UPLOAD_MAX_MB 초과 → 413
+       (/upload/sessions 의 조각 PUT 도 같은 경로 접두어라 함께 제한된다)
+    2) 디스크 여유 공간 - 이번 본문 < UPLOAD_MIN_FREE_MB → 503 + Retry-After
+    3) 수신/처리 중 업로드 수(UPLOAD_MAX_INFLIGHT) 또는 바이트(UPLOAD_MAX_INFLIGHT_MB) 초과
+       → 대기열(UPLOAD_MAX_WAITING)에서 순서대로 기다림, 대기열도 차면 즉시 503 + Retry-After
+       (대기 중에는 본문을 읽지 않으므로 디스크/메모리를 쓰지 않는다)
+  Retry-After = 최근 업로드 처리 시간(EWMA) × 앞선 대기 수 / 동시 처리 수
+  게이지: /health 의 upload_guard (in_flight, in_flight_bytes, waiting, 거절 사유별 횟수, 디스크 여유)
+  .env: UPLOAD_MAX_MB=25  UPLOAD_MIN_FREE_MB=512  UPLOAD_MAX_INFLIGHT=16  UPLOAD_MAX_INFLIGHT_MB=256
+        UPLOAD_MAX_WAITING=32  UPLOAD_MAX_QUEUE_WAIT_SEC=10  UPLOAD_GUARD_PATHS=/upload
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+import shutil
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+MB = 1024 * 1024
+MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "25")) * MB)          # OpenAI 전사 파일 한도와 같게
+MIN_FREE_BYTES = int(float(os.getenv("UPLOAD_MIN_FREE_MB", "512")) * MB)
+MAX_INFLIGHT = int(os.getenv("UPLOAD_MAX_INFLIGHT", "16"))
+MAX_INFLIGHT_BYTES = int(float(os.getenv("UPLOAD_MAX_INFLIGHT_MB", "256")) * MB)
+MAX_WAITING = int(os.getenv("UPLOAD_MAX_WAITING", "32"))
+MAX_QUEUE_WAIT_SEC = float(os.getenv("UPLOAD_MAX_QUEUE_WAIT_SEC", "10"))
+GUARD_PATHS = tuple(p for p in os.getenv("UPLOAD_GUARD_PATHS", "/upload").split(",") if p)
+UPLOAD_DIR = "uploads"
+DISK_CHECK_SEC = 1.0     # statvfs 결과 재사용 간격
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class UploadGuard:
+    """이벤트 루프(워커 프로세스) 하나 안에서만 쓰는 카운터 — 락 불필요"""
+
+    def __init__(
+        self,
+        max_inflight: int = MAX_INFLIGHT,
+        max_inflight_bytes: int = MAX_INFLIGHT_BYTES,
+        max_waiting: int = MAX_WAITING,
+        max_bytes: int = MAX_BYTES,
+        min_free_bytes: int = MIN_FREE_BYTES,
+        upload_dir: str = UPLOAD_DIR,
+    ):
+        self.max_inflight = max_inflight
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_waiting = max_waiting
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.upload_dir = upload_dir
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self._waiters: Deque[Tuple[int, "asyncio.Future[None]"]] = deque()
+        self._disk: Tuple[float, int] = (0.0, 0)     # (확인 시각, 여유 바이트)
+        self._ewma_sec = 5.0                          # 업로드 1건 처리 시간 추정
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"too_large": 0, "no_length": 0, "disk": 0, "busy": 0, "timeout": 0}
+
+    # ----- 디스크 -----
+    def free_bytes(self) -> int:
+        now = time.monotonic()
+        if now - self._disk[0] >= DISK_CHECK_SEC:
+            path = self.upload_dir if os.path.isdir(self.upload_dir) else "."
+            self._disk = (now, shutil.disk_usage(path).free)
+        return self._disk[1]
+
+    def check_disk(self, incoming: int = 0) -> None:
+        """여유 공간이 워터마크 아래로 떨어지면 503 (/ws/capture 시작 때도 쓴다)"""
+        if self.free_bytes() - incoming - self.in_flight_bytes < self.min_free_bytes:
+            self.rejected["disk"] += 1
+            raise Rejected(503, "Server storage is nearly full, try again later", retry_after=60)
+
+    # ----- 입장 -----
+    def _fits(self, size: int) -> bool:
+        if self.in_flight >= self.max_inflight:
+            return False
+        # 바이트 상한은 하나도 처리 중이 아닐 때는 무시 (큰 파일 하나가 영원히 못 들어오는 일 방지)
+        return self.in_flight == 0 or self.in_flight_bytes + size <= self.max_inflight_bytes
+
+    def retry_after(self) -> int:
+        ahead = len(self._waiters) + 1
+        return max(1, math.ceil(self._ewma_sec * ahead / max(1, self.max_inflight)))
+
+    async def acquire(self, size: Optional[int]) -> None:
+        if size is None:
+            self.rejected["no_length"] += 1
+            raise Rejected(411, "Content-Length required")
+        if size > self.max_bytes:
+            self.rejected["too_large"] += 1
+            raise Rejected(413, f"Upload too large (max {self.max_bytes // MB} MB)")
+        self.check_disk(size)
+
+        if not self._waiters and self._fits(size):
+            self._take(size)
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected["busy"] += 1
+            raise Rejected(503, "Too many uploads in progress", retry_after=self.retry_after())
+
+        fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        entry = (size, fut)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), MAX_QUEUE_WAIT_SEC)
+        except asyncio.TimeoutError:
+            if fut.done():          # 시간 초과와 동시에 입장 — 슬롯은 이미 잡혔다
+                return
+            self._waiters.remove(entry)
+            self.rejected["timeout"] += 1
+            raise Rejected(503, "Upload queue wait timed out", retry_after=self.retry_after())
+        except asyncio.CancelledError:
+            if fut.done():
+                self.release(size, 0.0)
+            else:
+                self._waiters.remove(entry)
+            raise
+
+    def _take(self, size: int) -> None:
+        self.in_flight += 1
+        self.in_flight_bytes += size
+        self.admitted += 1
+
+    def release(self, size: int, elapsed: float) -> None:
+        self.in_flight -= 1
+        self.in_flight_bytes -= size
+        if elapsed > 0:
+            self._ewma_sec = 0.8 * self._ewma_sec + 0.2 * elapsed
+        # 앞에서부터 들어갈 수 있는 만큼 깨운다 (FIFO — 큰 업로드가 뒤에서 굶지 않게 맨 앞이 안 맞으면 멈춤)
+        while self._waiters and self._fits(self._waiters[0][0]):
+            size, fut = self._waiters.popleft()
+            self._take(size)
+            fut.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "in_flight_bytes": self.in_flight_bytes,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "free_disk_mb": self.free_bytes() // MB,
+            "avg_upload_sec": round(self._ewma_sec, 2),
+        }
+
+
+guard = UploadGuard()
+
+
+def _content_length(scope) -> Optional[int]:
+    """Content-Length → 크기. 본문 길이를 미리 알 수 없으면(chunked) None, 본문이 없으면 0"""
+    chunked = False
+    for k, v in scope["headers"]:
+        if k == b"content-length":
+            try:
+                return int(v)
+            except ValueError:
+                return None
+        if k == b"transfer-encoding":
+            chunked = True
+    return None if chunked else 0
+
+
+class UploadGuardMiddleware:
+    """GUARD_PATHS 의 POST/PUT 만 (이어받기 조각 포함) — 나머지 요청은 경로 비교 한 번으로 통과"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT") or not scope["path"].startswith(GUARD_PATHS):
+            return await self.app(scope, receive, send)
+
+        size = _content_length(scope)
+        try:
+            await guard.acquire(size)
+        except Rejected as e:
+            return await _reject(send, e)
+        t0 = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            guard.release(size, time.monotonic() - t0)
+
+
+async def _reject(send, e: Rejected) -> None:
+    """본문을 읽지 않고 응답 — 연결은 서버(uvicorn)가 닫는다"""
+    body = json.dumps({"detail": e.detail}).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+               (b"connection", b"close")]
+    if e.retry_after is not None:
+        headers.append((b"retry-after", str(int(e.retry_after)).encode()))
+    await send({"type": "http.response.start", "status": e.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
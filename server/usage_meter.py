@@ -0,0 +1,355 @@
+# server/usage_meter.py
+"""
+업스트림 AI 호출 사용량/비용 집계 (전사 / 분석 / 음성합성)
+
+  - 호출 시도마다 1건: 종류, 모델, 엔드포인트, 사용자, 지연, 성공 여부,
+    토큰(input/cached/output), STT 초, TTS 글자 수 → 단가표로 추정 비용(USD)
+  - 엔드포인트/사용자는 contextvar — UsageScopeMiddleware 가 요청마다 채우고
+    ai_resilience 가 호출 스레드(헤지 포함)로 넘겨준다
+  - 기록은 절대 요청 경로를 막지 않는다: 큐에 넣기만 (가득 차면 버리고 dropped 로 센다)
+    백그라운드 스레드가 USAGE_FLUSH_SEC 마다 묶어서 (일, 사용자, 엔드포인트, 종류, 모델) 단위로
+    미리 합산한 뒤 SQLite 에 UPSERT → 쓰기 횟수는 호출 수가 아니라 조합 수에 비례
+  - 조회: GET /admin/usage (모델별/엔드포인트별), GET /admin/usage/users (사용자별 일 합계),
+          GET /api/usage/me (내 일 합계)   — /admin/* 은 ADMIN_TOKEN (admin_auth.py)
+  .env: USAGE_DB_PATH=data/usage.sqlite3  USAGE_FLUSH_SEC=2  USAGE_MAX_PENDING=10000
+        USAGE_PRICES='{"gpt-4.1-mini": {"input": 0.4, "cached": 0.1, "output": 1.6}}'  (USD / 1M, 기본값 덮어쓰기)
+"""
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+
+from admin_auth import require_admin
+from admission import user_key
+from history_store import SQLiteStore
+from progress_rollup import TZ
+
+FLUSH_SEC = float(os.getenv("USAGE_FLUSH_SEC", "2"))
+MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "10000"))
+
+# 단가 (USD) — 공개 단가 기준 추정치. 토큰은 1M 당, audio_min 은 입력 오디오 1분당, chars 는 1M 글자당
+PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4.1-mini": {"input": 0.40, "cached": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached": 0.50, "output": 8.00},
+    "gpt-4.1-nano": {"input": 0.10, "cached": 0.025, "output": 0.40},
+    "gpt-4o-mini": {"input": 0.15, "cached": 0.075, "output": 0.60},
+    "gpt-4o-mini-transcribe": {"audio_min": 0.003},
+    "gpt-4o-transcribe": {"audio_min": 0.006},
+    "whisper-1": {"audio_min": 0.006},
+    "gpt-4o-mini-tts": {"chars": 15.0},
+    "tts-1": {"chars": 15.0},
+}
+PRICES.update(json.loads(os.getenv("USAGE_PRICES", "") or "{}"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day           TEXT    NOT NULL,           -- 로컬 날짜 YYYY-MM-DD (HISTORY_TZ_OFFSET_MIN)
+    user_id       TEXT    NOT NULL,
+    endpoint      TEXT    NOT NULL,
+    kind          TEXT    NOT NULL,           -- stt | analyze | tts
+    model         TEXT    NOT NULL,
+    calls         INTEGER NOT NULL DEFAULT 0,
+    errors        INTEGER NOT NULL DEFAULT 0,
+    input_tokens  INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    audio_sec     REAL    NOT NULL DEFAULT 0,
+    chars         INTEGER NOT NULL DEFAULT 0,
+    latency_ms    REAL    NOT NULL DEFAULT 0, -- 합계 (평균 = latency_ms / calls)
+    max_latency_ms REAL   NOT NULL DEFAULT 0,
+    cost_usd      REAL    NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, endpoint, kind, model)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_usage_user_day ON usage_daily (user_id, day);
+"""
+
+_SUMS = ("calls", "errors", "input_tokens", "cached_tokens", "output_tokens", "audio_sec", "chars",
+         "latency_ms", "cost_usd")
+
+
+# ---------------------------------------------------------
+# 호출 범위 (contextvar)
+# ---------------------------------------------------------
+_scope: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("usage_scope", default=("-", "-"))
+_call: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("usage_call", default=None)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def bind(endpoint: Optional[str] = None, user: Optional[str] = None) -> None:
+    """현재 요청(태스크 컨텍스트)의 엔드포인트/사용자 지정 — 주지 않은 쪽은 그대로"""
+    cur_endpoint, cur_user = _scope.get()
+    _scope.set((endpoint or cur_endpoint, user or cur_user))
+
+
+class UsageScopeMiddleware:
+    """요청마다 (METHOD 경로, 사용자) 를 contextvar 에 — 경로의 숫자 구간은 {id} 로 묶는다"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            path = _ID_SEGMENT.sub("/{id}", scope["path"])
+            method = scope.get("method", "WS")
+            # Request 는 http 스코프 전용 — /ws/capture 도 지나가므로 공통 부모로
+            _scope.set((f"{method} {path}", user_key(HTTPConnection(scope))))
+        await self.app(scope, receive, send)
+
+
+@contextmanager
+def metered(kind: str, model: str, backend: str) -> Iterator[None]:
+    """
+    업스트림 호출 시도 1건을 감싼다 (호출 스레드에서). 구현체는 안에서 note() 로 사용량을 채운다.
+    예외는 그대로 던지고 errors 로만 센다.
+    """
+    endpoint, user = _scope.get()
+    call: Dict[str, Any] = {"kind": kind, "model": model, "backend": backend, "endpoint": endpoint, "user": user}
+    token = _call.set(call)
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        _call.reset(token)
+        call["latency_ms"] = (time.perf_counter() - t0) * 1000.0
+        call["ok"] = ok
+        call["ts"] = int(time.time() * 1000)
+        meter.record(call)
+
+
+def note(**usage: Any) -> None:
+    """metered() 안에서 — input_tokens/cached_tokens/output_tokens/audio_sec/chars"""
+    call = _call.get()
+    if call is not None:
+        call.update({k: v for k, v in usage.items() if v is not None})
+
+
+def usage_field(obj: Any, *path: str) -> Any:
+    """SDK 객체/dict 어느 쪽이든 중첩 필드 꺼내기 (없으면 None)"""
+    for name in path:
+        if obj is None:
+            return None
+        obj = obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+    return obj
+
+
+def cost_usd(model: str, e: Dict[str, Any]) -> float:
+    p = PRICES.get(model)
+    if not p:
+        return 0.0
+    cached = e.get("cached_tokens", 0)
+    return (
+        (e.get("input_tokens", 0) - cached) * p.get("input", 0.0) / 1e6
+        + cached * p.get("cached", p.get("input", 0.0)) / 1e6
+        + e.get("output_tokens", 0) * p.get("output", 0.0) / 1e6
+        + e.get("audio_sec", 0.0) / 60.0 * p.get("audio_min", 0.0)
+        + e.get("chars", 0) * p.get("chars", 0.0) / 1e6
+    )
+
+
+# ---------------------------------------------------------
+# 저장소
+# ---------------------------------------------------------
+class UsageStore(SQLiteStore):
+    SCHEMA = SCHEMA
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany(
+                f"INSERT INTO usage_daily (day, user_id, endpoint, kind, model, {', '.join(_SUMS)}, max_latency_ms) "
+                f"VALUES (:day, :user_id, :endpoint, :kind, :model, {', '.join(':' + k for k in _SUMS)}, :max_latency_ms) "
+                "ON CONFLICT (day, user_id, endpoint, kind, model) DO UPDATE SET "
+                + ", ".join(f"{k} = {k} + excluded.{k}" for k in _SUMS)
+                + ", max_latency_ms = MAX(max_latency_ms, excluded.max_latency_ms)",
+                rows,
+            )
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+    def summary(self, since: str, group: str) -> List[Dict[str, Any]]:
+        """group: model | endpoint — since 이후 합계"""
+        cols = {"model": "kind, model", "endpoint": "endpoint, kind, model"}[group]
+        rows = self.conn().execute(
+            f"SELECT {cols}, {', '.join(f'SUM({k}) AS {k}' for k in _SUMS)}, MAX(max_latency_ms) AS max_latency_ms "
+            f"FROM usage_daily WHERE day >= ? GROUP BY {cols} ORDER BY cost_usd DESC, calls DESC",
+            (since,),
+        ).fetchall()
+        return [_with_avg(dict(r)) for r in rows]
+
+    def user_daily(self, since: str, user_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        where, args = "day >= ?", [since]
+        if user_id:
+            where += " AND user_id = ?"
+            args.append(user_id)
+        rows = self.conn().execute(
+            f"SELECT day, user_id, {', '.join(f'SUM({k}) AS {k}' for k in _SUMS)} FROM usage_daily "
+            f"WHERE {where} GROUP BY day, user_id ORDER BY day DESC, cost_usd DESC LIMIT ?",
+            (*args, limit),
+        ).fetchall()
+        return [_with_avg(dict(r)) for r in rows]
+
+
+def _with_avg(r: Dict[str, Any]) -> Dict[str, Any]:
+    r["avg_latency_ms"] = round(r["latency_ms"] / r["calls"], 1) if r["calls"] else None
+    r["cost_usd"] = round(r["cost_usd"], 6)
+    r["audio_sec"] = round(r["audio_sec"], 1)
+    if "max_latency_ms" in r:
+        r["max_latency_ms"] = round(r["max_latency_ms"], 1)
+    del r["latency_ms"]
+    return r
+
+
+# ---------------------------------------------------------
+# 비동기 기록기
+# ---------------------------------------------------------
+class UsageMeter:
+    def __init__(self, path: Optional[str] = None, flush_sec: float = FLUSH_SEC, max_pending: int = MAX_PENDING):
+        self.path = path
+        self.flush_sec = flush_sec
+        self.max_pending = max_pending
+        self._q: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        self._store: Optional[UsageStore] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+
+    @property
+    def store(self) -> UsageStore:
+        if self._store is None:
+            self._store = UsageStore(self.path or os.getenv("USAGE_DB_PATH", "data/usage.sqlite3"))
+        return self._store
+
+    def record(self, event: Dict[str, Any]) -> None:
+        """요청 경로에서 호출 — 큐에 넣기만 한다 (블로킹/예외 없음)"""
+        if self._q.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._q.put(event)
+        self.recorded += 1
+        if self._pid != os.getpid():
+            self._start()
+
+    def _start(self) -> None:
+        # fork 된 워커는 부모의 스레드를 물려받지 않으므로 프로세스마다 한 번
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_sec)
+            self.flush()
+
+    def flush(self) -> int:
+        """쌓인 이벤트를 (일, 사용자, 엔드포인트, 종류, 모델) 로 합산해 한 트랜잭션에 저장"""
+        with self._flush_lock:
+            rows: Dict[Tuple[str, str, str, str, str], Dict[str, Any]] = {}
+            n = 0
+            while True:
+                try:
+                    e = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                n += 1
+                day = datetime.fromtimestamp(e["ts"] / 1000, TZ).date().isoformat()
+                key = (day, e["user"], e["endpoint"], e["kind"], e["model"])
+                r = rows.get(key)
+                if r is None:
+                    r = rows[key] = dict(zip(("day", "user_id", "endpoint", "kind", "model"), key),
+                                         **{k: 0 for k in _SUMS}, max_latency_ms=0.0)
+                r["calls"] += 1
+                r["errors"] += 0 if e["ok"] else 1
+                for k in ("input_tokens", "cached_tokens", "output_tokens", "audio_sec", "chars"):
+                    r[k] += e.get(k) or 0
+                r["latency_ms"] += e["latency_ms"]
+                r["max_latency_ms"] = max(r["max_latency_ms"], e["latency_ms"])
+                r["cost_usd"] += cost_usd(e["model"], e)
+            if not rows:
+                return 0
+            try:
+                self.store.add(list(rows.values()))
+                self.flushed_rows += len(rows)
+            except Exception as ex:   # 집계 실패가 서비스에 영향 주지 않게 — 이번 묶음은 버린다
+                self.flush_errors += 1
+                print("USAGE FLUSH FAILED:", ex)
+            return n
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded, "dropped": self.dropped, "pending": self._q.qsize(),
+            "flushed_rows": self.flushed_rows, "flush_errors": self.flush_errors,
+        }
+
+
+meter = UsageMeter()
+atexit.register(meter.flush)
+
+
+# ---------------------------------------------------------
+# 조회 API
+# ---------------------------------------------------------
+router = APIRouter(tags=["usage"])
+
+
+def _since(days: int) -> str:
+    return (datetime.now(TZ).date() - timedelta(days=days - 1)).isoformat()
+
+
+@router.get("/admin/usage")
+async def usage_summary(request: Request, days: int = Query(7, ge=1, le=365)):
+    """모델별 / 엔드포인트별 합계 (최근 days 일)"""
+    require_admin(request)
+    await run_in_threadpool(meter.flush)   # 방금 호출분까지 보이게
+    since = _since(days)
+    by_model, by_endpoint = await run_in_threadpool(
+        lambda: (meter.store.summary(since, "model"), meter.store.summary(since, "endpoint"))
+    )
+    return {"since": since, "by_model": by_model, "by_endpoint": by_endpoint, "meter": meter.stats()}
+
+
+@router.get("/admin/usage/users")
+async def usage_users(
+    request: Request,
+    days: int = Query(7, ge=1, le=365),
+    user_id: Optional[str] = Query(None, description="u:<id> 또는 ip:<addr>"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """사용자별 일 합계 (비용 큰 순)"""
+    require_admin(request)
+    await run_in_threadpool(meter.flush)
+    since = _since(days)
+    return {"since": since, "items": await run_in_threadpool(meter.store.user_daily, since, user_id, limit)}
+
+
+@router.get("/api/usage/me")
+async def usage_me(request: Request, days: int = Query(30, ge=1, le=365)):
+    await run_in_threadpool(meter.flush)
+    since = _since(days)
+    return {"since": since, "items": await run_in_threadpool(meter.store.user_daily, since, user_key(request), 366)}
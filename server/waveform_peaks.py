@@ -0,0 +1,144 @@
+# server/waveform_peaks.py
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from audio_features import AudioDecodeError, load_audio
+
+# ---------------------------------------------------------
+# 재생(Replay) 화면용 파형 피크 — 녹음 옆에 한 번 만들어 두는 작은 JSON
+#   - 녹음 전체를 WAVEFORM_BUCKETS 개 구간으로 나눠 구간별 min/max
+#     (꽉 찬 구간들은 샘플 배열의 reshape 뷰 — 복사 없음, 남는 끝 구간만 따로)
+#   - 8bit 정수(-128..127)로 양자화 → 3분 답변도 수 KB. 브라우저는 디코딩 없이 바로 그린다
+#   - 형식은 audiowaveform JSON(v2)과 같다 → peaks.js / wavesurfer 에 그대로 넣을 수 있음
+#       {"version":2, "channels":1, "sample_rate", "samples_per_pixel", "bits":8, "length", "data":[min,max,...]}
+#   - 업로드 후 백그라운드에서 만든다 (PeakJobs) — 유창성 분석이 디코딩한 샘플을 그대로 넘겨 추가 디코딩 없음
+#     예전 녹음처럼 파일이 없으면 처음 요청이 작업을 걸고 202 (조회 요청이 직접 디코딩하지 않는다)
+# .env: WAVEFORM_BUCKETS=800
+# ---------------------------------------------------------
+
+BUCKETS = int(os.getenv("WAVEFORM_BUCKETS", "800"))
+PEAKS_SUFFIX = ".peaks.json"
+PEAKS_VERSION = 2
+
+
+def peaks_path(audio_path: str) -> str:
+    """uploads/ab12cd34.webm → uploads/ab12cd34.peaks.json"""
+    return os.path.splitext(audio_path)[0] + PEAKS_SUFFIX
+
+
+def compute_peaks(samples: np.ndarray, sr: int, buckets: int = BUCKETS) -> Dict[str, Any]:
+    """mono float32 [-1, 1] → 구간별 (min, max) 를 번갈아 담은 8bit 피크"""
+    n = int(samples.size)
+    per = max(1, math.ceil(n / buckets))
+    length = max(1, math.ceil(n / per))
+    full = n // per
+    mm = np.zeros((length, 2), dtype=np.float32)   # 빈 녹음은 (0, 0) 한 구간
+    if full:
+        frames = samples[: full * per].reshape(full, per)
+        mm[:full, 0] = frames.min(axis=1)
+        mm[:full, 1] = frames.max(axis=1)
+    if n > full * per:
+        tail = samples[full * per:]
+        mm[full] = tail.min(), tail.max()
+    q = np.clip(np.round(mm * 127.0), -128, 127).astype(np.int8)
+    return {
+        "version": PEAKS_VERSION,
+        "channels": 1,
+        "sample_rate": sr,
+        "samples_per_pixel": per,
+        "bits": 8,
+        "length": length,
+        "duration_sec": round(n / sr, 3) if sr else 0.0,
+        "data": q.ravel().tolist(),
+    }
+
+
+def write_peaks(audio_path: str, samples: np.ndarray, sr: int) -> str:
+    path = peaks_path(audio_path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(compute_peaks(samples, sr), f, separators=(",", ":"))
+    os.replace(tmp, path)     # 읽는 쪽은 항상 완성된 파일만 본다
+    return path
+
+
+def load_peaks(audio_path: str) -> Optional[str]:
+    """캐시된 피크 파일 경로 (없거나 녹음보다 오래됐으면 None)"""
+    path = peaks_path(audio_path)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(audio_path).st_mtime_ns:
+            return path
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def ensure_peaks(audio_path: str) -> str:
+    """캐시가 없으면 디코딩해서 만든다 (블로킹 — 스레드풀에서). AudioDecodeError 는 호출자가 처리"""
+    path = load_peaks(audio_path)
+    if path is not None:
+        return path
+    samples, sr = load_audio(audio_path)
+    return write_peaks(audio_path, samples, sr)
+
+
+class PeakJobs:
+    """
+    피크 생성 백그라운드 작업 (워커별) — 녹음당 1건만 돌고, 디코딩 불가 녹음은 기억해 두고 다시 걸지 않는다.
+    submit 은 이벤트 루프에서 호출.
+    """
+
+    def __init__(self, max_failed: int = 1024):
+        self._running: Dict[str, "asyncio.Future[str]"] = {}
+        self._failed: "OrderedDict[str, None]" = OrderedDict()
+        self._max_failed = max_failed
+        self.done = 0
+        self.errors = 0
+
+    def submit(self, audio_path: str, samples: Optional[np.ndarray] = None, sr: int = 0) -> None:
+        """samples 를 주면 (업로드 직후) 그걸로, 없으면 파일을 디코딩해서"""
+        if audio_path in self._running:
+            return
+        if samples is None:
+            job = run_in_threadpool(ensure_peaks, audio_path)
+        else:
+            job = run_in_threadpool(write_peaks, audio_path, samples, sr)
+        task = asyncio.ensure_future(job)
+        self._running[audio_path] = task
+        task.add_done_callback(lambda t, p=audio_path: self._finish(p, t))
+
+    def _finish(self, audio_path: str, task: "asyncio.Future[str]") -> None:
+        del self._running[audio_path]
+        if task.cancelled():
+            return
+        e = task.exception()
+        if e is None:
+            self.done += 1
+            return
+        self.errors += 1
+        print("WAVEFORM PEAKS SKIPPED:", e)
+        if isinstance(e, AudioDecodeError):    # 디스크 오류 등은 다음 요청 때 다시 시도
+            self._failed[audio_path] = None
+            while len(self._failed) > self._max_failed:
+                self._failed.popitem(last=False)
+
+    def pending(self, audio_path: str) -> bool:
+        return audio_path in self._running
+
+    def failed(self, audio_path: str) -> bool:
+        return audio_path in self._failed
+
+    def stats(self) -> dict:
+        return {"running": len(self._running), "done": self.done, "errors": self.errors}
+
+
+jobs = PeakJobs()